@@ -64,6 +64,9 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
         "HOST": os.getenv("HOST"),
         "PORT": os.getenv("PORT", default="5432"),
+        # Рассылки читают получателей через серверные курсоры; при работе через pgbouncer
+        # в режиме transaction их нужно отключить
+        "DISABLE_SERVER_SIDE_CURSORS": os.getenv("DISABLE_SERVER_SIDE_CURSORS", default="False") == "True",
     }
 }
 
@@ -100,6 +103,59 @@ EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 SERVER_EMAIL = EMAIL_HOST_USER
 
+# Отдельный SMTP-аккаунт для служебных писем (подтверждение почты, сброс пароля),
+# чтобы массовые рассылки не задерживали их и не расходовали лимиты их аккаунта
+TRANSACTIONAL_EMAIL_HOST = os.getenv("TRANSACTIONAL_EMAIL_HOST", default=EMAIL_HOST)
+TRANSACTIONAL_EMAIL_PORT = int(os.getenv("TRANSACTIONAL_EMAIL_PORT", default=str(EMAIL_PORT)))
+TRANSACTIONAL_EMAIL_USE_TLS = os.getenv("TRANSACTIONAL_EMAIL_USE_TLS", default=str(EMAIL_USE_TLS)) == "True"
+TRANSACTIONAL_EMAIL_USE_SSL = os.getenv("TRANSACTIONAL_EMAIL_USE_SSL", default=str(EMAIL_USE_SSL)) == "True"
+TRANSACTIONAL_EMAIL_HOST_USER = os.getenv("TRANSACTIONAL_EMAIL_HOST_USER", default=EMAIL_HOST_USER)
+TRANSACTIONAL_EMAIL_HOST_PASSWORD = os.getenv("TRANSACTIONAL_EMAIL_HOST_PASSWORD", default=EMAIL_HOST_PASSWORD)
+TRANSACTIONAL_EMAIL_TIMEOUT = float(os.getenv("TRANSACTIONAL_EMAIL_TIMEOUT", default="10"))
+TRANSACTIONAL_EMAIL_MAX_RETRIES = int(os.getenv("TRANSACTIONAL_EMAIL_MAX_RETRIES", default="5"))
+MAILING_OUTBOX_BATCH_SIZE = int(os.getenv("MAILING_OUTBOX_BATCH_SIZE", default="100"))
+MAILING_OUTBOX_POLL_INTERVAL = float(os.getenv("MAILING_OUTBOX_POLL_INTERVAL", default="5"))
+
+MAILING_BATCH_SIZE = int(os.getenv("MAILING_BATCH_SIZE", default="100"))
+MAILING_ATTEMPT_FLUSH_SIZE = int(os.getenv("MAILING_ATTEMPT_FLUSH_SIZE", default="500"))
+# Проверяется при добавлении попытки, а не по таймеру (см. mailing.recorder.AttemptRecorder)
+MAILING_ATTEMPT_FLUSH_INTERVAL = float(
+    os.getenv("MAILING_ATTEMPT_FLUSH_INTERVAL", default="5")
+)
+MAILING_ENGINE = os.getenv("MAILING_ENGINE", default="batch")
+MAILING_WORKERS = int(os.getenv("MAILING_WORKERS", default="8"))
+MAILING_MAX_CONNECTIONS_PER_HOST = int(
+    os.getenv("MAILING_MAX_CONNECTIONS_PER_HOST", default="4")
+)
+MAILING_QUEUE_SIZE = int(os.getenv("MAILING_QUEUE_SIZE", default="1000"))
+MAILING_ASYNC_CONCURRENCY = int(os.getenv("MAILING_ASYNC_CONCURRENCY", default="200"))
+# Больше 1 - письма без подстановок отправляются группам получателей одного домена
+MAILING_RCPT_BATCH_SIZE = int(os.getenv("MAILING_RCPT_BATCH_SIZE", default="1"))
+MAILING_CLAIM_SIZE = int(os.getenv("MAILING_CLAIM_SIZE", default="500"))
+MAILING_LEASE_SECONDS = int(os.getenv("MAILING_LEASE_SECONDS", default="300"))
+MAILING_MAX_ATTEMPTS = int(os.getenv("MAILING_MAX_ATTEMPTS", default="5"))
+MAILING_RETRY_BASE_DELAY = float(os.getenv("MAILING_RETRY_BASE_DELAY", default="60"))
+MAILING_RETRY_MAX_DELAY = float(os.getenv("MAILING_RETRY_MAX_DELAY", default="1800"))
+MAILING_STREAM_CHUNK_SIZE = int(os.getenv("MAILING_STREAM_CHUNK_SIZE", default="2000"))
+MAILING_TEMPLATE_CACHE_SIZE = int(os.getenv("MAILING_TEMPLATE_CACHE_SIZE", default="128"))
+MAILING_SITE_URL = os.getenv("MAILING_SITE_URL", default="http://127.0.0.1:8000")
+MAILING_SUPPRESSION_CAPACITY = int(os.getenv("MAILING_SUPPRESSION_CAPACITY", default="100000"))
+MAILING_SUPPRESSION_ERROR_RATE = float(
+    os.getenv("MAILING_SUPPRESSION_ERROR_RATE", default="0.001")
+)
+MAILING_DASHBOARD_CACHE_TIMEOUT = int(os.getenv("MAILING_DASHBOARD_CACHE_TIMEOUT", default="21600"))
+MAILING_DASHBOARD_LOCK_TIMEOUT = float(os.getenv("MAILING_DASHBOARD_LOCK_TIMEOUT", default="10"))
+MAILING_DASHBOARD_RECENT_ATTEMPTS = int(os.getenv("MAILING_DASHBOARD_RECENT_ATTEMPTS", default="20"))
+MAILING_DASHBOARD_GLOBAL_REFRESH_INTERVAL = float(
+    os.getenv("MAILING_DASHBOARD_GLOBAL_REFRESH_INTERVAL", default="60")
+)
+MAILING_ROLLUP_CHUNK_SIZE = int(os.getenv("MAILING_ROLLUP_CHUNK_SIZE", default="100000"))
+MAILING_ROLLUP_SETTLE_SECONDS = float(os.getenv("MAILING_ROLLUP_SETTLE_SECONDS", default="60"))
+MAILING_BREAKER_FAILURES = int(os.getenv("MAILING_BREAKER_FAILURES", default="5"))
+MAILING_BREAKER_ERROR_RATE = float(os.getenv("MAILING_BREAKER_ERROR_RATE", default="0.5"))
+MAILING_BREAKER_WINDOW = int(os.getenv("MAILING_BREAKER_WINDOW", default="100"))
+MAILING_BREAKER_RESET_TIMEOUT = float(os.getenv("MAILING_BREAKER_RESET_TIMEOUT", default="60"))
+
 
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "static"
@@ -125,6 +181,42 @@ CACHES = {
     }
 }
 
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", default="redis://127.0.0.1:6379/0")
+CELERY_RESULT_BACKEND = os.getenv(
+    "CELERY_RESULT_BACKEND", default="redis://127.0.0.1:6379/0"
+)
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Очереди задач: служебные письма обрабатывает отдельный воркер, массовые рассылки -
+# остальные воркеры, поэтому длинная рассылка не занимает всех исполнителей
+MAILING_TRANSACTIONAL_QUEUE = os.getenv("MAILING_TRANSACTIONAL_QUEUE", default="transactional")
+MAILING_BULK_QUEUE = os.getenv("MAILING_BULK_QUEUE", default="bulk")
+CELERY_TASK_DEFAULT_QUEUE = MAILING_BULK_QUEUE
+CELERY_TASK_ROUTES = {
+    "mailing.tasks.send_outbox": {"queue": MAILING_TRANSACTIONAL_QUEUE},
+}
+# Периодические задачи (celery beat). Запуски, которые воркеры не успели взять
+# до следующего, отбрасываются, чтобы задачи не копились за длинными рассылками
+CELERY_BEAT_SCHEDULE = {
+    "refresh-global-dashboard": {
+        "task": "mailing.tasks.refresh_global_dashboard",
+        "schedule": MAILING_DASHBOARD_GLOBAL_REFRESH_INTERVAL,
+        "options": {"expires": MAILING_DASHBOARD_GLOBAL_REFRESH_INTERVAL},
+    },
+}
+
+MAILING_CHUNK_SIZE = int(os.getenv("MAILING_CHUNK_SIZE", default="1000"))
+MAILING_SCHEDULER_POLL_INTERVAL = float(
+    os.getenv("MAILING_SCHEDULER_POLL_INTERVAL", default="1")
+)
+MAILING_SCHEDULER_REFRESH_INTERVAL = float(
+    os.getenv("MAILING_SCHEDULER_REFRESH_INTERVAL", default="60")
+)
+MAILING_SCHEDULER_HORIZON = float(os.getenv("MAILING_SCHEDULER_HORIZON", default="3600"))
+# Потоки run_scheduler, отправляющие рассылки без Celery
+MAILING_SCHEDULER_WORKERS = int(os.getenv("MAILING_SCHEDULER_WORKERS", default="4"))
+
 if "test" in sys.argv:
     DATABASES = {
         "default": {
@@ -132,3 +224,7 @@ if "test" in sys.argv:
             "NAME": BASE_DIR / "test_db.sqlite3",
         }
     }
+    CELERY_BROKER_URL = "memory://"
+    CELERY_RESULT_BACKEND = "cache+memory://"
+    CELERY_TASK_ALWAYS_EAGER = True
+    CELERY_TASK_EAGER_PROPAGATES = True
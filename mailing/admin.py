@@ -1,9 +1,20 @@
 from django.contrib import admin
-from .models import Mailing, Message, MailingAttempt, Recipient
+from .counters import delete_attempts
+from .models import (
+    Mailing,
+    Message,
+    MailingAttempt,
+    OutboxEmail,
+    Recipient,
+    RecipientDelivery,
+    SuppressedEmail,
+)
 
 admin.site.register(Recipient)
 admin.site.register(Message)
-admin.site.register(MailingAttempt)
+admin.site.register(RecipientDelivery)
+admin.site.register(SuppressedEmail)
+admin.site.register(OutboxEmail)
 
 
 @admin.register(Mailing)
@@ -11,3 +22,14 @@ class MailingAdmin(admin.ModelAdmin):
 
     list_display = ("id", "status", "message", "owner")
     search_fields = ("title", "content")
+
+
+@admin.register(MailingAttempt)
+class MailingAttemptAdmin(admin.ModelAdmin):
+    """Попытки удаляются через delete_attempts, чтобы счетчики главной страницы не расходились с данными."""
+
+    def delete_model(self, request, obj):
+        delete_attempts(MailingAttempt.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        delete_attempts(queryset)
@@ -10,3 +10,6 @@ class MailingConfig(AppConfig):
     """
     default_auto_field = "django.db.models.BigAutoField"
     name = "mailing"
+
+    def ready(self):
+        import mailing.signals  # noqa: F401
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+
+import aiosmtplib
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.mail.message import sanitize_address
+
+from mailing.models import MailingAttempt
+from mailing.recorder import AttemptRecorder
+from mailing.sending import BatchMailSender, DomainBatcher, SendResult, astream_envelopes, error_result
+from mailing.suppression import askip_suppressed, suppressed_response
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class AsyncMailEngine:
+    """
+    Отправка рассылки на asyncio.
+
+    Получатели читаются через асинхронный интерфейс ORM и передаются через ограниченную
+    очередь concurrency сопрограммам. Каждая сопрограмма держит собственное SMTP-соединение
+    aiosmtplib, поэтому на одном ядре одновременно выполняются сотни SMTP-транзакций.
+
+    Если rcpt_batch больше 1 и в письме нет подстановок, адресаты группируются по домену
+    (см. BatchMailSender) и каждой группе письмо передается одной транзакцией.
+    """
+
+    def __init__(
+        self,
+        concurrency=None,
+        queue_size=None,
+        batch_size=None,
+        hostname=None,
+        port=None,
+        use_tls=None,
+        start_tls=None,
+        username=None,
+        password=None,
+        timeout=None,
+        rcpt_batch=None,
+    ):
+        """
+        Параметры:
+        concurrency (int, optional): Количество одновременных SMTP-соединений (MAILING_ASYNC_CONCURRENCY).
+        queue_size (int, optional): Размер очереди между чтением из базы и отправкой (MAILING_QUEUE_SIZE).
+        batch_size (int, optional): Количество писем на одно SMTP-соединение (MAILING_BATCH_SIZE).
+        hostname, port, use_tls, start_tls, username, password, timeout (optional):
+            Параметры SMTP-сервера. По умолчанию берутся из настроек EMAIL_*.
+        rcpt_batch (int, optional): Максимальное количество получателей одной SMTP-транзакции
+            (MAILING_RCPT_BATCH_SIZE).
+        """
+        self.concurrency = concurrency or settings.MAILING_ASYNC_CONCURRENCY
+        self.queue_size = queue_size or settings.MAILING_QUEUE_SIZE
+        self.batch_size = batch_size or settings.MAILING_BATCH_SIZE
+        self.hostname = hostname or settings.EMAIL_HOST
+        self.port = port or settings.EMAIL_PORT
+        self.use_tls = settings.EMAIL_USE_SSL if use_tls is None else use_tls
+        self.start_tls = settings.EMAIL_USE_TLS if start_tls is None else start_tls
+        self.username = settings.EMAIL_HOST_USER if username is None else username
+        self.password = settings.EMAIL_HOST_PASSWORD if password is None else password
+        self.timeout = timeout or settings.EMAIL_TIMEOUT or 60
+        self.builder = BatchMailSender(batch_size=self.batch_size, rcpt_batch=rcpt_batch)
+
+    async def send(self, mailing, envelopes):
+        """
+        Отправляет письма рассылки переданным адресатам.
+
+        Параметры:
+        mailing (Mailing): Рассылка.
+        envelopes (AsyncIterable[Envelope]): Адресаты.
+
+        Возвращает:
+        AsyncIterator[SendResult]: Результаты отправки по каждому адресату.
+        """
+        # Письмо готовится заранее: сопрограммы не обращаются к базе и не кодируют его заново
+        prepared = await sync_to_async(self.builder.prepare_message)(mailing)
+        tasks = asyncio.Queue(maxsize=self.queue_size)
+        results = asyncio.Queue()
+
+        async def produce():
+            try:
+                if self.builder.rcpt_batch > 1 and prepared.template.is_static:
+                    batcher = DomainBatcher(self.builder.rcpt_batch, self.queue_size)
+                    async for envelope in envelopes:
+                        if (batch := batcher.add(envelope)) is not None:
+                            await tasks.put(batch)
+                    for batch in batcher.drain():
+                        await tasks.put(batch)
+                else:
+                    async for envelope in envelopes:
+                        await tasks.put([envelope])
+            finally:
+                for _ in range(self.concurrency):
+                    await tasks.put(_STOP)
+
+        async def run():
+            try:
+                await asyncio.gather(
+                    produce(),
+                    *(self._work(prepared, tasks, results) for _ in range(self.concurrency)),
+                )
+            finally:
+                await results.put(_STOP)
+
+        runner = asyncio.create_task(run())
+        try:
+            while (result := await results.get()) is not _STOP:
+                yield result
+            await runner
+        finally:
+            runner.cancel()
+
+    async def send_mailing(self, mailing, deliveries, breaker=None, worker_id=None):
+        """
+        Отправляет рассылку по состояниям доставки и записывает попытки в базу.
+
+        Параметры:
+        mailing (Mailing): Рассылка.
+        deliveries (QuerySet[RecipientDelivery]): Состояния доставки, по которым отправляются письма.
+        breaker (CircuitBreaker, optional): Выключатель SMTP-сервера.
+        worker_id (str, optional): Обработчик, захват получателей которого продлевается при записи попыток.
+
+        Возвращает:
+        bool: True, если отправку прервал выключатель.
+        """
+        async with AttemptRecorder(worker_id=worker_id) as recorder:
+
+            async def on_suppressed(envelope):
+                await recorder.aadd(
+                    mailing, MailingAttempt.FAILURE, suppressed_response(envelope.email), delivery_id=envelope.id
+                )
+
+            envelopes = askip_suppressed(astream_envelopes(deliveries), on_suppressed)
+            if breaker is not None:
+                envelopes = breaker.guard(envelopes)
+            async for result in self.send(mailing, envelopes):
+                if breaker is not None:
+                    breaker.record(result)
+                await recorder.aadd_result(mailing, result)
+        return getattr(envelopes, "stopped", False)
+
+    def _client(self):
+        return aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            use_tls=self.use_tls,
+            start_tls=self.start_tls,
+            username=self.username or None,
+            password=self.password or None,
+            timeout=self.timeout,
+        )
+
+    async def _work(self, prepared, tasks, results):
+        """Сопрограмма-отправитель: отправляет письма из очереди через собственное соединение."""
+        smtp = None
+        sent_in_batch = 0
+        try:
+            while (batch := await tasks.get()) is not _STOP:
+                try:
+                    if smtp is None:
+                        smtp = self._client()
+                        await smtp.connect()
+                        sent_in_batch = 0
+                    refused = await self._deliver(smtp, prepared, batch)
+                except Exception as e:
+                    await self._close(smtp)
+                    smtp = None
+                    for envelope in batch:
+                        await results.put(error_result(envelope, e))
+                    continue
+
+                sent_in_batch += 1
+                if sent_in_batch >= self.batch_size:
+                    await self._close(smtp)
+                    smtp = None
+                for envelope in batch:
+                    if envelope.email in refused:
+                        await results.put(error_result(envelope, refused[envelope.email]))
+                    else:
+                        await results.put(
+                            SendResult(envelope, MailingAttempt.SUCCESS, f"{envelope.email}: Успешно отправлено")
+                        )
+        finally:
+            await self._close(smtp)
+
+    @staticmethod
+    async def _deliver(smtp, prepared, batch):
+        """
+        Отправляет письмо группе адресатов.
+
+        Адреса приводятся к виду для SMTP так же, как в BatchMailSender (sanitize_address):
+        переводы строк отклоняются, а домены IDN кодируются в punycode.
+
+        Возвращает:
+        dict[str, Exception]: Ошибки по адресам, которые сервер не принял.
+        """
+        addresses = [sanitize_address(envelope.email, prepared.encoding) for envelope in batch]
+        if len(batch) == 1:
+            envelope = batch[0]
+            message = prepared.render(envelope.email, envelope.full_name, envelope.recipient_id)
+            await smtp.sendmail(prepared.envelope_from, addresses, message)
+            return {}
+        try:
+            errors, _ = await smtp.sendmail(prepared.envelope_from, addresses, prepared.render_shared())
+        except aiosmtplib.SMTPRecipientsRefused as e:
+            # Сервер не принял ни одного адреса группы
+            refused = {error.recipient: error for error in e.recipients}
+        else:
+            refused = {
+                address: aiosmtplib.SMTPRecipientRefused(response.code, response.message, address)
+                for address, response in errors.items()
+            }
+        return {envelope.email: refused[address] for envelope, address in zip(batch, addresses) if address in refused}
+
+    @staticmethod
+    async def _close(smtp):
+        """Закрывает соединение, не прерывая отправку из-за ошибок при закрытии."""
+        if smtp is None or not smtp.is_connected:
+            return
+        try:
+            await smtp.quit()
+        except Exception as e:
+            logger.warning(f"Ошибка при закрытии SMTP-соединения: {e}")
+            smtp.close()
@@ -0,0 +1,138 @@
+import logging
+import resource
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from mailing.counters import CounterDeltas
+from mailing.models import Mailing, Message, Recipient, SuppressedEmail
+from mailing.services import prepare_deliveries
+from users.models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+BENCH_OWNER_EMAIL = "mailing-bench@localhost"
+BENCH_DOMAIN = "bench.example"
+
+# Запросы, которые считаются записью в базу
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE")
+
+
+def seed_bench_mailing(count, domains=10, personalized=False, batch_size=5000):
+    """
+    Создает рассылку со случайными получателями для замера скорости отправки.
+
+    Адреса получателей вида <метка>-<номер>@domain<номер>.bench.example
+    равномерно распределены по domains доменам.
+
+    Параметры:
+    count (int): Количество получателей.
+    domains (int, optional): Количество доменов получателей.
+    personalized (bool, optional): Текст письма с подстановками.
+    batch_size (int, optional): Размер пачки при создании записей.
+
+    Возвращает:
+    tuple[Mailing, str]: Рассылка и метка адресов получателей.
+    """
+    token = uuid.uuid4().hex[:8]
+    owner, _ = CustomUser.objects.get_or_create(email=BENCH_OWNER_EMAIL)
+    text = "Здравствуйте, {{ full_name }}!\n\nТекст письма." if personalized else "Текст письма."
+    with transaction.atomic():
+        message = Message.objects.create(title=f"Замер {token}", message=text, owner=owner)
+        mailing = Mailing.objects.create(
+            first_send_at=timezone.now(),
+            finish_send_at=timezone.now() + timedelta(days=1),
+            status=Mailing.RUNNING,
+            owner=owner,
+            message=message,
+        )
+        through = Mailing.recipients.through
+        counters = CounterDeltas()
+        for start in range(0, count, batch_size):
+            recipients = Recipient.objects.bulk_create(
+                [
+                    Recipient(
+                        email=f"{token}-{i}@domain{i % domains}.{BENCH_DOMAIN}",
+                        full_name=f"Получатель {i}",
+                        owner=owner,
+                    )
+                    for i in range(start, min(start + batch_size, count))
+                ]
+            )
+            if recipients[0].pk is None:
+                # Базы без RETURNING не возвращают идентификаторы из bulk_create
+                recipients = Recipient.objects.filter(
+                    email__startswith=f"{token}-", mailing__isnull=True
+                ).order_by("id")
+            through.objects.bulk_create(
+                [through(mailing_id=mailing.pk, recipient_id=recipient.pk) for recipient in recipients]
+            )
+            # bulk_create не вызывает сигналов, учитывающих получателей в счетчиках
+            counters.add(owner.pk, "recipients", len(recipients))
+        counters.apply()
+    prepare_deliveries(mailing, restart=False, batch_size=batch_size)
+    logger.info(f"Создана рассылка {mailing.pk} для замера: получателей - {count}")
+    return mailing, token
+
+
+def delete_bench_mailing(mailing, token):
+    """
+    Удаляет рассылку замера вместе с ее получателями и подавленными адресами.
+
+    Параметры:
+    mailing (Mailing): Рассылка.
+    token (str): Метка адресов получателей.
+    """
+    message = mailing.message
+    mailing.delete()
+    message.delete()
+    Recipient.objects.filter(email__startswith=f"{token}-").delete()
+    SuppressedEmail.objects.filter(email__startswith=f"{token}-").delete()
+
+
+class WriteCounter:
+    """Счетчик запросов записи к базе (INSERT, UPDATE, DELETE) через execute_wrapper."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip()[:6].upper() in WRITE_STATEMENTS:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def count_writes(self):
+        """Считает запросы записи через соединение с базой текущего потока."""
+        with connection.execute_wrapper(self):
+            yield self
+
+
+def percentile(values, fraction):
+    """
+    Возвращает перцентиль выборки (ближайшее значение по рангу).
+
+    Параметры:
+    values (Sequence[float]): Значения.
+    fraction (float): Доля от 0 до 1, например 0.99.
+
+    Возвращает:
+    float | None: Перцентиль или None для пустой выборки.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def peak_rss_mb():
+    """
+    Возвращает пиковый объем резидентной памяти процесса.
+
+    Возвращает:
+    float: Пиковый RSS в мегабайтах (ru_maxrss в Linux - в килобайтах).
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
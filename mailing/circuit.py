@@ -0,0 +1,197 @@
+import logging
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель отправки через SMTP-сервер.
+
+    Выключатель размыкается, когда подряд накапливается failure_threshold сбоев сервера
+    или доля сбоев среди последних window результатов достигает error_rate. Сбоем считается
+    недоступность сервера (см. mailing.retry.is_outage_error), а не отказ в приеме
+    конкретного письма. Пока выключатель разомкнут, отправка через сервер не выполняется.
+    Через reset_timeout секунд выключатель пропускает одно пробное письмо (полуоткрытое
+    состояние): успех замыкает выключатель, сбой снова размыкает его.
+    """
+
+    def __init__(self, name, failure_threshold=None, error_rate=None, window=None, reset_timeout=None):
+        """
+        Параметры:
+        name (str): Имя выключателя (адрес SMTP-сервера) для журнала.
+        failure_threshold (int, optional): Количество сбоев подряд (MAILING_BREAKER_FAILURES).
+        error_rate (float, optional): Доля сбоев в окне (MAILING_BREAKER_ERROR_RATE).
+        window (int, optional): Размер окна результатов (MAILING_BREAKER_WINDOW).
+        reset_timeout (float, optional): Время до пробной отправки, в секундах
+            (MAILING_BREAKER_RESET_TIMEOUT).
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.MAILING_BREAKER_FAILURES
+        self.error_rate = error_rate or settings.MAILING_BREAKER_ERROR_RATE
+        self.window = window or settings.MAILING_BREAKER_WINDOW
+        self.reset_timeout = reset_timeout or settings.MAILING_BREAKER_RESET_TIMEOUT
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._results = deque(maxlen=self.window)
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        """Текущее состояние: CLOSED, OPEN или HALF_OPEN."""
+        with self._lock:
+            return self._current_state()
+
+    @property
+    def retry_at(self):
+        """
+        Время пробной отправки разомкнутого выключателя.
+
+        Возвращает:
+        datetime | None: Время пробной отправки или None, если выключатель замкнут.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return None
+            remaining = max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+            return timezone.now() + timedelta(seconds=remaining)
+
+    def allow(self):
+        """
+        Проверяет, можно ли отправить письмо через сервер.
+
+        В полуоткрытом состоянии разрешается одно пробное письмо до получения его результата.
+
+        Возвращает:
+        bool: True, если отправка разрешена.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                logger.info(f"SMTP-сервер {self.name}: пробная отправка")
+                return True
+            return False
+
+    def record(self, result):
+        """
+        Учитывает результат отправки.
+
+        Параметры:
+        result (SendResult): Результат отправки адресату.
+        """
+        if result.outage:
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def record_success(self):
+        """Учитывает ответ сервера: полуоткрытый выключатель замыкается."""
+        with self._lock:
+            self._results.append(False)
+            self._consecutive_failures = 0
+            # Письма, отправленные до размыкания, выключатель не замыкают
+            if self._state == HALF_OPEN:
+                logger.info(f"SMTP-сервер {self.name} снова доступен, отправка возобновлена")
+                self._state = CLOSED
+                self._probing = False
+                self._results.clear()
+
+    def record_failure(self):
+        """Учитывает сбой сервера: выключатель размыкается при превышении порогов."""
+        with self._lock:
+            self._results.append(True)
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._should_trip()):
+                self._open()
+
+    def guard(self, envelopes):
+        """
+        Пропускает адресатов, пока выключатель разрешает отправку.
+
+        Параметры:
+        envelopes (Iterable[Envelope] | AsyncIterable[Envelope]): Адресаты.
+
+        Возвращает:
+        GuardedEnvelopes: Адресаты; атрибут stopped показывает, была ли отправка прервана.
+        """
+        return GuardedEnvelopes(self, envelopes)
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def _should_trip(self):
+        if self._consecutive_failures >= self.failure_threshold:
+            return True
+        return len(self._results) == self.window and sum(self._results) >= self.error_rate * self.window
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probing = False
+        logger.warning(
+            f"SMTP-сервер {self.name} недоступен: отправка приостановлена на {self.reset_timeout:.0f} с"
+        )
+
+
+class GuardedEnvelopes:
+    """Адресаты, отправка которым прерывается, когда выключатель разомкнут."""
+
+    def __init__(self, breaker, envelopes):
+        self.breaker = breaker
+        self.envelopes = envelopes
+        self.stopped = False
+
+    def __iter__(self):
+        for envelope in self.envelopes:
+            if not self.breaker.allow():
+                self.stopped = True
+                return
+            yield envelope
+
+    async def __aiter__(self):
+        async for envelope in self.envelopes:
+            if not self.breaker.allow():
+                self.stopped = True
+                return
+            yield envelope
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(host, port):
+    """
+    Возвращает выключатель SMTP-сервера, общий для всех потоков процесса.
+
+    Параметры:
+    host (str): Адрес SMTP-сервера.
+    port (int): Порт SMTP-сервера.
+
+    Возвращает:
+    CircuitBreaker: Выключатель сервера.
+    """
+    name = f"{host}:{port}"
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
@@ -0,0 +1,221 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from mailing.dashboard import bump_dashboard_version
+from mailing.models import DashboardCounters, Mailing, MailingAttempt, Recipient
+
+# Поля счетчиков по статусам попыток и рассылок
+ATTEMPT_FIELDS = {
+    MailingAttempt.SUCCESS: "attempt_success",
+    MailingAttempt.FAILURE: "attempt_failure",
+    MailingAttempt.RETRY: "attempt_retry",
+}
+MAILING_FIELDS = {
+    Mailing.CREATED: "mailing_created",
+    Mailing.RUNNING: "mailing_running",
+    Mailing.COMPLETED: "mailing_completed",
+}
+
+
+class CounterDeltas:
+    """
+    Изменения счетчиков главной страницы по владельцам.
+
+    Изменения накапливаются в памяти и записываются apply() одним UPDATE ... SET поле = поле + n
+    на строку: общую и по строке на каждого владельца. Объекты без владельца учитываются
+    только в общей строке.
+    """
+
+    def __init__(self):
+        self._deltas = defaultdict(Counter)
+
+    def add(self, owner_id, field, amount=1):
+        """
+        Добавляет изменение счетчика.
+
+        Параметры:
+        owner_id (int | None): Идентификатор владельца объекта.
+        field (str): Поле счетчика (например, "attempt_success").
+        amount (int, optional): Изменение.
+        """
+        if field is not None and amount:
+            self._deltas[owner_id][field] += amount
+
+    def add_mailing_status(self, owner_id, old_status, new_status):
+        """
+        Учитывает смену статуса рассылки.
+
+        Параметры:
+        owner_id (int | None): Идентификатор владельца рассылки.
+        old_status (str | None): Прежний статус (None - рассылка создана).
+        new_status (str | None): Новый статус (None - рассылка удалена).
+        """
+        if old_status != new_status:
+            self.add(owner_id, MAILING_FIELDS.get(old_status), -1)
+            self.add(owner_id, MAILING_FIELDS.get(new_status), 1)
+
+    def apply(self):
+        """
+        Записывает накопленные изменения в базу, очищает их и после фиксации транзакции
+        меняет версии данных главной страницы затронутых владельцев (см. mailing.dashboard).
+
+        Вызывается в транзакции изменения данных. Строки обновляются в одном порядке
+        (общая строка, затем владельцы по возрастанию id), чтобы параллельные транзакции
+        не блокировали друг друга взаимно. Общую строку обновляет каждая транзакция,
+        поэтому вызов стоит делать ближе к концу транзакции.
+        """
+        totals = Counter()
+        for owner_deltas in self._deltas.values():
+            totals.update(owner_deltas)
+        owners = sorted((owner_id, deltas) for owner_id, deltas in self._deltas.items() if owner_id is not None)
+        self._deltas.clear()
+        changed = [owner_id for owner_id, deltas in owners if any(deltas.values())]
+        if not changed and not any(totals.values()):
+            return
+        with transaction.atomic():
+            _increment(None, totals)
+            for owner_id, deltas in owners:
+                _increment(owner_id, deltas)
+            # Кэш главной страницы сбрасывается, когда изменения видны другим транзакциям
+            transaction.on_commit(lambda: bump_dashboard_version(changed))
+
+
+def _increment(owner_id, deltas):
+    changes = {field: F(field) + amount for field, amount in deltas.items() if amount}
+    if not changes:
+        return
+    counters = _counters_row(owner_id)
+    if not counters.update(**changes):
+        DashboardCounters.objects.get_or_create(owner_id=owner_id)
+        counters.update(**changes)
+
+
+def _counters_row(owner_id):
+    if owner_id is None:
+        return DashboardCounters.objects.filter(owner__isnull=True)
+    return DashboardCounters.objects.filter(owner_id=owner_id)
+
+
+def add_attempt_counters(attempts):
+    """
+    Учитывает записанные попытки рассылки.
+
+    Параметры:
+    attempts (Iterable[MailingAttempt]): Попытки с загруженной рассылкой (attempt.mailing).
+    """
+    deltas = CounterDeltas()
+    for attempt in attempts:
+        deltas.add(attempt.mailing.owner_id, ATTEMPT_FIELDS.get(attempt.status))
+    deltas.apply()
+
+
+def update_mailing_status(mailings, status):
+    """
+    Меняет статус рассылок и счетчики рассылок по статусам в одной транзакции.
+
+    Замена QuerySet.update(status=...): строки блокируются, поэтому из двух одновременных
+    вызовов статус (и счетчики) меняет только первый.
+
+    Параметры:
+    mailings (QuerySet[Mailing]): Рассылки (условия отбора, например по прежнему статусу).
+    status (str): Новый статус.
+
+    Возвращает:
+    int: Количество рассылок, статус которых изменен.
+    """
+    with transaction.atomic():
+        changed = list(
+            mailings.exclude(status=status)
+            .select_for_update()
+            .order_by()
+            .values_list("id", "owner_id", "status")
+        )
+        if not changed:
+            return 0
+        Mailing.objects.filter(pk__in=[mailing_id for mailing_id, _, _ in changed]).update(status=status)
+        deltas = CounterDeltas()
+        for _, owner_id, old_status in changed:
+            deltas.add_mailing_status(owner_id, old_status, status)
+        deltas.apply()
+    return len(changed)
+
+
+def delete_attempts(attempts):
+    """
+    Удаляет попытки рассылки и вычитает их из счетчиков главной страницы в одной транзакции.
+
+    Замена QuerySet.delete() для попыток (например, в админке): счетчики уменьшаются
+    на количества, сгруппированные одним запросом, а попытки удаляются без загрузки объектов.
+
+    Параметры:
+    attempts (QuerySet[MailingAttempt]): Удаляемые попытки.
+
+    Возвращает:
+    int: Количество удаленных попыток.
+    """
+    with transaction.atomic():
+        deltas = CounterDeltas()
+        totals = attempts.values_list("mailing__owner", "status").annotate(total=Count("id")).order_by()
+        for owner_id, status, total in totals:
+            deltas.add(owner_id, ATTEMPT_FIELDS.get(status), -total)
+        deleted, _ = attempts.delete()
+        deltas.apply()
+    return deleted
+
+
+def get_dashboard_counters(owner_id=None):
+    """
+    Возвращает счетчики главной страницы.
+
+    Параметры:
+    owner_id (int, optional): Идентификатор владельца. None - общие счетчики всех пользователей.
+
+    Возвращает:
+    DashboardCounters: Счетчики (несохраненный объект с нулями, если строки еще нет).
+    """
+    return _counters_row(owner_id).first() or DashboardCounters(owner_id=owner_id)
+
+
+def rebuild_counters():
+    """
+    Пересчитывает все счетчики главной страницы по данным в базе.
+
+    Нужен после загрузки данных в обход моделей (COPY, bulk_create, QuerySet.delete()
+    попыток). Пересчет выполняет по одному запросу GROUP BY на таблицу.
+
+    Возвращает:
+    int: Количество строк счетчиков.
+    """
+    with transaction.atomic():
+        # Транзакции, меняющие счетчики, ждут окончания пересчета и применяют
+        # свои изменения уже к пересчитанным строкам
+        list(DashboardCounters.objects.select_for_update().values_list("id"))
+        rows = defaultdict(Counter)
+        attempts = (
+            MailingAttempt.objects.values_list("mailing__owner", "status").annotate(total=Count("id")).order_by()
+        )
+        for owner_id, status, total in attempts:
+            rows[owner_id][ATTEMPT_FIELDS[status]] += total
+        mailings = Mailing.objects.values_list("owner", "status").annotate(total=Count("id")).order_by()
+        for owner_id, status, total in mailings:
+            if status in MAILING_FIELDS:
+                rows[owner_id][MAILING_FIELDS[status]] += total
+        recipients = Recipient.objects.values_list("owner").annotate(total=Count("id")).order_by()
+        for owner_id, total in recipients:
+            rows[owner_id]["recipients"] += total
+
+        totals = Counter()
+        for owner_counts in rows.values():
+            totals.update(owner_counts)
+        objects = [DashboardCounters(owner_id=None, **totals)] + [
+            DashboardCounters(owner_id=owner_id, **owner_counts)
+            for owner_id, owner_counts in rows.items()
+            if owner_id is not None
+        ]
+        previous = list(DashboardCounters.objects.filter(owner__isnull=False).values_list("owner", flat=True))
+        DashboardCounters.objects.all().delete()
+        DashboardCounters.objects.bulk_create(objects)
+        transaction.on_commit(lambda: bump_dashboard_version([*previous, *rows]))
+    return len(objects)
@@ -0,0 +1,90 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Пауза между проверками кэша, пока данные вычисляет другой процесс, в секундах
+WAIT_POLL_INTERVAL = 0.05
+
+
+def _version_key(owner_id):
+    return f"index_page_version/{owner_id}"
+
+
+def get_dashboard_version(owner_id):
+    """
+    Возвращает версию данных главной страницы владельца.
+
+    Начальная версия - текущее время в наносекундах, а не 0: если ключ версии вытеснен
+    из кэша, новая версия не совпадет ни с одной из прежних и устаревшие данные не вернутся.
+    Общие данные менеджеров версии не имеют: их по расписанию обновляет фоновая задача.
+
+    Параметры:
+    owner_id (int): Идентификатор владельца.
+
+    Возвращает:
+    int: Версия данных.
+    """
+    key = _version_key(owner_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_dashboard_version(owner_ids):
+    """
+    Сообщает, что данные главной страницы владельцев изменились.
+
+    Параметры:
+    owner_ids (Iterable[int | None]): Идентификаторы владельцев измененных объектов
+        (None - объект без владельца, учитывается только в общих данных).
+    """
+    for owner_id in set(owner_ids) - {None}:
+        key = _version_key(owner_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def get_or_compute(key, compute, timeout=None, lock_timeout=None):
+    """
+    Возвращает значение из кэша, вычисляя его при промахе только в одном процессе.
+
+    При промахе процесс берет блокировку (cache.add) и вычисляет значение; остальные
+    процессы с тем же ключом ждут появления значения в кэше до lock_timeout секунд
+    и лишь затем вычисляют его сами (например, если процесс с блокировкой упал).
+
+    Параметры:
+    key (str): Ключ кэша.
+    compute (callable): Функция без аргументов, вычисляющая значение (не None).
+    timeout (int, optional): Время хранения значения (MAILING_DASHBOARD_CACHE_TIMEOUT).
+    lock_timeout (float, optional): Время блокировки и ожидания (MAILING_DASHBOARD_LOCK_TIMEOUT).
+
+    Возвращает:
+    object: Значение.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+    timeout = timeout or settings.MAILING_DASHBOARD_CACHE_TIMEOUT
+    lock_timeout = lock_timeout or settings.MAILING_DASHBOARD_LOCK_TIMEOUT
+    lock_key = f"{key}/lock"
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            value = compute()
+            cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    value = compute()
+    cache.set(key, value, timeout)
+    return value
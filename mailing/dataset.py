@@ -0,0 +1,299 @@
+import io
+import logging
+import math
+import random
+from array import array
+from bisect import bisect
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.utils import timezone
+
+from mailing.counters import rebuild_counters
+from mailing.models import Mailing, MailingAttempt, Message, Recipient
+from users.models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+# Домены получателей: доля домена убывает как 1/ранг, как у крупных почтовых сервисов
+DOMAIN_COUNT = 50
+DOMAIN_TABLE_SIZE = 1000
+
+# Доли статусов рассылок и попыток
+MAILING_STATUSES = ((Mailing.COMPLETED, 0.7), (Mailing.RUNNING, 0.1), (Mailing.CREATED, 0.2))
+ATTEMPT_STATUSES = ((MailingAttempt.SUCCESS, 0.9), (MailingAttempt.FAILURE, 0.07), (MailingAttempt.RETRY, 0.03))
+
+# Глубина истории попыток
+HISTORY_DAYS = 90
+
+
+def _copy_value(value):
+    """Форматирует значение для COPY ... FROM STDIN в текстовом формате PostgreSQL."""
+    if value is None:
+        return "\\N"
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def insert_rows(model, fields, rows, batch_size, use_copy=False):
+    """
+    Вставляет строки в таблицу модели пачками.
+
+    На PostgreSQL строки можно передать командой COPY: она в разы быстрее INSERT
+    и не требует создания экземпляров моделей. Иначе используется bulk_create.
+
+    Параметры:
+    model (type[Model]): Модель.
+    fields (Sequence[str]): Имена полей (attname, например "mailing_id").
+    rows (Iterable[tuple]): Значения полей.
+    batch_size (int): Размер пачки.
+    use_copy (bool, optional): Использовать COPY (только PostgreSQL).
+
+    Возвращает:
+    int: Количество вставленных строк.
+    """
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            total += _insert_batch(model, fields, batch, use_copy)
+            batch = []
+    if batch:
+        total += _insert_batch(model, fields, batch, use_copy)
+    return total
+
+
+def _insert_batch(model, fields, batch, use_copy):
+    if not use_copy:
+        model.objects.bulk_create([model(**dict(zip(fields, row))) for row in batch])
+        return len(batch)
+    opts = model._meta
+    columns = ", ".join(connection.ops.quote_name(opts.get_field(field).column) for field in fields)
+    buffer = io.StringIO()
+    for row in batch:
+        buffer.write("\t".join(map(_copy_value, row)))
+        buffer.write("\n")
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {connection.ops.quote_name(opts.db_table)} ({columns}) FROM STDIN", buffer
+        )
+    return len(batch)
+
+
+class DatasetGenerator:
+    """
+    Генератор большого синтетического набора данных для нагрузочного тестирования.
+
+    Создает пользователей, получателей, сообщения, рассылки со связями с получателями
+    и историю попыток рассылки. Размер аудитории рассылок распределен лог-равномерно
+    от 1 до max_fanout (первая рассылка всегда получает max_fanout получателей), попытки
+    распределяются по рассылкам пропорционально аудитории.
+
+    Все адреса получателей генерируются по номеру получателя и содержат метку tag,
+    поэтому данные разных запусков не пересекаются, а строки не нужно держать в памяти:
+    в памяти хранятся только идентификаторы получателей (array).
+    """
+
+    def __init__(
+        self,
+        users,
+        recipients,
+        mailings,
+        max_fanout,
+        attempts,
+        batch_size=10000,
+        seed=None,
+        use_copy=None,
+        tag="load",
+        log=None,
+    ):
+        """
+        Параметры:
+        users (int): Количество пользователей.
+        recipients (int): Количество получателей.
+        mailings (int): Количество рассылок.
+        max_fanout (int): Максимальное количество получателей одной рассылки.
+        attempts (int): Количество попыток рассылки.
+        batch_size (int, optional): Размер пачки вставки.
+        seed (int, optional): Начальное значение генератора случайных чисел.
+        use_copy (bool, optional): Вставлять строки командой COPY. По умолчанию - на PostgreSQL.
+        tag (str, optional): Метка данных в адресах почты.
+        log (callable, optional): Функция вывода хода генерации.
+        """
+        self.users = users
+        self.recipients = recipients
+        self.mailings = mailings
+        self.max_fanout = max(1, min(max_fanout, recipients))
+        self.attempts = attempts
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.use_copy = connection.vendor == "postgresql" if use_copy is None else use_copy
+        self.tag = tag
+        self.log = log or logger.info
+        weights = [1 / rank for rank in range(1, DOMAIN_COUNT + 1)]
+        self._domains = self.random.choices(
+            [f"mail{rank}.{tag}.test" for rank in range(DOMAIN_COUNT)], weights, k=DOMAIN_TABLE_SIZE
+        )
+
+    def recipient_email(self, number):
+        """
+        Возвращает адрес получателя по его номеру в наборе.
+
+        Параметры:
+        number (int): Номер получателя.
+
+        Возвращает:
+        str: Адрес почты.
+        """
+        return f"user{number}@{self._domains[number % DOMAIN_TABLE_SIZE]}"
+
+    def run(self):
+        """
+        Создает набор данных.
+
+        Возвращает:
+        dict[str, int]: Количество созданных строк по видам данных.
+        """
+        user_ids = self._create_users()
+        recipient_ids = self._create_recipients(user_ids)
+        mailings = self._create_mailings(user_ids, len(recipient_ids))
+        links = self._create_links(mailings, recipient_ids)
+        attempts = self._create_attempts(mailings, links, len(recipient_ids))
+        # Строки вставлены в обход сигналов моделей
+        rebuild_counters()
+        self.log("Счетчики главной страницы пересчитаны")
+        return {
+            "users": len(user_ids),
+            "recipients": len(recipient_ids),
+            "mailings": len(mailings),
+            "links": links,
+            "attempts": attempts,
+        }
+
+    def _create_users(self):
+        password = make_password(None)
+        suffix = f"@owners.{self.tag}.test"
+        existing = CustomUser.objects.filter(email__endswith=suffix).count()
+        CustomUser.objects.bulk_create(
+            [
+                CustomUser(email=f"owner{existing + i}{suffix}", password=password)
+                for i in range(self.users)
+            ],
+            batch_size=self.batch_size,
+        )
+        user_ids = list(CustomUser.objects.filter(email__endswith=suffix).values_list("id", flat=True))
+        self.log(f"Пользователей: {len(user_ids)}")
+        return user_ids
+
+    def _create_recipients(self, user_ids):
+        start = Recipient.objects.filter(email__contains=f".{self.tag}.test").count()
+        rows = (
+            (self.recipient_email(number), f"Получатель {number}", self.random.choice(user_ids))
+            for number in range(start, start + self.recipients)
+        )
+        insert_rows(Recipient, ("email", "full_name", "owner_id"), rows, self.batch_size, self.use_copy)
+        recipient_ids = array("q")
+        ids = (
+            Recipient.objects.filter(email__contains=f".{self.tag}.test")
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        recipient_ids.extend(ids.iterator(chunk_size=self.batch_size))
+        self.log(f"Получателей: {len(recipient_ids)}")
+        return recipient_ids
+
+    def _create_mailings(self, user_ids, recipient_count):
+        now = timezone.now()
+        statuses, weights = zip(*MAILING_STATUSES)
+        messages = Message.objects.bulk_create(
+            [
+                Message(
+                    title=f"Рассылка {i}",
+                    message="Текст письма.",
+                    owner_id=self.random.choice(user_ids),
+                )
+                for i in range(self.mailings)
+            ],
+            batch_size=self.batch_size,
+        )
+        objects = []
+        for i, message in enumerate(messages):
+            first_send_at = now - timedelta(seconds=self.random.uniform(0, HISTORY_DAYS * 86400))
+            objects.append(
+                Mailing(
+                    first_send_at=first_send_at,
+                    finish_send_at=first_send_at + timedelta(days=1),
+                    status=self.random.choices(statuses, weights)[0],
+                    owner_id=message.owner_id,
+                    message=message,
+                )
+            )
+        mailings = Mailing.objects.bulk_create(objects, batch_size=self.batch_size)
+        max_fanout = min(self.max_fanout, recipient_count)
+        for i, mailing in enumerate(mailings):
+            # Лог-равномерное распределение: много небольших рассылок и несколько огромных
+            mailing.fanout = (
+                max_fanout
+                if i == 0
+                else min(max_fanout, int(math.exp(self.random.uniform(0, math.log(max_fanout + 1)))))
+            )
+            mailing.offset = self.random.randrange(recipient_count)
+        self.log(f"Рассылок: {len(mailings)}")
+        return mailings
+
+    def _create_links(self, mailings, recipient_ids):
+        through = Mailing.recipients.through
+        count = len(recipient_ids)
+        # Получатели рассылки - непрерывный отрезок номеров со случайного места (с переходом через конец)
+        rows = (
+            (mailing.pk, recipient_ids[(mailing.offset + i) % count])
+            for mailing in mailings
+            for i in range(mailing.fanout)
+        )
+        links = insert_rows(through, ("mailing_id", "recipient_id"), rows, self.batch_size, self.use_copy)
+        self.log(f"Связей рассылок с получателями: {links}")
+        return links
+
+    def _create_attempts(self, mailings, links, recipient_count):
+        statuses, weights = zip(*ATTEMPT_STATUSES)
+        thresholds = [sum(weights[: i + 1]) for i in range(len(weights) - 1)]
+        responses = {
+            MailingAttempt.SUCCESS: "Успешно отправлено",
+            MailingAttempt.FAILURE: "Ошибка: (550, b'No such user')",
+            MailingAttempt.RETRY: "Ошибка: (451, b'Try again later')",
+        }
+        rand = self.random.random
+
+        def rows():
+            for mailing in mailings:
+                share = round(self.attempts * mailing.fanout / links) if links else 0
+                for i in range(share):
+                    status = statuses[bisect(thresholds, rand())]
+                    # Номер получателя совпадает с его позицией в recipient_ids
+                    number = (mailing.offset + i % mailing.fanout) % recipient_count
+                    yield (
+                        mailing.first_send_at + timedelta(seconds=rand() * 86400),
+                        status,
+                        f"{self.recipient_email(number)}: {responses[status]}",
+                        mailing.pk,
+                    )
+
+        attempts = insert_rows(
+            MailingAttempt,
+            ("attempted_at", "status", "mail_server_response", "mailing_id"),
+            rows(),
+            self.batch_size,
+            self.use_copy,
+        )
+        self.log(f"Попыток рассылки: {attempts}")
+        return attempts
@@ -0,0 +1,239 @@
+import logging
+import queue
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+from mailing.async_engine import AsyncMailEngine
+from mailing.sending import BatchMailSender
+
+logger = logging.getLogger(__name__)
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+
+def get_host_slots(host, limit):
+    """
+    Возвращает семафор, ограничивающий количество одновременных SMTP-соединений с сервером в процессе.
+
+    Семафор общий для всех движков с тем же сервером и тем же ограничением; движок
+    с другим ограничением (например, другим --per-host) получает собственный семафор.
+
+    Параметры:
+    host (str): Адрес SMTP-сервера.
+    limit (int): Максимальное количество одновременных соединений с сервером.
+
+    Возвращает:
+    threading.BoundedSemaphore: Семафор, который занимается на время каждого соединения.
+    """
+    with _host_semaphores_lock:
+        return _host_semaphores.setdefault((host, limit), threading.BoundedSemaphore(limit))
+
+
+class ThreadPoolMailEngine:
+    """
+    Параллельная отправка рассылки пулом потоков.
+
+    Получатели читаются из базы в вызывающем потоке и передаются рабочим потокам через
+    ограниченную очередь, поэтому в памяти одновременно находится не больше queue_size адресатов.
+    Каждый рабочий поток держит собственное SMTP-соединение (через BatchMailSender);
+    соединение занимает место в ограничении per_host только пока оно открыто.
+    Результаты возвращаются в вызывающий поток, так что запись попыток в базу
+    выполняется только в нем.
+    """
+
+    def __init__(
+        self,
+        workers=None,
+        per_host=None,
+        queue_size=None,
+        batch_size=None,
+        connection_factory=get_connection,
+        host=None,
+        rcpt_batch=None,
+    ):
+        """
+        Параметры:
+        workers (int, optional): Общее количество рабочих потоков (MAILING_WORKERS).
+        per_host (int, optional): Максимум одновременных соединений с одним SMTP-сервером
+            (MAILING_MAX_CONNECTIONS_PER_HOST).
+        queue_size (int, optional): Размер очереди между чтением из базы и отправкой (MAILING_QUEUE_SIZE).
+        batch_size (int, optional): Количество писем на одно SMTP-соединение.
+        connection_factory (callable, optional): Функция, возвращающая почтовый бэкенд.
+        host (str, optional): SMTP-сервер, к которому относится ограничение per_host (EMAIL_HOST).
+        rcpt_batch (int, optional): Максимальное количество получателей одной SMTP-транзакции
+            (MAILING_RCPT_BATCH_SIZE).
+        """
+        self.workers = workers or settings.MAILING_WORKERS
+        self.per_host = per_host or settings.MAILING_MAX_CONNECTIONS_PER_HOST
+        self.queue_size = queue_size or settings.MAILING_QUEUE_SIZE
+        self.batch_size = batch_size
+        self.connection_factory = connection_factory
+        self.host = host or settings.EMAIL_HOST
+        self.rcpt_batch = rcpt_batch
+
+    def send(self, mailing, envelopes):
+        """
+        Отправляет письма рассылки переданным адресатам пулом потоков.
+
+        Параметры:
+        mailing (Mailing): Рассылка.
+        envelopes (Iterable[Envelope]): Адресаты.
+
+        Возвращает:
+        Iterator[SendResult]: Результаты отправки по каждому адресату.
+        """
+        # Письмо готовится до запуска потоков: рабочие потоки не обращаются к базе
+        # и используют общее закодированное письмо
+        sender = BatchMailSender(
+            batch_size=self.batch_size,
+            connection_factory=self.connection_factory,
+            rcpt_batch=self.rcpt_batch,
+            connection_slots=get_host_slots(self.host, self.per_host),
+        )
+        sender.prepare_message(mailing)
+        tasks = queue.Queue(maxsize=self.queue_size)
+        results = queue.Queue()
+        done = threading.Event()
+        stop = threading.Event()
+        threads = [
+            threading.Thread(
+                target=self._work,
+                args=(sender, mailing, tasks, results, done, stop),
+                name=f"mailing-{mailing.pk}-worker-{i}",
+                daemon=True,
+            )
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for envelope in envelopes:
+                self._put(tasks, envelope, threads)
+                yield from self._drain(results)
+            done.set()
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.1)
+                    yield from self._drain(results)
+            yield from self._drain(results)
+            if not tasks.empty():
+                raise RuntimeError("Рабочие потоки завершились, не отправив все письма")
+        finally:
+            stop.set()
+
+    def _work(self, sender, mailing, tasks, results, done, stop):
+        """Рабочий поток: отправляет письма из очереди через собственное соединение."""
+        try:
+            for result in sender.send(mailing, self._iter_tasks(tasks, done, stop)):
+                results.put(result)
+        except Exception:
+            logger.exception(f"Сбой рабочего потока рассылки {mailing.pk}")
+
+    @staticmethod
+    def _iter_tasks(tasks, done, stop):
+        """Выдает адресатов из очереди, пока чтение не завершено или отправка не остановлена."""
+        while not stop.is_set():
+            try:
+                envelope = tasks.get(timeout=0.1)
+            except queue.Empty:
+                if done.is_set():
+                    return
+                continue
+            yield envelope
+
+    @staticmethod
+    def _put(tasks, envelope, threads):
+        """Помещает адресата в очередь, ожидая освобождения места."""
+        while True:
+            try:
+                tasks.put(envelope, timeout=0.1)
+                return
+            except queue.Full:
+                if not any(thread.is_alive() for thread in threads):
+                    raise RuntimeError("Нет активных рабочих потоков для отправки рассылки")
+
+    @staticmethod
+    def _drain(results):
+        """Выдает накопившиеся результаты отправки."""
+        while True:
+            try:
+                yield results.get_nowait()
+            except queue.Empty:
+                return
+
+
+def get_engine(
+    name,
+    batch_size=None,
+    workers=None,
+    per_host=None,
+    concurrency=None,
+    smtp_host=None,
+    smtp_port=None,
+    rcpt_batch=None,
+):
+    """
+    Возвращает движок отправки по имени.
+
+    Параметры:
+    name (str): Имя движка: "batch" (последовательная отправка), "threads" (пул потоков)
+        или "asyncio" (асинхронная отправка).
+    batch_size (int, optional): Количество писем на одно SMTP-соединение.
+    workers (int, optional): Количество рабочих потоков движка threads.
+    per_host (int, optional): Максимум одновременных соединений с одним SMTP-сервером для движка threads.
+    concurrency (int, optional): Количество одновременных соединений движка asyncio.
+    smtp_host (str, optional): SMTP-сервер без шифрования и авторизации вместо EMAIL_HOST,
+        например локальная заглушка для замеров скорости.
+    smtp_port (int, optional): Порт SMTP-сервера smtp_host.
+    rcpt_batch (int, optional): Максимальное количество получателей одной SMTP-транзакции
+        для писем без подстановок.
+
+    Возвращает:
+    Движок отправки: BatchMailSender, ThreadPoolMailEngine или AsyncMailEngine.
+    """
+    connection_factory = get_connection
+    if smtp_host:
+        connection_factory = partial(
+            get_connection,
+            "django.core.mail.backends.smtp.EmailBackend",
+            host=smtp_host,
+            port=smtp_port,
+            username="",
+            password="",
+            use_tls=False,
+            use_ssl=False,
+        )
+
+    if name == "batch":
+        return BatchMailSender(
+            batch_size=batch_size, connection_factory=connection_factory, rcpt_batch=rcpt_batch
+        )
+    if name == "threads":
+        return ThreadPoolMailEngine(
+            workers=workers,
+            per_host=per_host,
+            batch_size=batch_size,
+            connection_factory=connection_factory,
+            host=smtp_host,
+            rcpt_batch=rcpt_batch,
+        )
+    if name == "asyncio":
+        smtp_options = {}
+        if smtp_host:
+            smtp_options = dict(
+                hostname=smtp_host,
+                port=smtp_port,
+                use_tls=False,
+                start_tls=False,
+                username="",
+                password="",
+            )
+        return AsyncMailEngine(
+            concurrency=concurrency, batch_size=batch_size, rcpt_batch=rcpt_batch, **smtp_options
+        )
+    raise ValueError(f"Неизвестный движок отправки: {name}")
@@ -0,0 +1,172 @@
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, Q
+from django.utils import timezone
+
+from mailing.counters import update_mailing_status
+from mailing.models import Mailing, RecipientDelivery
+from mailing.services import due_deliveries, prepare_deliveries, send_mailing
+
+logger = logging.getLogger(__name__)
+
+
+def get_worker_id() -> str:
+    """
+    Возвращает идентификатор текущего обработчика рассылок.
+
+    Возвращает:
+    str: Имя хоста и идентификатор процесса.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def start_mailings(mailings) -> list:
+    """
+    Захватывает рассылки, готовые к запуску, подготавливает состояния доставки и запускает их.
+
+    Рассылки блокируются через SELECT ... FOR UPDATE SKIP LOCKED, поэтому при одновременном
+    запуске на нескольких узлах каждую рассылку подготавливает только один из них.
+
+    Параметры:
+    mailings (QuerySet[Mailing]): Рассылки-кандидаты (например, со сроком первой отправки в прошлом).
+
+    Возвращает:
+    list[int]: Идентификаторы запущенных рассылок.
+    """
+    started = []
+    candidates = mailings.filter(
+        Q(status=Mailing.CREATED) | Q(status=Mailing.RUNNING, deliveries__isnull=True)
+    ).distinct().values_list("id", flat=True)
+    for mailing_id in list(candidates):
+        with transaction.atomic():
+            mailing = (
+                Mailing.objects.select_for_update(skip_locked=True)
+                .filter(pk=mailing_id)
+                .first()
+            )
+            if mailing is None:
+                continue
+            restart = mailing.status == Mailing.CREATED
+            if not restart and mailing.deliveries.exists():
+                continue
+            prepare_deliveries(mailing, restart=restart)
+            mailing.status = Mailing.RUNNING
+            mailing.save(update_fields=["status"])
+        started.append(mailing_id)
+        logger.info(f"Рассылка {mailing_id} запущена обработчиком {get_worker_id()}")
+    return started
+
+
+def claim_deliveries(
+    mailing_id: int, worker_id: str, batch_size: int = None, lease_seconds: int = None, deliveries=None
+) -> list:
+    """
+    Захватывает пачку ожидающих отправки получателей рассылки, срок отправки которых наступил.
+
+    Строки блокируются через SELECT ... FOR UPDATE SKIP LOCKED и помечаются захватом
+    с ограниченным сроком. Захват продлевается при каждой записи попыток (см. AttemptRecorder);
+    если обработчик перестанет отправлять письма (например, из-за сбоя), по окончании
+    срока получателей захватит другой обработчик.
+
+    Параметры:
+    mailing_id (int): Идентификатор рассылки.
+    worker_id (str): Идентификатор обработчика.
+    batch_size (int, optional): Размер пачки (MAILING_CLAIM_SIZE).
+    lease_seconds (int, optional): Срок захвата в секундах (MAILING_LEASE_SECONDS).
+    deliveries (QuerySet[RecipientDelivery], optional): Состояния доставки, из которых
+        захватываются получатели (например, диапазон задачи Celery). По умолчанию - все.
+
+    Возвращает:
+    list[int]: Идентификаторы захваченных состояний доставки.
+    """
+    batch_size = batch_size or settings.MAILING_CLAIM_SIZE
+    lease_seconds = lease_seconds or settings.MAILING_LEASE_SECONDS
+    if deliveries is None:
+        deliveries = RecipientDelivery.objects.all()
+    now = timezone.now()
+    with transaction.atomic():
+        delivery_ids = list(
+            due_deliveries(deliveries.select_for_update(skip_locked=True, of=("self",)), now)
+            .filter(mailing_id=mailing_id, mailing__status=Mailing.RUNNING)
+            .filter(Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now))
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        RecipientDelivery.objects.filter(pk__in=delivery_ids).update(
+            leased_by=worker_id,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+        )
+    return delivery_ids
+
+
+def complete_if_finished(mailing_id: int) -> bool:
+    """
+    Переводит запущенную рассылку в статус "Завершена", если не осталось ожидающих отправки получателей.
+
+    Параметры:
+    mailing_id (int): Идентификатор рассылки.
+
+    Возвращает:
+    bool: True, если рассылка завершена.
+    """
+    pending = RecipientDelivery.objects.filter(
+        mailing_id=mailing_id, status=RecipientDelivery.PENDING
+    )
+    completed = update_mailing_status(
+        Mailing.objects.filter(~Exists(pending), pk=mailing_id, status=Mailing.RUNNING),
+        Mailing.COMPLETED,
+    )
+    return bool(completed)
+
+
+def send_leased(mailing, engine: str = None, worker_id: str = None, deliveries=None, **options) -> int:
+    """
+    Отправляет рассылку пачками захваченных получателей, пока не останется свободных.
+
+    Отправляются только получатели, захват которых все еще принадлежит обработчику,
+    поэтому одних и тех же получателей не отправят одновременно задача Celery и sand_mail
+    или обработчик, чей захват истек и перешел к другому.
+
+    Параметры:
+    mailing (Mailing): Запущенная рассылка.
+    engine (str, optional): Движок отправки (см. mailing.services.send_mailing).
+    worker_id (str, optional): Идентификатор обработчика. По умолчанию - get_worker_id().
+    deliveries (QuerySet[RecipientDelivery], optional): Состояния доставки, из которых
+        захватываются получатели (см. claim_deliveries).
+    **options: Параметры движка (см. mailing.engines.get_engine).
+
+    Возвращает:
+    int: Количество захваченных получателей.
+    """
+    worker_id = worker_id or get_worker_id()
+    claimed = 0
+    while delivery_ids := claim_deliveries(mailing.pk, worker_id, deliveries=deliveries):
+        claimed += len(delivery_ids)
+        leased = RecipientDelivery.objects.filter(pk__in=delivery_ids, leased_by=worker_id)
+        send_mailing(mailing, engine, deliveries=leased, worker_id=worker_id, **options)
+    return claimed
+
+
+def send_claimed(mailing, engine: str = None, worker_id: str = None, **options) -> bool:
+    """
+    Отправляет запущенную рассылку пачками захваченных получателей и завершает ее.
+
+    Пачки захватываются через claim_deliveries() (см. send_leased), поэтому одну рассылку
+    могут одновременно отправлять несколько обработчиков.
+
+    Параметры:
+    mailing (Mailing): Запущенная рассылка.
+    engine (str, optional): Движок отправки (см. mailing.services.send_mailing).
+    worker_id (str, optional): Идентификатор обработчика. По умолчанию - get_worker_id().
+    **options: Параметры движка (см. mailing.engines.get_engine).
+
+    Возвращает:
+    bool: True, если рассылка завершена.
+    """
+    send_leased(mailing, engine, worker_id, **options)
+    return complete_if_finished(mailing.pk)
@@ -1,5 +1,6 @@
 from django.core.management import call_command
 from django.core.management.base import BaseCommand
+from mailing.counters import rebuild_counters
 from mailing.models import Mailing, MailingAttempt, Message, Recipient
 
 
@@ -24,3 +25,5 @@ class Command(BaseCommand):
         self.stdout.write(
             self.style.SUCCESS("Попытки рассылок загружены из фикстур успешно")
         )
+        rebuild_counters()
+        self.stdout.write(self.style.SUCCESS("Счетчики главной страницы пересчитаны"))
@@ -0,0 +1,88 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from mailing.benchmark import WriteCounter, delete_bench_mailing, peak_rss_mb, percentile, seed_bench_mailing
+from mailing.management.commands.smtp_sink import add_fault_arguments, fault_options
+from mailing.models import MailingAttempt, RecipientDelivery
+from mailing.services import send_mailing
+from mailing.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = "Замер скорости отправки рассылки через локальную SMTP-заглушку"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recipients", type=int, default=10000, help="Количество получателей")
+        parser.add_argument("--domains", type=int, default=10, help="Количество доменов получателей")
+        parser.add_argument("--personalized", action="store_true", help="Текст письма с подстановками")
+        parser.add_argument(
+            "--engine",
+            choices=["batch", "threads", "asyncio"],
+            default=settings.MAILING_ENGINE,
+            help="Движок отправки",
+        )
+        parser.add_argument("--batch-size", type=int, default=None, help="Количество писем на одно соединение")
+        parser.add_argument("--workers", type=int, default=None, help="Количество потоков движка threads")
+        parser.add_argument(
+            "--per-host", type=int, default=None, help="Максимум соединений с одним сервером для движка threads"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=None, help="Количество соединений движка asyncio"
+        )
+        parser.add_argument(
+            "--rcpt-batch", type=int, default=None, help="Максимум получателей одной SMTP-транзакции"
+        )
+        parser.add_argument("--keep", action="store_true", help="Не удалять рассылку замера")
+        add_fault_arguments(parser)
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write(f"Создание рассылки на {kwargs['recipients']} получателей...")
+        mailing, token = seed_bench_mailing(
+            kwargs["recipients"], domains=kwargs["domains"], personalized=kwargs["personalized"]
+        )
+        options = {
+            name: kwargs[name]
+            for name in ("batch_size", "workers", "per_host", "concurrency", "rcpt_batch")
+        }
+        counter = WriteCounter()
+        try:
+            with SMTPSink(**fault_options(kwargs)).run_in_thread() as sink:
+                started_at = time.perf_counter()
+                with counter.count_writes():
+                    send_mailing(
+                        mailing, kwargs["engine"], smtp_host=sink.host, smtp_port=sink.port, **options
+                    )
+                elapsed = time.perf_counter() - started_at
+            self.report(mailing, sink, counter.count, elapsed)
+        finally:
+            if not kwargs["keep"]:
+                delete_bench_mailing(mailing, token)
+
+    def report(self, mailing, sink, writes, elapsed):
+        """Выводит результаты замера."""
+        attempts = dict(
+            mailing.attempts.values_list("status").annotate(total=Count("id")).order_by()
+        )
+        sent = attempts.get(MailingAttempt.SUCCESS, 0)
+        p50 = percentile(sink.transaction_times, 0.5)
+        p99 = percentile(sink.transaction_times, 0.99)
+        lines = [
+            f"Время отправки: {elapsed:.2f} с",
+            f"Отправлено писем: {sent}, писем в секунду: {sent / elapsed if elapsed else 0:.1f}",
+            f"Попыток: успешно - {sent}, временных ошибок - {attempts.get(MailingAttempt.RETRY, 0)}, "
+            f"постоянных ошибок - {attempts.get(MailingAttempt.FAILURE, 0)}",
+            f"Ожидают повтора: {mailing.deliveries.filter(status=RecipientDelivery.PENDING).count()}",
+            f"SMTP-транзакций: {sink.messages}, отказов 4xx: {sink.temp_failures}, "
+            f"отказов 5xx: {sink.perm_failures}, разрывов: {sink.drops}",
+        ]
+        if p50 is not None:
+            lines.append(f"Длительность SMTP-транзакции: p50 - {p50 * 1000:.2f} мс, p99 - {p99 * 1000:.2f} мс")
+        lines += [
+            f"Запросов записи в базу: {writes}",
+            f"Пиковый RSS процесса: {peak_rss_mb():.1f} МБ",
+        ]
+        for line in lines:
+            self.stdout.write(line)
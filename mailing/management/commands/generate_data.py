@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mailing.dataset import DatasetGenerator
+
+
+class Command(BaseCommand):
+    help = "Генерация большого синтетического набора данных для нагрузочного тестирования"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000, help="Количество пользователей")
+        parser.add_argument("--recipients", type=int, default=100000, help="Количество получателей")
+        parser.add_argument("--mailings", type=int, default=100, help="Количество рассылок")
+        parser.add_argument(
+            "--max-fanout",
+            type=int,
+            default=100000,
+            help="Максимальное количество получателей одной рассылки",
+        )
+        parser.add_argument("--attempts", type=int, default=1000000, help="Количество попыток рассылки")
+        parser.add_argument("--batch-size", type=int, default=10000, help="Размер пачки вставки")
+        parser.add_argument("--seed", type=int, default=None, help="Начальное значение генератора")
+        parser.add_argument("--tag", default="load", help="Метка данных в адресах почты")
+        parser.add_argument(
+            "--no-copy",
+            action="store_true",
+            help="Вставлять строки через bulk_create даже на PostgreSQL",
+        )
+
+    def handle(self, *args, **kwargs):
+        generator = DatasetGenerator(
+            users=kwargs["users"],
+            recipients=kwargs["recipients"],
+            mailings=kwargs["mailings"],
+            max_fanout=kwargs["max_fanout"],
+            attempts=kwargs["attempts"],
+            batch_size=kwargs["batch_size"],
+            seed=kwargs["seed"],
+            use_copy=False if kwargs["no_copy"] else None,
+            tag=kwargs["tag"],
+            log=self.stdout.write,
+        )
+        started_at = time.perf_counter()
+        generator.run()
+        self.stdout.write(
+            self.style.SUCCESS(f"Набор данных создан за {time.perf_counter() - started_at:.1f} с")
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from mailing.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Пересчет счетчиков главной страницы по данным в базе"
+
+    def handle(self, *args, **kwargs):
+        rows = rebuild_counters()
+        self.stdout.write(self.style.SUCCESS(f"Счетчики пересчитаны, строк: {rows}"))
@@ -0,0 +1,44 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mailing.leasing import get_worker_id
+from mailing.outbox import relay_outbox
+
+
+class Command(BaseCommand):
+    help = "Резидентная отправка служебных писем из исходящей очереди, включая повторы после ошибок"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=None, help="Количество писем в одной пачке"
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=None,
+            help="Пауза между проверками очереди, в секундах",
+        )
+        parser.add_argument("--once", action="store_true", help="Отправить ожидающие письма и завершиться")
+
+    def handle(self, *args, **kwargs):
+        poll_interval = kwargs["poll_interval"] or settings.MAILING_OUTBOX_POLL_INTERVAL
+        worker_id = get_worker_id()
+        if kwargs["once"]:
+            sent = relay_outbox(kwargs["batch_size"], worker_id)
+            self.stdout.write(f"Отправлено служебных писем: {sent}")
+            return
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+        self.stdout.write("Отправка служебных писем запущена")
+        while not stop.is_set():
+            sent = relay_outbox(kwargs["batch_size"], worker_id)
+            if sent:
+                self.stdout.write(f"Отправлено служебных писем: {sent}")
+            stop.wait(poll_interval)
+        self.stdout.write("Отправка служебных писем остановлена")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from mailing.rollups import rebuild_rollups, update_rollups
+
+
+class Command(BaseCommand):
+    help = "Инкрементальное обновление часовых и суточных сводок попыток рассылки"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=None, help="Количество попыток, учитываемых в одной транзакции"
+        )
+        parser.add_argument(
+            "--settle", type=float, default=None, help="Задержка учета новых попыток, в секундах"
+        )
+        parser.add_argument(
+            "--rebuild", action="store_true", help="Удалить сводки и построить их заново"
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["rebuild"]:
+            rebuild_rollups()
+            self.stdout.write("Сводки удалены, отметка сброшена")
+        processed = update_rollups(chunk_size=kwargs["chunk_size"], settle=kwargs["settle"])
+        self.stdout.write(self.style.SUCCESS(f"Учтено попыток рассылки: {processed}"))
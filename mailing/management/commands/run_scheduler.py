@@ -0,0 +1,80 @@
+import logging
+import signal
+import threading
+
+from django.conf import settings
+from mailing.leasing import get_worker_id, send_claimed, start_mailings
+from mailing.management.commands.sand_mail import Command as SandMailCommand
+from mailing.models import Mailing
+from mailing.scheduler import MailingScheduler
+from mailing.tasks import enqueue_mailing
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(SandMailCommand):
+    """Резидентный планировщик рассылок: запускает отправку в срок first_send_at вместо запуска sand_mail по cron."""
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=None,
+            help="Максимальная пауза между проверками расписания, в секундах",
+        )
+        parser.add_argument(
+            "--dispatch-workers",
+            type=int,
+            default=settings.MAILING_SCHEDULER_WORKERS,
+            help="Количество потоков, отправляющих рассылки без Celery (0 - отправка в цикле планировщика)",
+        )
+
+    def handle(self, *args, **kwargs):
+        options = {
+            name: kwargs[name]
+            for name in (
+                "batch_size",
+                "workers",
+                "per_host",
+                "concurrency",
+                "smtp_host",
+                "smtp_port",
+                "rcpt_batch",
+            )
+        }
+        worker_id = get_worker_id()
+
+        def dispatch(mailing_id):
+            if kwargs["celery"]:
+                # Запущенную рассылку отправляют ее задачи Celery, повторный запуск не нужен
+                enqueue_mailing(Mailing(pk=mailing_id), statuses=[Mailing.CREATED])
+                return
+            start_mailings(Mailing.objects.filter(pk=mailing_id))
+            retry(mailing_id)
+
+        def retry(mailing_id):
+            mailing = Mailing.objects.select_related("message").get(pk=mailing_id)
+            if mailing.status == Mailing.RUNNING:
+                send_claimed(mailing, kwargs["engine"], worker_id=worker_id, **options)
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+        self.stdout.write("Планировщик рассылок запущен")
+        # С Celery повторы после временных ошибок планирует задача retry_mailing, а отправку
+        # выполняют воркеры; без Celery рассылки отправляются в пуле потоков, чтобы отправка
+        # большой рассылки не задерживала сроки других
+        scheduler = MailingScheduler(
+            dispatch,
+            poll_interval=kwargs["poll_interval"],
+            retry_dispatch=None if kwargs["celery"] else retry,
+            workers=None if kwargs["celery"] else kwargs["dispatch_workers"],
+        )
+        try:
+            scheduler.run_forever(stop)
+        finally:
+            scheduler.close()
+        self.stdout.write("Планировщик рассылок остановлен")
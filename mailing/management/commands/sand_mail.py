@@ -1,11 +1,15 @@
 import logging
+import signal
+import sys
 
-from mailing.models import Mailing, MailingAttempt
-from config.settings import DEFAULT_FROM_EMAIL
+from mailing.leasing import get_worker_id, send_claimed, start_mailings
+from mailing.models import Mailing
+from mailing.tasks import enqueue_mailing
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.db.models import Q
-from django.core.mail import send_mail
-from datetime import timedelta, timezone
+from django.utils import timezone
+from datetime import timedelta
 
 
 logger = logging.getLogger(__name__)
@@ -14,6 +18,60 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     """Функция для отправки рассылок."""
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Количество писем, отправляемых через одно SMTP-соединение",
+        )
+        parser.add_argument(
+            "--engine",
+            choices=["batch", "threads", "asyncio"],
+            default=settings.MAILING_ENGINE,
+            help="Движок отправки: последовательный (batch), пул потоков (threads) или asyncio",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Количество рабочих потоков для движка threads",
+        )
+        parser.add_argument(
+            "--per-host",
+            type=int,
+            default=None,
+            help="Максимум одновременных соединений с одним SMTP-сервером",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=None,
+            help="Количество одновременных SMTP-соединений для движка asyncio",
+        )
+        parser.add_argument(
+            "--smtp-host",
+            default=None,
+            help="SMTP-сервер без шифрования и авторизации вместо EMAIL_HOST (например, локальная заглушка)",
+        )
+        parser.add_argument(
+            "--smtp-port",
+            type=int,
+            default=None,
+            help="Порт SMTP-сервера из --smtp-host",
+        )
+        parser.add_argument(
+            "--rcpt-batch",
+            type=int,
+            default=None,
+            help="Максимум получателей одного домена в одной SMTP-транзакции для писем без подстановок",
+        )
+        parser.add_argument(
+            "--celery",
+            action="store_true",
+            help="Поставить рассылки в очередь Celery вместо отправки в этом процессе",
+        )
+
     def handle(self, *args, **kwargs):
         time_threshold_start = timezone.now() - timedelta(hours=20)
         time_threshold_end = timezone.now()
@@ -23,36 +81,31 @@ class Command(BaseCommand):
             first_send_at__gte=time_threshold_start,
             first_send_at__lte=time_threshold_end,
         )
+        options = {
+            name: kwargs[name]
+            for name in (
+                "batch_size",
+                "workers",
+                "per_host",
+                "concurrency",
+                "smtp_host",
+                "smtp_port",
+                "rcpt_batch",
+            )
+        }
+        # При остановке процесса буфер попыток должен успеть записаться в базу
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+
+        if kwargs["celery"]:
+            # Запущенные рассылки уже отправляют задачи Celery: в очередь ставятся только новые
+            for mailing in mailings.filter(status=Mailing.CREATED):
+                if enqueue_mailing(mailing, statuses=[Mailing.CREATED]):
+                    self.stdout.write(f"Рассылка {mailing.pk} поставлена в очередь")
+            return
 
-        for mailing in mailings:
-            mailing.status = Mailing.RUNNING
-            mailing.save()
-
-            recipients = mailing.recipients.all()
-            for recipient in recipients:
-                try:
-                    logger.info(f"Отправка письма на {recipient.email}")
-                    send_mail(
-                        subject=mailing.message,
-                        message=mailing.message.message,
-                        from_email=DEFAULT_FROM_EMAIL,
-                        recipient_list=[recipient.email],
-                    )
-                    status = MailingAttempt.SUCCESS
-                    response = f"{recipient.email}: Успешно отправлено"
-                    logger.info(response)
-
-                except Exception as e:
-                    status = MailingAttempt.FAILURE
-                    response = f"{recipient.email}: Ошибка: {str(e)}"
-                    logger.error(response)
-
-                MailingAttempt.objects.create(
-                    attempted_at=timezone.now(),
-                    status=status,
-                    mail_server_response=response,
-                    mailing=mailing,
-                )
-
-            mailing.status = Mailing.COMPLETED
-            mailing.save()
+        # Команду можно запускать одновременно на нескольких узлах: рассылки и пачки
+        # получателей захватываются с блокировкой SKIP LOCKED и ограниченным сроком
+        worker_id = get_worker_id()
+        start_mailings(mailings)
+        for mailing in Mailing.objects.filter(status=Mailing.RUNNING).select_related("message"):
+            send_claimed(mailing, kwargs["engine"], worker_id=worker_id, **options)
@@ -0,0 +1,45 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from mailing.smtp_sink import SMTPSink
+
+
+def add_fault_arguments(parser):
+    """Добавляет параметры имитации сбоев SMTP-заглушки."""
+    parser.add_argument("--latency", type=float, default=0, help="Задержка ответа на каждую команду, в секундах")
+    parser.add_argument("--temp-failure-rate", type=float, default=0, help="Доля ответов 451 на RCPT TO")
+    parser.add_argument("--perm-failure-rate", type=float, default=0, help="Доля ответов 550 на RCPT TO")
+    parser.add_argument("--drop-rate", type=float, default=0, help="Доля разрывов соединения на RCPT TO")
+    parser.add_argument("--seed", type=int, default=None, help="Начальное значение генератора сбоев")
+
+
+def fault_options(kwargs):
+    """Возвращает параметры имитации сбоев для SMTPSink из аргументов команды."""
+    return {
+        name: kwargs[name]
+        for name in ("latency", "temp_failure_rate", "perm_failure_rate", "drop_rate", "seed")
+    }
+
+
+class Command(BaseCommand):
+    help = "Запуск локальной SMTP-заглушки для замеров скорости отправки"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1", help="Адрес для приема соединений")
+        parser.add_argument("--port", type=int, default=1025, help="Порт для приема соединений")
+        add_fault_arguments(parser)
+
+    def handle(self, *args, **kwargs):
+        sink = SMTPSink(host=kwargs["host"], port=kwargs["port"], **fault_options(kwargs))
+        self.stdout.write(
+            self.style.SUCCESS(f"SMTP-заглушка слушает {sink.host}:{sink.port}, остановка - CTRL+C")
+        )
+        try:
+            asyncio.run(sink.serve_forever())
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(
+            f"Принято писем: {sink.messages}, отказов 4xx: {sink.temp_failures}, "
+            f"отказов 5xx: {sink.perm_failures}, разрывов: {sink.drops}"
+        )
@@ -0,0 +1,98 @@
+# Generated by Django 5.2 on 2026-10-18 14:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0009_alter_mailing_finish_send_at_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecipientDelivery",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Ожидает отправки"),
+                            ("sent", "Отправлено"),
+                            ("failed", "Не отправлено"),
+                        ],
+                        default="pending",
+                        max_length=7,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "attempt_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Количество попыток"
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(
+                        blank=True, null=True, verbose_name="Последняя ошибка"
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True, verbose_name="Дата и время изменения"
+                    ),
+                ),
+                (
+                    "mailing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="deliveries",
+                        to="mailing.mailing",
+                        verbose_name="Рассылка",
+                    ),
+                ),
+                (
+                    "recipient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="deliveries",
+                        to="mailing.recipient",
+                        verbose_name="Получатель",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Доставка рассылки",
+                "verbose_name_plural": "Доставки рассылки",
+                "ordering": ["id"],
+                "indexes": [
+                    models.Index(
+                        fields=["mailing", "status"], name="delivery_mailing_status_idx"
+                    ),
+                    models.Index(
+                        condition=models.Q(("status", "pending")),
+                        fields=["mailing", "id"],
+                        name="delivery_pending_idx",
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("mailing", "recipient"),
+                        name="unique_delivery_mailing_recipient",
+                    )
+                ],
+            },
+        ),
+    ]
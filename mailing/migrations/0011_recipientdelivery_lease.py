@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 14:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0010_recipientdelivery"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipientdelivery",
+            name="lease_expires_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Дата и время окончания захвата"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipientdelivery",
+            name="leased_by",
+            field=models.CharField(
+                blank=True,
+                max_length=255,
+                null=True,
+                verbose_name="Обработчик, захвативший отправку",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0011_recipientdelivery_lease"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Дата изменения"),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 14:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0012_message_updated_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="mailing",
+            index=models.Index(
+                fields=["status", "first_send_at"], name="mailing_status_first_send_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="mailing",
+            index=models.Index(
+                fields=["status", "finish_send_at"], name="mailing_status_finish_idx"
+            ),
+        ),
+    ]
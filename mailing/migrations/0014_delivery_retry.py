@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-18 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0013_mailing_schedule_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipientdelivery",
+            name="next_attempt_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Дата и время повторной отправки"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="mailingattempt",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("success", "Успешно"),
+                    ("failure", "Не успешно"),
+                    ("retry", "Временная ошибка, повтор"),
+                ],
+                max_length=7,
+                verbose_name="Статус",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipientdelivery",
+            index=models.Index(
+                condition=models.Q(
+                    ("next_attempt_at__isnull", False), ("status", "pending")
+                ),
+                fields=["next_attempt_at"],
+                name="delivery_retry_idx",
+            ),
+        ),
+    ]
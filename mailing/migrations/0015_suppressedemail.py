@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-18 14:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0014_delivery_retry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SuppressedEmail",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "email",
+                    models.CharField(max_length=254, unique=True, verbose_name="Почта"),
+                ),
+                (
+                    "reason",
+                    models.TextField(blank=True, null=True, verbose_name="Причина"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True,
+                        db_index=True,
+                        verbose_name="Дата и время добавления",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Адрес в списке подавления",
+                "verbose_name_plural": "Список подавления",
+                "ordering": ["id"],
+            },
+        ),
+    ]
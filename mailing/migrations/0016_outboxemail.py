@@ -0,0 +1,125 @@
+# Generated by Django 5.2 on 2026-10-18 14:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0015_suppressedemail"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboxEmail",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "dedup_key",
+                    models.CharField(
+                        max_length=255, unique=True, verbose_name="Ключ дедупликации"
+                    ),
+                ),
+                ("subject", models.TextField(verbose_name="Тема письма")),
+                ("message", models.TextField(verbose_name="Текст письма")),
+                (
+                    "html_message",
+                    models.TextField(
+                        blank=True, null=True, verbose_name="HTML-версия письма"
+                    ),
+                ),
+                (
+                    "from_email",
+                    models.CharField(
+                        blank=True,
+                        max_length=254,
+                        null=True,
+                        verbose_name="Отправитель",
+                    ),
+                ),
+                ("recipients", models.JSONField(verbose_name="Получатели")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Ожидает отправки"),
+                            ("sent", "Отправлено"),
+                            ("failed", "Не отправлено"),
+                        ],
+                        default="pending",
+                        max_length=7,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "attempt_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Количество попыток"
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(
+                        blank=True, null=True, verbose_name="Последняя ошибка"
+                    ),
+                ),
+                (
+                    "leased_by",
+                    models.CharField(
+                        blank=True,
+                        max_length=255,
+                        null=True,
+                        verbose_name="Обработчик, захвативший отправку",
+                    ),
+                ),
+                (
+                    "lease_expires_at",
+                    models.DateTimeField(
+                        blank=True,
+                        null=True,
+                        verbose_name="Дата и время окончания захвата",
+                    ),
+                ),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(
+                        blank=True,
+                        null=True,
+                        verbose_name="Дата и время повторной отправки",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата и время создания"
+                    ),
+                ),
+                (
+                    "sent_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Дата и время отправки"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Служебное письмо",
+                "verbose_name_plural": "Исходящие служебные письма",
+                "ordering": ["id"],
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status", "pending")),
+                        fields=["id"],
+                        name="outbox_pending_idx",
+                    )
+                ],
+            },
+        ),
+    ]
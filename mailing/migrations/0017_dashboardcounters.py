@@ -0,0 +1,142 @@
+# Generated by Django 5.2 on 2026-10-18 14:58
+
+from collections import Counter, defaultdict
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+ATTEMPT_FIELDS = {
+    "success": "attempt_success",
+    "failure": "attempt_failure",
+    "retry": "attempt_retry",
+}
+MAILING_FIELDS = {
+    "created": "mailing_created",
+    "running": "mailing_running",
+    "completed": "mailing_completed",
+}
+
+
+def fill_counters(apps, schema_editor):
+    """Заполняет счетчики главной страницы по существующим данным."""
+    DashboardCounters = apps.get_model("mailing", "DashboardCounters")
+    Mailing = apps.get_model("mailing", "Mailing")
+    MailingAttempt = apps.get_model("mailing", "MailingAttempt")
+    Recipient = apps.get_model("mailing", "Recipient")
+    rows = defaultdict(Counter)
+    for owner_id, status, total in (
+        MailingAttempt.objects.values_list("mailing__owner", "status")
+        .annotate(total=Count("id"))
+        .order_by()
+    ):
+        rows[owner_id][ATTEMPT_FIELDS[status]] += total
+    for owner_id, status, total in (
+        Mailing.objects.values_list("owner", "status")
+        .annotate(total=Count("id"))
+        .order_by()
+    ):
+        if status in MAILING_FIELDS:
+            rows[owner_id][MAILING_FIELDS[status]] += total
+    for owner_id, total in (
+        Recipient.objects.values_list("owner").annotate(total=Count("id")).order_by()
+    ):
+        rows[owner_id]["recipients"] += total
+    totals = Counter()
+    for owner_counts in rows.values():
+        totals.update(owner_counts)
+    DashboardCounters.objects.bulk_create(
+        [DashboardCounters(owner_id=None, **totals)]
+        + [
+            DashboardCounters(owner_id=owner_id, **counts)
+            for owner_id, counts in rows.items()
+            if owner_id is not None
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0016_outboxemail"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DashboardCounters",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "attempt_success",
+                    models.BigIntegerField(default=0, verbose_name="Успешных попыток"),
+                ),
+                (
+                    "attempt_failure",
+                    models.BigIntegerField(
+                        default=0, verbose_name="Неуспешных попыток"
+                    ),
+                ),
+                (
+                    "attempt_retry",
+                    models.BigIntegerField(
+                        default=0, verbose_name="Попыток с временной ошибкой"
+                    ),
+                ),
+                (
+                    "mailing_created",
+                    models.BigIntegerField(
+                        default=0, verbose_name="Созданных рассылок"
+                    ),
+                ),
+                (
+                    "mailing_running",
+                    models.BigIntegerField(
+                        default=0, verbose_name="Запущенных рассылок"
+                    ),
+                ),
+                (
+                    "mailing_completed",
+                    models.BigIntegerField(
+                        default=0, verbose_name="Завершенных рассылок"
+                    ),
+                ),
+                (
+                    "recipients",
+                    models.BigIntegerField(default=0, verbose_name="Получателей"),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="dashboard_counters",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Владелец",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Счетчики главной страницы",
+                "verbose_name_plural": "Счетчики главной страницы",
+                "constraints": [
+                    models.UniqueConstraint(
+                        django.db.models.functions.comparison.Coalesce("owner", 0),
+                        name="unique_dashboard_counters_owner",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
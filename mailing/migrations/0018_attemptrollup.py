@@ -0,0 +1,139 @@
+# Generated by Django 5.2 on 2026-10-18 15:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0017_dashboardcounters"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RollupWatermark",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        max_length=50, unique=True, verbose_name="Название"
+                    ),
+                ),
+                (
+                    "last_id",
+                    models.BigIntegerField(
+                        default=0, verbose_name="Последняя учтенная попытка"
+                    ),
+                ),
+                (
+                    "seen_id",
+                    models.BigIntegerField(
+                        default=0, verbose_name="Последняя замеченная попытка"
+                    ),
+                ),
+                (
+                    "seen_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Дата и время замера"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Отметка построения сводок",
+                "verbose_name_plural": "Отметки построения сводок",
+            },
+        ),
+        migrations.CreateModel(
+            name="AttemptRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("hour", "Час"), ("day", "Сутки")],
+                        max_length=4,
+                        verbose_name="Период",
+                    ),
+                ),
+                ("bucket", models.DateTimeField(verbose_name="Начало периода")),
+                (
+                    "success",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Успешных попыток"
+                    ),
+                ),
+                (
+                    "failure",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Неуспешных попыток"
+                    ),
+                ),
+                (
+                    "retry",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Попыток с временной ошибкой"
+                    ),
+                ),
+                (
+                    "mailing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rollups",
+                        to="mailing.mailing",
+                        verbose_name="Рассылка",
+                    ),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="attempt_rollups",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Владелец рассылки",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Сводка попыток рассылки",
+                "verbose_name_plural": "Сводки попыток рассылки",
+                "ordering": ["period", "bucket", "mailing"],
+                "indexes": [
+                    models.Index(
+                        fields=["owner", "period", "bucket"],
+                        name="rollup_owner_period_idx",
+                    ),
+                    models.Index(
+                        fields=["period", "bucket"], name="rollup_period_bucket_idx"
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("period", "bucket", "mailing"),
+                        name="unique_rollup_period_bucket_mailing",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
 from django.db import models
+from django.db.models.functions import Coalesce
 from users.models import CustomUser
 
 
@@ -42,6 +43,7 @@ class Message(models.Model):
         related_name="message_owner",
         verbose_name="Владелец",
     )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
 
     def __str__(self):
         return self.title
@@ -111,15 +113,21 @@ class Mailing(models.Model):
         verbose_name_plural = "Рассылки"
         ordering = ["id"]
         permissions = [("can_cancel_mailing", "Can cancel mailing")]
+        indexes = [
+            models.Index(fields=["status", "first_send_at"], name="mailing_status_first_send_idx"),
+            models.Index(fields=["status", "finish_send_at"], name="mailing_status_finish_idx"),
+        ]
 
 
 class MailingAttempt(models.Model):
     SUCCESS = "success"
     FAILURE = "failure"
+    RETRY = "retry"
 
     STATUS_CHOICES = [
         (SUCCESS, "Успешно"),
         (FAILURE, "Не успешно"),
+        (RETRY, "Временная ошибка, повтор"),
     ]
 
     attempted_at = models.DateTimeField(verbose_name="Дата и время попытки отправки")
@@ -143,3 +151,243 @@ class MailingAttempt(models.Model):
         verbose_name = "Попытка рассылки"
         verbose_name_plural = "Попытки рассылки"
         ordering = ["id"]
+
+
+class RecipientDelivery(models.Model):
+    """Модель состояния доставки рассылки получателю"""
+
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (PENDING, "Ожидает отправки"),
+        (SENT, "Отправлено"),
+        (FAILED, "Не отправлено"),
+    ]
+
+    mailing = models.ForeignKey(
+        Mailing,
+        on_delete=models.CASCADE,
+        related_name="deliveries",
+        verbose_name="Рассылка",
+    )
+    recipient = models.ForeignKey(
+        Recipient,
+        on_delete=models.CASCADE,
+        related_name="deliveries",
+        verbose_name="Получатель",
+    )
+    status = models.CharField(
+        max_length=7, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус"
+    )
+    attempt_count = models.PositiveIntegerField(default=0, verbose_name="Количество попыток")
+    last_error = models.TextField(null=True, blank=True, verbose_name="Последняя ошибка")
+    leased_by = models.CharField(
+        max_length=255, null=True, blank=True, verbose_name="Обработчик, захвативший отправку"
+    )
+    lease_expires_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="Дата и время окончания захвата"
+    )
+    next_attempt_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="Дата и время повторной отправки"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата и время изменения")
+
+    def __str__(self):
+        return f"{self.mailing_id} - {self.recipient_id}: {self.status}"
+
+    class Meta:
+        verbose_name = "Доставка рассылки"
+        verbose_name_plural = "Доставки рассылки"
+        ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["mailing", "recipient"], name="unique_delivery_mailing_recipient"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["mailing", "status"], name="delivery_mailing_status_idx"),
+            models.Index(
+                fields=["mailing", "id"],
+                condition=models.Q(status="pending"),
+                name="delivery_pending_idx",
+            ),
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=models.Q(status="pending", next_attempt_at__isnull=False),
+                name="delivery_retry_idx",
+            ),
+        ]
+
+
+class SuppressedEmail(models.Model):
+    """Модель адреса в списке подавления: письма на него не отправляются"""
+
+    email = models.CharField(max_length=254, unique=True, verbose_name="Почта")
+    reason = models.TextField(null=True, blank=True, verbose_name="Причина")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Дата и время добавления")
+
+    def __str__(self):
+        return self.email
+
+    class Meta:
+        verbose_name = "Адрес в списке подавления"
+        verbose_name_plural = "Список подавления"
+        ordering = ["id"]
+
+
+class OutboxEmail(models.Model):
+    """Модель служебного письма в исходящей очереди: записывается в одной транзакции с изменением данных"""
+
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (PENDING, "Ожидает отправки"),
+        (SENT, "Отправлено"),
+        (FAILED, "Не отправлено"),
+    ]
+
+    dedup_key = models.CharField(max_length=255, unique=True, verbose_name="Ключ дедупликации")
+    subject = models.TextField(verbose_name="Тема письма")
+    message = models.TextField(verbose_name="Текст письма")
+    html_message = models.TextField(null=True, blank=True, verbose_name="HTML-версия письма")
+    from_email = models.CharField(max_length=254, null=True, blank=True, verbose_name="Отправитель")
+    recipients = models.JSONField(verbose_name="Получатели")
+    status = models.CharField(
+        max_length=7, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус"
+    )
+    attempt_count = models.PositiveIntegerField(default=0, verbose_name="Количество попыток")
+    last_error = models.TextField(null=True, blank=True, verbose_name="Последняя ошибка")
+    leased_by = models.CharField(
+        max_length=255, null=True, blank=True, verbose_name="Обработчик, захвативший отправку"
+    )
+    lease_expires_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="Дата и время окончания захвата"
+    )
+    next_attempt_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="Дата и время повторной отправки"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата и время создания")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата и время отправки")
+
+    def __str__(self):
+        return f"{self.dedup_key}: {self.status}"
+
+    class Meta:
+        verbose_name = "Служебное письмо"
+        verbose_name_plural = "Исходящие служебные письма"
+        ordering = ["id"]
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(status="pending"),
+                name="outbox_pending_idx",
+            ),
+        ]
+
+
+class DashboardCounters(models.Model):
+    """Модель счетчиков главной страницы: строка владельца или общая строка (без владельца)"""
+
+    owner = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="dashboard_counters",
+        verbose_name="Владелец",
+    )
+    attempt_success = models.BigIntegerField(default=0, verbose_name="Успешных попыток")
+    attempt_failure = models.BigIntegerField(default=0, verbose_name="Неуспешных попыток")
+    attempt_retry = models.BigIntegerField(default=0, verbose_name="Попыток с временной ошибкой")
+    mailing_created = models.BigIntegerField(default=0, verbose_name="Созданных рассылок")
+    mailing_running = models.BigIntegerField(default=0, verbose_name="Запущенных рассылок")
+    mailing_completed = models.BigIntegerField(default=0, verbose_name="Завершенных рассылок")
+    recipients = models.BigIntegerField(default=0, verbose_name="Получателей")
+
+    @property
+    def attempt_count(self):
+        return self.attempt_success + self.attempt_failure + self.attempt_retry
+
+    @property
+    def mailing_count(self):
+        return self.mailing_created + self.mailing_running + self.mailing_completed
+
+    def __str__(self):
+        return f"Счетчики {self.owner_id or 'всех пользователей'}"
+
+    class Meta:
+        verbose_name = "Счетчики главной страницы"
+        verbose_name_plural = "Счетчики главной страницы"
+        constraints = [
+            # Одна строка на владельца и одна общая строка
+            models.UniqueConstraint(Coalesce("owner", 0), name="unique_dashboard_counters_owner"),
+        ]
+
+
+class AttemptRollup(models.Model):
+    """Модель сводки попыток рассылки за час или сутки: количество попыток по статусам"""
+
+    HOUR = "hour"
+    DAY = "day"
+
+    PERIOD_CHOICES = [
+        (HOUR, "Час"),
+        (DAY, "Сутки"),
+    ]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES, verbose_name="Период")
+    bucket = models.DateTimeField(verbose_name="Начало периода")
+    mailing = models.ForeignKey(
+        Mailing,
+        on_delete=models.CASCADE,
+        related_name="rollups",
+        verbose_name="Рассылка",
+    )
+    owner = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="attempt_rollups",
+        verbose_name="Владелец рассылки",
+    )
+    success = models.PositiveIntegerField(default=0, verbose_name="Успешных попыток")
+    failure = models.PositiveIntegerField(default=0, verbose_name="Неуспешных попыток")
+    retry = models.PositiveIntegerField(default=0, verbose_name="Попыток с временной ошибкой")
+
+    def __str__(self):
+        return f"{self.mailing_id} - {self.period} {self.bucket}"
+
+    class Meta:
+        verbose_name = "Сводка попыток рассылки"
+        verbose_name_plural = "Сводки попыток рассылки"
+        ordering = ["period", "bucket", "mailing"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["period", "bucket", "mailing"], name="unique_rollup_period_bucket_mailing"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["owner", "period", "bucket"], name="rollup_owner_period_idx"),
+            models.Index(fields=["period", "bucket"], name="rollup_period_bucket_idx"),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """Модель отметки обработанных попыток рассылки при построении сводок"""
+
+    name = models.CharField(max_length=50, unique=True, verbose_name="Название")
+    last_id = models.BigIntegerField(default=0, verbose_name="Последняя учтенная попытка")
+    seen_id = models.BigIntegerField(default=0, verbose_name="Последняя замеченная попытка")
+    seen_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата и время замера")
+
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
+
+    class Meta:
+        verbose_name = "Отметка построения сводок"
+        verbose_name_plural = "Отметки построения сводок"
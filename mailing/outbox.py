@@ -0,0 +1,185 @@
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.utils import DNS_NAME
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from mailing.leasing import get_worker_id
+from mailing.models import MailingAttempt, OutboxEmail
+from mailing.retry import classify_error, is_outage_error, next_attempt_at
+from mailing.transactional import get_transactional_connection
+
+logger = logging.getLogger(__name__)
+
+
+def add_to_outbox(dedup_key, subject, message, recipient_list, from_email=None, html_message=None):
+    """
+    Записывает служебное письмо в исходящую очередь.
+
+    Функция вызывается в транзакции изменения, ради которого отправляется письмо: если
+    транзакция откатится, письмо не будет отправлено. Письмо с уже записанным ключом
+    дедупликации повторно не добавляется (например, при повторной отправке формы).
+
+    Параметры:
+    dedup_key (str): Ключ дедупликации письма.
+    subject (str): Тема письма.
+    message (str): Текст письма.
+    recipient_list (list[str]): Адреса получателей.
+    from_email (str, optional): Адрес отправителя (DEFAULT_FROM_EMAIL).
+    html_message (str, optional): HTML-версия письма.
+
+    Возвращает:
+    bool: True, если письмо добавлено, False - если письмо с таким ключом уже есть.
+    """
+    _, created = OutboxEmail.objects.get_or_create(
+        dedup_key=dedup_key,
+        defaults={
+            "subject": subject,
+            "message": message,
+            "html_message": html_message,
+            "from_email": from_email,
+            "recipients": list(recipient_list),
+        },
+    )
+    return created
+
+
+def claim_outbox(worker_id, batch_size=None, lease_seconds=None):
+    """
+    Захватывает пачку ожидающих отправки служебных писем в порядке их записи.
+
+    Строки блокируются через SELECT ... FOR UPDATE SKIP LOCKED и помечаются захватом
+    с ограниченным сроком, как состояния доставки рассылок (см. mailing.leasing).
+
+    Параметры:
+    worker_id (str): Идентификатор обработчика.
+    batch_size (int, optional): Размер пачки (MAILING_OUTBOX_BATCH_SIZE).
+    lease_seconds (int, optional): Срок захвата в секундах (MAILING_LEASE_SECONDS).
+
+    Возвращает:
+    list[OutboxEmail]: Захваченные письма, упорядоченные по id.
+    """
+    batch_size = batch_size or settings.MAILING_OUTBOX_BATCH_SIZE
+    lease_seconds = lease_seconds or settings.MAILING_LEASE_SECONDS
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEmail.PENDING)
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+            .filter(Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now))
+            .order_by("id")[:batch_size]
+        )
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            leased_by=worker_id,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+        )
+    return emails
+
+
+def build_outbox_message(email, connection=None):
+    """
+    Создает письмо Django из записи исходящей очереди.
+
+    Message-ID письма вычисляется из ключа дедупликации: повторная отправка после сбоя
+    (доставка "хотя бы один раз") дает письмо с тем же Message-ID.
+
+    Параметры:
+    email (OutboxEmail): Запись исходящей очереди.
+    connection (BaseEmailBackend, optional): Соединение почтового бэкенда.
+
+    Возвращает:
+    EmailMultiAlternatives: Письмо.
+    """
+    digest = hashlib.sha256(email.dedup_key.encode()).hexdigest()[:32]
+    message = EmailMultiAlternatives(
+        email.subject,
+        email.message,
+        email.from_email or settings.DEFAULT_FROM_EMAIL,
+        email.recipients,
+        connection=connection,
+        headers={"Message-ID": f"<{digest}@{DNS_NAME}>"},
+    )
+    if email.html_message:
+        message.attach_alternative(email.html_message, "text/html")
+    return message
+
+
+def relay_outbox(batch_size=None, worker_id=None):
+    """
+    Отправляет ожидающие служебные письма пачками через соединение служебных писем.
+
+    Письма захватываются в порядке записи, каждое отмечается отправленным сразу после
+    ответа сервера. Порядок доставки не гарантируется: временная ошибка откладывает письмо
+    по расписанию повторов (не больше TRANSACTIONAL_EMAIL_MAX_RETRIES попыток), и оно уходит
+    после более поздних писем, чтобы одно письмо не задерживало остальные. Постоянная ошибка
+    отмечает письмо неотправленным. При недоступности сервера отправка прерывается, а захват
+    оставшихся писем снимается, чтобы их отправил следующий запуск.
+
+    Параметры:
+    batch_size (int, optional): Размер пачки (MAILING_OUTBOX_BATCH_SIZE).
+    worker_id (str, optional): Идентификатор обработчика.
+
+    Возвращает:
+    int: Количество отправленных писем.
+    """
+    worker_id = worker_id or get_worker_id()
+    sent = 0
+    while True:
+        emails = claim_outbox(worker_id, batch_size)
+        if not emails:
+            return sent
+        connection = get_transactional_connection()
+        try:
+            connection.open()
+        except Exception as error:
+            logger.warning(f"Сервер служебных писем недоступен: {error}")
+            _release([email.pk for email in emails])
+            return sent
+        try:
+            for position, email in enumerate(emails):
+                try:
+                    build_outbox_message(email, connection).send()
+                except Exception as error:
+                    _record_failure(email, error)
+                    if is_outage_error(error):
+                        _release([other.pk for other in emails[position + 1:]])
+                        return sent
+                    continue
+                OutboxEmail.objects.filter(pk=email.pk).update(
+                    status=OutboxEmail.SENT,
+                    attempt_count=email.attempt_count + 1,
+                    sent_at=timezone.now(),
+                    leased_by=None,
+                    lease_expires_at=None,
+                )
+                sent += 1
+        finally:
+            connection.close()
+
+
+def _record_failure(email, error):
+    attempt_count = email.attempt_count + 1
+    retry = (
+        classify_error(error) == MailingAttempt.RETRY
+        and attempt_count < settings.TRANSACTIONAL_EMAIL_MAX_RETRIES
+    )
+    OutboxEmail.objects.filter(pk=email.pk).update(
+        status=OutboxEmail.PENDING if retry else OutboxEmail.FAILED,
+        attempt_count=attempt_count,
+        last_error=str(error),
+        next_attempt_at=next_attempt_at(attempt_count) if retry else None,
+        leased_by=None,
+        lease_expires_at=None,
+    )
+    logger.warning(f"Служебное письмо {email.dedup_key}: ошибка отправки {error}")
+
+
+def _release(email_ids):
+    if email_ids:
+        OutboxEmail.objects.filter(pk__in=email_ids).update(leased_by=None, lease_expires_at=None)
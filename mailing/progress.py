@@ -0,0 +1,63 @@
+from django.core.cache import cache
+
+PROGRESS_TIMEOUT = 60 * 60 * 24
+
+
+def _key(mailing_id, name):
+    return f"mailing_progress/{mailing_id}/{name}"
+
+
+def reset_mailing_progress(mailing_id: int, total: int, success: int = 0, failure: int = 0) -> None:
+    """
+    Устанавливает начальные значения счетчиков хода отправки рассылки.
+
+    Параметры:
+    mailing_id (int): Идентификатор рассылки.
+    total (int): Общее количество получателей.
+    success (int): Количество уже отправленных писем (при продолжении отправки).
+    failure (int): Количество уже неотправленных писем (при продолжении отправки).
+    """
+    cache.set_many(
+        {
+            _key(mailing_id, "total"): total,
+            _key(mailing_id, "success"): success,
+            _key(mailing_id, "failure"): failure,
+        },
+        PROGRESS_TIMEOUT,
+    )
+
+
+def add_mailing_progress(mailing_id: int, success: int = 0, failure: int = 0) -> None:
+    """
+    Увеличивает счетчики успешных и неуспешных отправок рассылки.
+
+    Параметры:
+    mailing_id (int): Идентификатор рассылки.
+    success (int): Количество успешных отправок.
+    failure (int): Количество неуспешных отправок.
+    """
+    for name, delta in (("success", success), ("failure", failure)):
+        if delta:
+            try:
+                cache.incr(_key(mailing_id, name), delta)
+            except ValueError:
+                # Отправка запущена без сброса счетчиков (например, командой sand_mail)
+                cache.set(_key(mailing_id, name), delta, PROGRESS_TIMEOUT)
+
+
+def get_mailing_progress(mailing_id: int) -> dict:
+    """
+    Возвращает ход отправки рассылки.
+
+    Параметры:
+    mailing_id (int): Идентификатор рассылки.
+
+    Возвращает:
+    dict: Общее количество получателей (total), количество успешных (success)
+          и неуспешных (failure) отправок, а также количество обработанных получателей (done).
+    """
+    names = ("total", "success", "failure")
+    values = cache.get_many([_key(mailing_id, name) for name in names])
+    progress = {name: values.get(_key(mailing_id, name)) or 0 for name in names}
+    progress["done"] = progress["success"] + progress["failure"]
+    return progress
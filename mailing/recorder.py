@@ -0,0 +1,266 @@
+import logging
+import time
+from collections import Counter
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from mailing.counters import add_attempt_counters
+from mailing.models import MailingAttempt, RecipientDelivery
+from mailing.progress import add_mailing_progress
+from mailing.retry import next_attempt_at
+from mailing.suppression import suppress
+
+logger = logging.getLogger(__name__)
+
+
+class AttemptRecorder:
+    """
+    Буферизованная запись попыток рассылки.
+
+    Попытки накапливаются в памяти и записываются одним bulk_create вместе с состояниями
+    доставки, списком подавления и счетчиками, когда в буфере набирается max_rows записей
+    или с прошлой записи прошло max_interval секунд (время проверяется при добавлении попытки).
+    Если запись не удалась, попытки возвращаются в буфер.
+    """
+
+    def __init__(self, max_rows=None, max_interval=None, worker_id=None):
+        """
+        Параметры:
+        max_rows (int, optional): Размер буфера, при котором выполняется запись.
+            По умолчанию берется из настройки MAILING_ATTEMPT_FLUSH_SIZE.
+        max_interval (float, optional): Время хранения попыток в буфере, после которого
+            следующая добавленная попытка запускает запись, в секундах.
+            По умолчанию берется из настройки MAILING_ATTEMPT_FLUSH_INTERVAL.
+        worker_id (str, optional): Обработчик, захват получателей которого продлевается при записи.
+        """
+        self.max_rows = max_rows or settings.MAILING_ATTEMPT_FLUSH_SIZE
+        self.max_interval = max_interval or settings.MAILING_ATTEMPT_FLUSH_INTERVAL
+        self.worker_id = worker_id
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aflush()
+        return False
+
+    def add(self, mailing, status, response, attempted_at=None, delivery_id=None):
+        """
+        Добавляет попытку рассылки в буфер.
+
+        Параметры:
+        mailing (Mailing): Рассылка.
+        status (str): Статус попытки.
+        response (str): Ответ почтового сервера.
+        attempted_at (datetime, optional): Время попытки. По умолчанию - текущее время.
+        delivery_id (int, optional): Идентификатор состояния доставки получателю.
+        """
+        self._append(mailing, status, response, attempted_at, delivery_id)
+        if self._is_full():
+            self.flush()
+
+    async def aadd(self, mailing, status, response, attempted_at=None, delivery_id=None):
+        """Асинхронная версия add()."""
+        self._append(mailing, status, response, attempted_at, delivery_id)
+        if self._is_full():
+            await self.aflush()
+
+    def add_result(self, mailing, result):
+        """
+        Добавляет в буфер попытку по результату отправки движка.
+
+        Параметры:
+        mailing (Mailing): Рассылка.
+        result (SendResult): Результат отправки адресату.
+        """
+        self._append_result(mailing, result)
+        if self._is_full():
+            self.flush()
+
+    async def aadd_result(self, mailing, result):
+        """Асинхронная версия add_result()."""
+        self._append_result(mailing, result)
+        if self._is_full():
+            await self.aflush()
+
+    def flush(self):
+        """
+        Записывает накопленные попытки в базу данных.
+
+        Возвращает:
+        int: Количество записанных попыток.
+        """
+        return self._write(self._take())
+
+    async def aflush(self):
+        """Асинхронная версия flush()."""
+        return await sync_to_async(self._write)(self._take())
+
+    def _write(self, entries):
+        if not entries:
+            return 0
+        attempts = [attempt for attempt, _, _ in entries]
+        try:
+            with transaction.atomic():
+                attempt_counts = self._limit_retries(entries)
+                MailingAttempt.objects.bulk_create(attempts, batch_size=self.max_rows)
+                self._update_deliveries(entries, attempt_counts)
+                self._renew_leases(attempts)
+                suppress(
+                    (email, attempt.mail_server_response) for attempt, _, email in entries if email is not None
+                )
+                add_attempt_counters(attempts)
+        except Exception:
+            self._restore(entries)
+            raise
+        self._update_progress(attempts)
+        logger.info(f"Записано попыток рассылки: {len(attempts)}")
+        return len(attempts)
+
+    def _append(self, mailing, status, response, attempted_at, delivery_id, bounced_email=None):
+        attempt = MailingAttempt(
+            attempted_at=attempted_at or timezone.now(),
+            status=status,
+            mail_server_response=response,
+            mailing=mailing,
+        )
+        self._buffer.append((attempt, delivery_id, bounced_email))
+
+    def _append_result(self, mailing, result):
+        envelope = result.envelope
+        bounced_email = envelope.email if result.bounced else None
+        self._append(mailing, result.status, result.response, None, envelope.id, bounced_email)
+
+    def _is_full(self):
+        return (
+            len(self._buffer) >= self.max_rows
+            or time.monotonic() - self._last_flush >= self.max_interval
+        )
+
+    @staticmethod
+    def _limit_retries(entries):
+        """
+        Переводит временные ошибки в постоянные, если попытки получателя исчерпаны.
+
+        Возвращает:
+        dict[int, int]: Количество попыток по идентификаторам состояний доставки с временной ошибкой.
+        """
+        retry_ids = [
+            delivery_id
+            for attempt, delivery_id, _ in entries
+            if delivery_id is not None and attempt.status == MailingAttempt.RETRY
+        ]
+        if not retry_ids:
+            return {}
+        attempt_counts = dict(
+            RecipientDelivery.objects.filter(pk__in=retry_ids).values_list("id", "attempt_count")
+        )
+        for attempt, delivery_id, _ in entries:
+            if attempt.status != MailingAttempt.RETRY:
+                continue
+            # Без состояния доставки повторить отправку некому
+            if delivery_id is None or attempt_counts.get(delivery_id, 0) + 1 >= settings.MAILING_MAX_ATTEMPTS:
+                attempt.status = MailingAttempt.FAILURE
+        return attempt_counts
+
+    def _update_deliveries(self, entries, attempt_counts):
+        sent_ids = [
+            delivery_id
+            for attempt, delivery_id, _ in entries
+            if delivery_id is not None and attempt.status == MailingAttempt.SUCCESS
+        ]
+        if sent_ids:
+            RecipientDelivery.objects.filter(pk__in=sent_ids).update(
+                status=RecipientDelivery.SENT,
+                attempt_count=F("attempt_count") + 1,
+                last_error=None,
+                leased_by=None,
+                lease_expires_at=None,
+                next_attempt_at=None,
+                updated_at=timezone.now(),
+            )
+        # Постоянная ошибка завершает доставку, временная возвращает получателя в очередь
+        # с задержкой: повтор не блокирует основную отправку
+        now = timezone.now()
+        failed = [
+            RecipientDelivery(
+                pk=delivery_id,
+                status=(
+                    RecipientDelivery.PENDING
+                    if attempt.status == MailingAttempt.RETRY
+                    else RecipientDelivery.FAILED
+                ),
+                attempt_count=F("attempt_count") + 1,
+                last_error=attempt.mail_server_response,
+                leased_by=None,
+                lease_expires_at=None,
+                next_attempt_at=(
+                    next_attempt_at(attempt_counts[delivery_id] + 1, now)
+                    if attempt.status == MailingAttempt.RETRY
+                    else None
+                ),
+                updated_at=now,
+            )
+            for attempt, delivery_id, _ in entries
+            if delivery_id is not None and attempt.status != MailingAttempt.SUCCESS
+        ]
+        if failed:
+            RecipientDelivery.objects.bulk_update(
+                failed,
+                [
+                    "status",
+                    "attempt_count",
+                    "last_error",
+                    "leased_by",
+                    "lease_expires_at",
+                    "next_attempt_at",
+                    "updated_at",
+                ],
+                batch_size=self.max_rows,
+            )
+
+    def _renew_leases(self, attempts):
+        if self.worker_id is None:
+            return
+        RecipientDelivery.objects.filter(
+            mailing_id__in={attempt.mailing_id for attempt in attempts},
+            status=RecipientDelivery.PENDING,
+            leased_by=self.worker_id,
+        ).update(lease_expires_at=timezone.now() + timedelta(seconds=settings.MAILING_LEASE_SECONDS))
+
+    @staticmethod
+    def _update_progress(attempts):
+        counts = Counter((attempt.mailing_id, attempt.status) for attempt in attempts)
+        for mailing_id in {mailing_id for mailing_id, _ in counts}:
+            add_mailing_progress(
+                mailing_id,
+                success=counts[(mailing_id, MailingAttempt.SUCCESS)],
+                failure=counts[(mailing_id, MailingAttempt.FAILURE)],
+            )
+
+    def _take(self):
+        attempts, self._buffer = self._buffer, []
+        self._last_flush = time.monotonic()
+        return attempts
+
+    def _restore(self, entries):
+        # Транзакция откатилась: попытки снова вставляются при следующей записи
+        for attempt, _, _ in entries:
+            attempt.pk = None
+            attempt._state.adding = True
+        self._buffer[:0] = entries
+        logger.warning(f"Попытки рассылки не записаны и возвращены в буфер: {len(entries)}")
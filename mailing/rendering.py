@@ -0,0 +1,349 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, make_msgid
+
+from django.conf import settings
+from django.core import signing
+from django.core.mail import EmailMessage
+from django.core.mail.message import (
+    RFC5322_EMAIL_LINE_LENGTH_LIMIT,
+    SafeMIMEText,
+    forbid_multi_line_headers,
+    sanitize_address,
+)
+from django.core.mail.utils import DNS_NAME
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+# Заголовки, которые формируются отдельно для каждого получателя
+PER_RECIPIENT_HEADERS = ("To", "Date", "Message-ID", "Content-Transfer-Encoding")
+
+# Подстановки, доступные в тексте письма
+PLACEHOLDERS = ("full_name", "email", "unsubscribe_token", "unsubscribe_url")
+
+UNSUBSCRIBE_SALT = "mailing.unsubscribe"
+
+# Заголовок To письма, отправленного нескольким получателям одной SMTP-транзакцией
+UNDISCLOSED_RECIPIENTS = "undisclosed-recipients:;"
+
+_newlines = re.compile(r"\r\n|\r|\n")
+
+_template_cache = OrderedDict()
+_template_cache_lock = threading.Lock()
+
+
+def make_unsubscribe_token(mailing_id, recipient_id):
+    """
+    Возвращает подписанный токен отписки получателя от рассылки.
+
+    Параметры:
+    mailing_id (int): Идентификатор рассылки.
+    recipient_id (int): Идентификатор получателя.
+
+    Возвращает:
+    str: Токен отписки.
+    """
+    return signing.Signer(salt=UNSUBSCRIBE_SALT).sign(f"{mailing_id}-{recipient_id}")
+
+
+def read_unsubscribe_token(token):
+    """
+    Проверяет токен отписки.
+
+    Параметры:
+    token (str): Токен отписки.
+
+    Возвращает:
+    tuple[int, int]: Идентификаторы рассылки и получателя.
+
+    Исключения:
+    django.core.signing.BadSignature: Если токен поврежден или подделан.
+    """
+    value = signing.Signer(salt=UNSUBSCRIBE_SALT).unsign(token)
+    mailing_id, recipient_id = value.split("-")
+    return int(mailing_id), int(recipient_id)
+
+
+class MessageTemplate:
+    """
+    Скомпилированный текст письма с подстановками вида {{ full_name }}.
+
+    Текст разбирается один раз на неизменяемые части и имена подстановок, поэтому
+    подстановка данных получателя сводится к склейке строк. Неизвестные подстановки
+    остаются в тексте без изменений.
+    """
+
+    pattern = re.compile(r"\{\{\s*(%s)\s*\}\}" % "|".join(PLACEHOLDERS))
+
+    def __init__(self, text):
+        """
+        Параметры:
+        text (str): Текст письма.
+        """
+        self.text = text
+        # Переводы строк приводятся к CRLF при компиляции, а не при каждой подстановке
+        self._parts = self.pattern.split(_newlines.sub("\r\n", text))
+        self.fields = frozenset(self._parts[1::2])
+
+    @property
+    def is_static(self):
+        """True, если в тексте нет подстановок."""
+        return not self.fields
+
+    def render(self, context):
+        """
+        Подставляет данные получателя в текст письма.
+
+        Параметры:
+        context (dict): Значения подстановок.
+
+        Возвращает:
+        str: Текст письма.
+        """
+        if self.is_static:
+            return self.text
+        parts = self._parts.copy()
+        for i in range(1, len(parts), 2):
+            parts[i] = context[parts[i]]
+        return "".join(parts)
+
+
+def get_message_template(message):
+    """
+    Возвращает скомпилированный текст сообщения из LRU-кэша процесса.
+
+    Ключ кэша - идентификатор и время изменения сообщения, поэтому после редактирования
+    сообщения текст компилируется заново. Размер кэша задается настройкой
+    MAILING_TEMPLATE_CACHE_SIZE.
+
+    Параметры:
+    message (Message): Сообщение рассылки.
+
+    Возвращает:
+    MessageTemplate: Скомпилированный текст.
+    """
+    key = (message.pk, message.updated_at)
+    with _template_cache_lock:
+        template = _template_cache.get(key)
+        if template is not None:
+            _template_cache.move_to_end(key)
+            return template
+    template = MessageTemplate(message.message)
+    with _template_cache_lock:
+        _template_cache[key] = template
+        while len(_template_cache) > settings.MAILING_TEMPLATE_CACHE_SIZE:
+            _template_cache.popitem(last=False)
+    return template
+
+
+class RenderedMessage:
+    """
+    Письмо, уже сериализованное в байты.
+
+    Возвращается из PreparedEmailMessage.message() вместо объекта email.message.Message:
+    почтовым бэкендам Django для отправки нужен только метод as_bytes().
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def as_bytes(self, linesep="\r\n"):
+        if linesep == "\r\n":
+            return self.data
+        return self.data.replace(b"\r\n", linesep.encode())
+
+    def get_charset(self):
+        return None
+
+
+class PreparedMessage:
+    """
+    Письмо рассылки, сериализованное один раз для всех получателей.
+
+    Тема и общие заголовки кодируются (с учетом кодировки и переносов строк) при создании
+    объекта. Для каждого получателя к готовым байтам добавляются только заголовки To, Date,
+    Message-ID и тело письма. Тело без подстановок тоже кодируется один раз, а тело
+    с подстановками собирается из скомпилированного шаблона (MessageTemplate).
+    """
+
+    def __init__(self, subject, body, from_email=None, encoding=None, mailing_id=None, template=None):
+        """
+        Параметры:
+        subject (str): Тема письма.
+        body (str): Текст письма.
+        from_email (str, optional): Адрес отправителя. По умолчанию - DEFAULT_FROM_EMAIL.
+        encoding (str, optional): Кодировка письма. По умолчанию - DEFAULT_CHARSET.
+        mailing_id (int, optional): Идентификатор рассылки для токена отписки.
+        template (MessageTemplate, optional): Скомпилированный текст письма.
+        """
+        self.subject = subject
+        self.body = body
+        self.from_email = from_email or settings.DEFAULT_FROM_EMAIL
+        self.encoding = encoding or settings.DEFAULT_CHARSET
+        self.envelope_from = sanitize_address(self.from_email, self.encoding) if self.from_email else ""
+        self.mailing_id = mailing_id
+        self.template = template or MessageTemplate(body)
+        self._unsubscribe_url = None
+        if "unsubscribe_url" in self.template.fields:
+            self._unsubscribe_url = settings.MAILING_SITE_URL.rstrip("/") + reverse(
+                "mailing:unsubscribe", args=["-"]
+            ).removesuffix("-")
+
+        email_message = EmailMessage(subject=subject, body=body, from_email=self.from_email)
+        email_message.encoding = self.encoding
+        message = email_message.message()
+        self._transfer_encoding = message["Content-Transfer-Encoding"]
+        for header in PER_RECIPIENT_HEADERS:
+            del message[header]
+        headers, _, payload = message.as_bytes(linesep="\r\n").partition(b"\r\n\r\n")
+        self._headers = headers + b"\r\n"
+        self._payload = payload
+
+    @classmethod
+    def from_mailing(cls, mailing):
+        """
+        Создает подготовленное письмо по сообщению рассылки.
+
+        Параметры:
+        mailing (Mailing): Рассылка.
+
+        Возвращает:
+        PreparedMessage: Подготовленное письмо.
+        """
+        logger.info(f"Подготовка письма рассылки {mailing.pk}")
+        message = mailing.message
+        return cls(
+            message.title,
+            message.message,
+            mailing_id=mailing.pk,
+            template=get_message_template(message),
+        )
+
+    def render_text(self, email, full_name="", recipient_id=None):
+        """
+        Возвращает текст письма с подставленными данными получателя.
+
+        Параметры:
+        email (str): Адрес получателя.
+        full_name (str, optional): ФИО получателя.
+        recipient_id (int, optional): Идентификатор получателя для токена отписки.
+
+        Возвращает:
+        str: Текст письма.
+        """
+        fields = self.template.fields
+        if not fields:
+            return self.body
+        context = {"email": email, "full_name": _newlines.sub(" ", full_name or "")}
+        if "unsubscribe_token" in fields or "unsubscribe_url" in fields:
+            token = make_unsubscribe_token(self.mailing_id, recipient_id)
+            context["unsubscribe_token"] = token
+            context["unsubscribe_url"] = f"{self._unsubscribe_url}{token}"
+        return self.template.render(context)
+
+    def render(self, email, full_name="", recipient_id=None):
+        """
+        Возвращает письмо для одного получателя.
+
+        Параметры:
+        email (str): Адрес получателя.
+        full_name (str, optional): ФИО получателя.
+        recipient_id (int, optional): Идентификатор получателя для токена отписки.
+
+        Возвращает:
+        bytes: Письмо в формате RFC 5322 с переводами строк CRLF.
+        """
+        return self.encode(email, self.render_text(email, full_name, recipient_id))
+
+    def encode(self, email, text):
+        """
+        Собирает письмо для одного получателя из готовых заголовков и текста.
+
+        Параметры:
+        email (str): Адрес получателя.
+        text (str): Текст письма (результат render_text()).
+
+        Возвращает:
+        bytes: Письмо в формате RFC 5322 с переводами строк CRLF.
+        """
+        _, to = forbid_multi_line_headers("To", email, self.encoding)
+        if text is self.body:
+            transfer_encoding, payload = self._transfer_encoding, self._payload
+        else:
+            transfer_encoding, payload = self._encode_body(text)
+        return self._assemble(to, transfer_encoding, payload)
+
+    def render_shared(self):
+        """
+        Возвращает письмо без подстановок для отправки нескольким получателям сразу.
+
+        Адреса получателей передаются только командами RCPT TO, в заголовке To
+        указывается пустая группа undisclosed-recipients.
+
+        Возвращает:
+        bytes: Письмо в формате RFC 5322 с переводами строк CRLF.
+        """
+        if not self.template.is_static:
+            raise ValueError("Письмо с подстановками нельзя отправить нескольким получателям сразу")
+        return self._assemble(UNDISCLOSED_RECIPIENTS, self._transfer_encoding, self._payload)
+
+    def _assemble(self, to, transfer_encoding, payload):
+        recipient_headers = (
+            f"To: {to}\r\n"
+            f"Date: {formatdate(localtime=settings.EMAIL_USE_LOCALTIME)}\r\n"
+            f"Message-ID: {make_msgid(domain=DNS_NAME)}\r\n"
+        )
+        return b"".join(
+            (
+                recipient_headers.encode("ascii"),
+                self._headers,
+                f"Content-Transfer-Encoding: {transfer_encoding}\r\n\r\n".encode("ascii"),
+                payload,
+            )
+        )
+
+    def _encode_body(self, text):
+        """
+        Кодирует текст письма (с переводами строк CRLF) так же, как SafeMIMEText.
+
+        В типичном случае (UTF-8, строки не длиннее 998 байт) MIME-объект не создается.
+        """
+        if self.encoding.lower() == "utf-8":
+            payload = text.encode("utf-8")
+            if max(map(len, payload.split(b"\r\n"))) <= RFC5322_EMAIL_LINE_LENGTH_LIMIT:
+                return ("7bit" if payload.isascii() else "8bit"), payload
+        part = SafeMIMEText(text, "plain", self.encoding)
+        return part["Content-Transfer-Encoding"], part.as_bytes(linesep="\r\n").partition(b"\r\n\r\n")[2]
+
+
+class PreparedEmailMessage(EmailMessage):
+    """
+    EmailMessage для одного получателя, который отправляется из подготовленного письма.
+
+    Совместим с почтовыми бэкендами Django, но не кодирует письмо заново при отправке.
+    """
+
+    def __init__(self, prepared, email, full_name="", recipient_id=None, connection=None):
+        """
+        Параметры:
+        prepared (PreparedMessage): Подготовленное письмо рассылки.
+        email (str): Адрес получателя.
+        full_name (str, optional): ФИО получателя.
+        recipient_id (int, optional): Идентификатор получателя.
+        connection (optional): Соединение почтового бэкенда.
+        """
+        super().__init__(
+            subject=prepared.subject,
+            body=prepared.render_text(email, full_name, recipient_id),
+            from_email=prepared.from_email,
+            to=[email],
+            connection=connection,
+        )
+        self.encoding = prepared.encoding
+        self.prepared = prepared
+
+    def message(self):
+        return RenderedMessage(self.prepared.encode(self.to[0], self.body))
@@ -0,0 +1,128 @@
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from mailing.models import MailingAttempt
+
+
+def get_smtp_code(error):
+    """
+    Возвращает код ответа SMTP-сервера из исключения smtplib или aiosmtplib.
+
+    Для отказа в приеме получателей возвращается код первого отказа.
+
+    Параметры:
+    error (Exception): Исключение отправки.
+
+    Возвращает:
+    int | None: Код ответа или None, если сервер не ответил (например, разрыв соединения).
+    """
+    recipients = getattr(error, "recipients", None)
+    if isinstance(recipients, dict):
+        # smtplib.SMTPRecipientsRefused: {адрес: (код, ответ)}
+        for code, _ in recipients.values():
+            return code
+    if isinstance(recipients, list):
+        # aiosmtplib.SMTPRecipientsRefused: [SMTPRecipientRefused, ...]
+        for refused in recipients:
+            return getattr(refused, "code", None)
+    code = getattr(error, "smtp_code", None) or getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def classify_error(error):
+    """
+    Определяет, стоит ли повторять отправку после ошибки.
+
+    Ответы 4xx (например, 421 и 451), разрывы соединения и таймауты считаются временными
+    ошибками, ответы 5xx и прочие исключения (например, неверный адрес) - постоянными.
+
+    Параметры:
+    error (Exception): Исключение отправки.
+
+    Возвращает:
+    str: MailingAttempt.RETRY для временной ошибки, MailingAttempt.FAILURE для постоянной.
+    """
+    code = get_smtp_code(error)
+    if code is not None:
+        return MailingAttempt.RETRY if 400 <= code < 500 else MailingAttempt.FAILURE
+    if isinstance(error, OSError):
+        return MailingAttempt.RETRY
+    return MailingAttempt.FAILURE
+
+
+def is_hard_bounce(error):
+    """
+    Проверяет, отказался ли сервер принимать почту для адреса получателя навсегда.
+
+    Жесткий отказ - только ответ 5xx на команду RCPT TO для этого адреса (SMTPRecipientsRefused
+    или отказ по адресу из группы). Отказ отправителю (MAIL FROM) или содержимому письма (DATA)
+    говорит о нашем адресе или письме, а не о получателе, поэтому жестким отказом не считается,
+    даже с кодом 550.
+
+    Параметры:
+    error (Exception): Исключение отправки.
+
+    Возвращает:
+    bool: True для жесткого отказа.
+    """
+    code = get_smtp_code(error)
+    if code is None or not 500 <= code < 600:
+        return False
+    return hasattr(error, "recipients") or hasattr(error, "recipient")
+
+
+def is_outage_error(error):
+    """
+    Проверяет, говорит ли ошибка о недоступности SMTP-сервера, а не об отказе в приеме письма.
+
+    Недоступностью считаются ошибки соединения и таймауты без ответа сервера,
+    а также ответ 421 (сервис недоступен).
+
+    Параметры:
+    error (Exception): Исключение отправки.
+
+    Возвращает:
+    bool: True для сбоя сервера.
+    """
+    code = get_smtp_code(error)
+    if code is not None:
+        return code == 421
+    return isinstance(error, OSError)
+
+
+def retry_delay(attempt_count: int) -> float:
+    """
+    Возвращает задержку перед повторной отправкой.
+
+    Задержка растет экспоненциально (MAILING_RETRY_BASE_DELAY * 2^(n-1), но не больше
+    MAILING_RETRY_MAX_DELAY), а случайная половина задержки разводит повторы
+    многих получателей во времени.
+
+    Параметры:
+    attempt_count (int): Количество уже выполненных попыток.
+
+    Возвращает:
+    float: Задержка в секундах.
+    """
+    delay = min(
+        settings.MAILING_RETRY_MAX_DELAY,
+        settings.MAILING_RETRY_BASE_DELAY * 2 ** max(attempt_count - 1, 0),
+    )
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def next_attempt_at(attempt_count: int, now=None):
+    """
+    Возвращает время следующей попытки отправки.
+
+    Параметры:
+    attempt_count (int): Количество уже выполненных попыток.
+    now (datetime, optional): Текущее время.
+
+    Возвращает:
+    datetime: Время следующей попытки.
+    """
+    return (now or timezone.now()) + timedelta(seconds=retry_delay(attempt_count))
@@ -0,0 +1,155 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from mailing.models import AttemptRollup, MailingAttempt, RollupWatermark
+
+# Поля сводки по статусам попыток
+ROLLUP_FIELDS = {
+    MailingAttempt.SUCCESS: "success",
+    MailingAttempt.FAILURE: "failure",
+    MailingAttempt.RETRY: "retry",
+}
+TRUNCATE = {AttemptRollup.HOUR: TruncHour, AttemptRollup.DAY: TruncDay}
+WATERMARK_NAME = "attempts"
+
+
+def update_rollups(chunk_size=None, settle=None, now=None):
+    """
+    Добавляет в сводки попытки рассылки, записанные после прошлого запуска.
+
+    Идентификаторы попыток выдаются при вставке, а фиксируются транзакции не по порядку:
+    строка с меньшим id может стать видимой позже строки с большим. Поэтому отметка
+    продвигается с задержкой: запуск запоминает наибольший видимый id (seen_id), а учитываются
+    попытки до него только в запуске через settle секунд, когда все транзакции, начатые до
+    замера, уже зафиксированы. Попытки учитываются частями по chunk_size идентификаторов;
+    каждая часть учитывается в одной транзакции с продвижением отметки, поэтому прерванный
+    запуск продолжается с места остановки, а одновременные запуски не учитывают попытки дважды.
+
+    Параметры:
+    chunk_size (int, optional): Количество идентификаторов в части (MAILING_ROLLUP_CHUNK_SIZE).
+    settle (float, optional): Задержка учета в секундах (MAILING_ROLLUP_SETTLE_SECONDS).
+    now (datetime, optional): Текущее время.
+
+    Возвращает:
+    int: Количество учтенных попыток.
+    """
+    chunk_size = chunk_size or settings.MAILING_ROLLUP_CHUNK_SIZE
+    settle = settings.MAILING_ROLLUP_SETTLE_SECONDS if settle is None else settle
+    now = now or timezone.now()
+    settled_before = now - timedelta(seconds=settle)
+    RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)
+    processed = 0
+    while True:
+        with transaction.atomic():
+            watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK_NAME)
+            settled = watermark.seen_at is not None and watermark.seen_at <= settled_before
+            if not settled or watermark.last_id >= watermark.seen_id:
+                break
+            upper = min(watermark.seen_id, watermark.last_id + chunk_size)
+            processed += _add_attempts(watermark.last_id, upper)
+            watermark.last_id = upper
+            watermark.save(update_fields=["last_id"])
+    with transaction.atomic():
+        watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK_NAME)
+        caught_up = watermark.seen_at is None or (
+            watermark.seen_at <= settled_before and watermark.last_id >= watermark.seen_id
+        )
+        if caught_up:
+            watermark.seen_id = MailingAttempt.objects.aggregate(max_id=Max("id"))["max_id"] or 0
+            watermark.seen_at = now
+            watermark.save(update_fields=["seen_id", "seen_at"])
+    return processed
+
+
+def rebuild_rollups(now=None):
+    """
+    Удаляет сводки и сбрасывает отметку: следующие запуски update_rollups построят сводки заново.
+
+    Нужен после удаления попыток в обход рассылок (например, QuerySet.delete()).
+
+    Параметры:
+    now (datetime, optional): Текущее время.
+    """
+    RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)
+    with transaction.atomic():
+        watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK_NAME)
+        AttemptRollup.objects.all().delete()
+        watermark.last_id = 0
+        watermark.seen_id = MailingAttempt.objects.aggregate(max_id=Max("id"))["max_id"] or 0
+        watermark.seen_at = now or timezone.now()
+        watermark.save()
+
+
+def _add_attempts(first_id, last_id):
+    """Добавляет в сводки попытки с id в диапазоне (first_id, last_id]."""
+    attempts = MailingAttempt.objects.filter(id__gt=first_id, id__lte=last_id)
+    deltas = {}
+    processed = 0
+    for period, truncate in TRUNCATE.items():
+        rows = (
+            attempts.annotate(bucket=truncate("attempted_at"))
+            .values_list("bucket", "mailing_id", "mailing__owner", "status")
+            .annotate(total=Count("id"))
+            .order_by()
+        )
+        for bucket, mailing_id, owner_id, status, total in rows:
+            delta = deltas.setdefault(
+                (period, bucket, mailing_id), {"owner_id": owner_id, "success": 0, "failure": 0, "retry": 0}
+            )
+            delta[ROLLUP_FIELDS[status]] += total
+            if period == AttemptRollup.DAY:
+                processed += total
+    if not deltas:
+        return 0
+
+    existing = {}
+    for period in TRUNCATE:
+        keys = [key for key in deltas if key[0] == period]
+        rollups = AttemptRollup.objects.filter(
+            period=period,
+            bucket__in={bucket for _, bucket, _ in keys},
+            mailing_id__in={mailing_id for _, _, mailing_id in keys},
+        )
+        existing.update({(rollup.period, rollup.bucket, rollup.mailing_id): rollup for rollup in rollups})
+    created = []
+    for (period, bucket, mailing_id), delta in deltas.items():
+        rollup = existing.get((period, bucket, mailing_id))
+        if rollup is None:
+            created.append(AttemptRollup(period=period, bucket=bucket, mailing_id=mailing_id, **delta))
+            continue
+        rollup.owner_id = delta["owner_id"]
+        for field in ROLLUP_FIELDS.values():
+            setattr(rollup, field, getattr(rollup, field) + delta[field])
+    AttemptRollup.objects.bulk_update(existing.values(), ["owner", *ROLLUP_FIELDS.values()], batch_size=1000)
+    AttemptRollup.objects.bulk_create(created, batch_size=1000)
+    return processed
+
+
+def get_attempt_stats(period, since, owner_id=None, mailing_id=None):
+    """
+    Возвращает количество попыток рассылки по периодам из сводок.
+
+    Параметры:
+    period (str): AttemptRollup.HOUR или AttemptRollup.DAY.
+    since (datetime): Начало интервала.
+    owner_id (int, optional): Идентификатор владельца рассылок. None - все рассылки.
+    mailing_id (int, optional): Идентификатор рассылки.
+
+    Возвращает:
+    list[dict]: Начало периода (bucket) и количество попыток по статусам, по возрастанию времени.
+    """
+    rollups = AttemptRollup.objects.filter(period=period, bucket__gte=since)
+    if owner_id is not None:
+        rollups = rollups.filter(owner_id=owner_id)
+    if mailing_id is not None:
+        rollups = rollups.filter(mailing_id=mailing_id)
+    return list(
+        rollups.values("bucket")
+        .annotate(success=Sum("success"), failure=Sum("failure"), retry=Sum("retry"))
+        .order_by("bucket")
+    )
@@ -0,0 +1,266 @@
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection
+from django.db.models import Min
+from django.utils import timezone
+
+from mailing.counters import update_mailing_status
+from mailing.models import Mailing, RecipientDelivery
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_VERSION_KEY = "mailing_schedule/version"
+
+START = "start"
+FINISH = "finish"
+RETRY = "retry"
+
+
+def bump_schedule_version():
+    """Сообщает планировщику, что расписание рассылок изменилось."""
+    try:
+        cache.incr(SCHEDULE_VERSION_KEY)
+    except ValueError:
+        cache.set(SCHEDULE_VERSION_KEY, 1, None)
+
+
+def get_schedule_version():
+    """
+    Возвращает текущую версию расписания рассылок.
+
+    Возвращает:
+    int: Версия расписания (0, если расписание еще не менялось).
+    """
+    return cache.get(SCHEDULE_VERSION_KEY, 0)
+
+
+def finish_mailing(mailing_id: int, now=None) -> bool:
+    """
+    Завершает рассылку, срок отправки которой истек.
+
+    Параметры:
+    mailing_id (int): Идентификатор рассылки.
+    now (datetime, optional): Текущее время.
+
+    Возвращает:
+    bool: True, если рассылка завершена.
+    """
+    finished = update_mailing_status(
+        Mailing.objects.filter(
+            pk=mailing_id,
+            status__in=[Mailing.CREATED, Mailing.RUNNING],
+            finish_send_at__lte=now or timezone.now(),
+        ),
+        Mailing.COMPLETED,
+    )
+    return bool(finished)
+
+
+class MailingScheduler:
+    """
+    Резидентный планировщик рассылок.
+
+    Держит в памяти очередь с приоритетом (heapq) ближайших сроков first_send_at
+    и finish_send_at. Очередь загружается из базы двумя запросами по индексам
+    (status, first_send_at) и (status, finish_send_at) только на горизонт horizon секунд вперед.
+    Очередь перечитывается, когда сигналы модели Mailing меняют версию расписания в кэше
+    (проверка версии - одно чтение из кэша раз в poll_interval секунд), и не реже
+    одного раза в refresh_interval секунд.
+
+    Когда наступает срок первой отправки, вызывается dispatch(mailing_id); каждая рассылка
+    передается в dispatch один раз, пока она остается в расписании. Когда наступает срок
+    окончания отправки, рассылка завершается. Если задан retry_dispatch, в очередь попадают
+    и сроки повторной отправки получателям после временных ошибок.
+
+    Если задано workers, dispatch и retry_dispatch выполняются в пуле потоков, поэтому
+    отправка большой рассылки не задерживает сроки других рассылок; одну рассылку
+    одновременно отправляет не больше одного потока.
+    """
+
+    def __init__(
+        self, dispatch, poll_interval=None, refresh_interval=None, horizon=None, retry_dispatch=None, workers=None
+    ):
+        """
+        Параметры:
+        dispatch (callable): Функция запуска отправки, принимает идентификатор рассылки.
+        retry_dispatch (callable, optional): Функция повторной отправки, принимает идентификатор
+            рассылки. Не нужна, если повторы планирует Celery (задача retry_mailing).
+        poll_interval (float, optional): Максимальная пауза между проверками, в секундах
+            (MAILING_SCHEDULER_POLL_INTERVAL).
+        refresh_interval (float, optional): Максимальное время между перечитываниями очереди
+            из базы, в секундах (MAILING_SCHEDULER_REFRESH_INTERVAL).
+        horizon (float, optional): На сколько секунд вперед загружаются сроки
+            (MAILING_SCHEDULER_HORIZON).
+        workers (int, optional): Количество потоков отправки. По умолчанию отправка
+            выполняется в цикле планировщика.
+        """
+        self.dispatch = dispatch
+        self.retry_dispatch = retry_dispatch
+        self.poll_interval = poll_interval or settings.MAILING_SCHEDULER_POLL_INTERVAL
+        self.refresh_interval = refresh_interval or settings.MAILING_SCHEDULER_REFRESH_INTERVAL
+        self.horizon = horizon or settings.MAILING_SCHEDULER_HORIZON
+        self.dispatched = set()
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="mailing-dispatch") if workers else None
+        self._running = set()
+        self._lock = threading.Lock()
+        self._queue = []
+        self._version = None
+        self._refreshed_at = None
+
+    def refresh(self, now=None):
+        """
+        Перечитывает сроки рассылок из базы.
+
+        Параметры:
+        now (datetime, optional): Текущее время.
+        """
+        now = now or timezone.now()
+        until = now + timedelta(seconds=self.horizon)
+        self._version = get_schedule_version()
+        self._refreshed_at = time.monotonic()
+        active = Mailing.objects.filter(status__in=[Mailing.CREATED, Mailing.RUNNING])
+
+        queue = [
+            (finish_send_at, FINISH, mailing_id)
+            for mailing_id, finish_send_at in active.filter(finish_send_at__lte=until).values_list(
+                "id", "finish_send_at"
+            )
+        ]
+        starts = list(
+            active.filter(first_send_at__lte=until, finish_send_at__gt=now).values_list(
+                "id", "first_send_at", "finish_send_at"
+            )
+        )
+        # Завершенные и удаленные рассылки больше не попадут в очередь запуска: множество
+        # запущенных ограничено рассылками из расписания и не растет за время работы процесса
+        self.dispatched.intersection_update(mailing_id for mailing_id, _, _ in starts)
+        # Рассылка, срок окончания которой наступит раньше первой отправки, не запускается
+        queue += [
+            (first_send_at, START, mailing_id)
+            for mailing_id, first_send_at, finish_send_at in starts
+            if mailing_id not in self.dispatched and finish_send_at > first_send_at
+        ]
+        if self.retry_dispatch is not None:
+            queue += [
+                (due_at, RETRY, mailing_id)
+                for mailing_id, due_at in RecipientDelivery.objects.filter(
+                    status=RecipientDelivery.PENDING,
+                    next_attempt_at__lte=until,
+                    mailing__status=Mailing.RUNNING,
+                )
+                .values_list("mailing_id")
+                .annotate(due_at=Min("next_attempt_at"))
+                .order_by()
+            ]
+        heapq.heapify(queue)
+        self._queue = queue
+        logger.info(f"Расписание рассылок обновлено: сроков в очереди - {len(queue)}")
+
+    def needs_refresh(self):
+        """
+        Проверяет, нужно ли перечитать очередь из базы.
+
+        Возвращает:
+        bool: True, если расписание изменилось или очередь давно не перечитывалась.
+        """
+        return (
+            self._refreshed_at is None
+            or time.monotonic() - self._refreshed_at >= self.refresh_interval
+            or get_schedule_version() != self._version
+        )
+
+    def run_pending(self, now=None):
+        """
+        Выполняет все наступившие сроки.
+
+        Параметры:
+        now (datetime, optional): Текущее время.
+
+        Возвращает:
+        int: Количество выполненных сроков.
+        """
+        now = now or timezone.now()
+        done = 0
+        while self._queue and self._queue[0][0] <= now:
+            _, action, mailing_id = heapq.heappop(self._queue)
+            if action == FINISH:
+                if finish_mailing(mailing_id, now):
+                    logger.info(f"Срок отправки рассылки {mailing_id} истек, рассылка завершена")
+            elif action == RETRY:
+                logger.info(f"Повторная отправка рассылки {mailing_id}")
+                self._call(self.retry_dispatch, mailing_id)
+            elif mailing_id not in self.dispatched:
+                self.dispatched.add(mailing_id)
+                logger.info(f"Запуск рассылки {mailing_id}")
+                self._call(self.dispatch, mailing_id)
+            done += 1
+        return done
+
+    def _call(self, dispatch, mailing_id):
+        if self._pool is None:
+            self._run(dispatch, mailing_id)
+            return
+        with self._lock:
+            if mailing_id in self._running:
+                logger.info(f"Рассылка {mailing_id} еще отправляется")
+                return
+            self._running.add(mailing_id)
+        self._pool.submit(self._run_in_pool, dispatch, mailing_id)
+
+    def _run(self, dispatch, mailing_id):
+        try:
+            dispatch(mailing_id)
+        except Exception:
+            logger.exception(f"Ошибка отправки рассылки {mailing_id}")
+        # Отправка меняет сроки повторов, поэтому очередь перечитывается на следующем шаге
+        self._refreshed_at = None
+
+    def _run_in_pool(self, dispatch, mailing_id):
+        try:
+            self._run(dispatch, mailing_id)
+        finally:
+            with self._lock:
+                self._running.discard(mailing_id)
+            connection.close()
+
+    def close(self):
+        """Дожидается окончания отправки, начатой в пуле потоков."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    def next_wait(self, now=None):
+        """
+        Возвращает паузу до следующей проверки.
+
+        Параметры:
+        now (datetime, optional): Текущее время.
+
+        Возвращает:
+        float: Пауза в секундах, не больше poll_interval.
+        """
+        if not self._queue:
+            return self.poll_interval
+        due_in = (self._queue[0][0] - (now or timezone.now())).total_seconds()
+        return max(0, min(self.poll_interval, due_in))
+
+    def run_forever(self, stop=None):
+        """
+        Выполняет сроки рассылок, пока не будет установлено событие stop.
+
+        Параметры:
+        stop (threading.Event, optional): Событие остановки планировщика.
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            close_old_connections()
+            if self.needs_refresh():
+                self.refresh()
+            self.run_pending()
+            stop.wait(self.next_wait())
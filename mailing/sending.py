@@ -0,0 +1,343 @@
+import logging
+import smtplib
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.message import sanitize_address
+
+from mailing.models import MailingAttempt
+from mailing.rendering import PreparedEmailMessage, PreparedMessage
+from mailing.retry import classify_error, is_hard_bounce, is_outage_error
+
+logger = logging.getLogger(__name__)
+
+
+class Envelope(NamedTuple):
+    """Адресат письма рассылки."""
+
+    id: Optional[int]
+    email: str
+    recipient_id: Optional[int] = None
+    full_name: str = ""
+
+
+class SendResult(NamedTuple):
+    """Результат отправки письма одному адресату."""
+
+    envelope: Envelope
+    status: str
+    response: str
+    # Жесткий отказ: адрес нужно добавить в список подавления
+    bounced: bool = False
+    # Сбой SMTP-сервера (см. mailing.circuit)
+    outage: bool = False
+
+
+def error_result(envelope, error):
+    """
+    Возвращает результат неудачной отправки адресату.
+
+    Параметры:
+    envelope (Envelope): Адресат.
+    error (Exception): Исключение отправки.
+
+    Возвращает:
+    SendResult: Результат со статусом по классификации ошибки (см. mailing.retry).
+    """
+    response = f"{envelope.email}: Ошибка: {str(error)}"
+    logger.error(response)
+    return SendResult(
+        envelope, classify_error(error), response, is_hard_bounce(error), is_outage_error(error)
+    )
+
+
+# Поля состояния доставки, из которых строится Envelope
+ENVELOPE_FIELDS = ("id", "recipient__email", "recipient_id", "recipient__full_name")
+
+
+def stream_envelopes(deliveries, chunk_size=None):
+    """
+    Потоково читает адресатов рассылки из базы.
+
+    Выбираются только поля ENVELOPE_FIELDS, без создания экземпляров моделей. На PostgreSQL
+    строки читаются через серверный курсор пачками по chunk_size, поэтому память процесса
+    не зависит от количества получателей.
+
+    Параметры:
+    deliveries (QuerySet[RecipientDelivery]): Состояния доставки.
+    chunk_size (int, optional): Размер пачки чтения (MAILING_STREAM_CHUNK_SIZE).
+
+    Возвращает:
+    Iterator[Envelope]: Адресаты в порядке идентификаторов состояний доставки.
+    """
+    rows = deliveries.order_by("id").values_list(*ENVELOPE_FIELDS)
+    for row in rows.iterator(chunk_size=chunk_size or settings.MAILING_STREAM_CHUNK_SIZE):
+        yield Envelope._make(row)
+
+
+async def astream_envelopes(deliveries, chunk_size=None):
+    """Асинхронная версия stream_envelopes()."""
+    # named=True: итератор именованных строк читает базу лениво, по мере обхода
+    rows = deliveries.order_by("id").values_list(*ENVELOPE_FIELDS, named=True)
+    async for row in rows.aiterator(chunk_size=chunk_size or settings.MAILING_STREAM_CHUNK_SIZE):
+        yield Envelope._make(row)
+
+
+class DomainBatcher:
+    """
+    Группировка адресатов по домену для отправки одной SMTP-транзакцией.
+
+    Адресаты накапливаются в группах по домену. Группа выдается, когда в ней набирается
+    size адресатов или когда всего накоплено больше max_pending адресатов (тогда выдается
+    самая старая группа), поэтому память не зависит от количества получателей.
+    """
+
+    def __init__(self, size, max_pending=None):
+        """
+        Параметры:
+        size (int): Максимальное количество адресатов в группе.
+        max_pending (int, optional): Максимальное количество накопленных адресатов (MAILING_QUEUE_SIZE).
+        """
+        self.size = size
+        self.max_pending = max_pending or settings.MAILING_QUEUE_SIZE
+        self._groups = {}
+        self._pending = 0
+
+    def add(self, envelope):
+        """
+        Добавляет адресата.
+
+        Параметры:
+        envelope (Envelope): Адресат.
+
+        Возвращает:
+        list[Envelope] | None: Готовая к отправке группа или None.
+        """
+        domain = envelope.email.rpartition("@")[2].lower()
+        group = self._groups.setdefault(domain, [])
+        group.append(envelope)
+        self._pending += 1
+        if len(group) >= self.size:
+            return self._pop(domain)
+        if self._pending > self.max_pending:
+            return self._pop(next(iter(self._groups)))
+        return None
+
+    def drain(self):
+        """
+        Выдает все накопленные группы.
+
+        Возвращает:
+        Iterator[list[Envelope]]: Группы адресатов.
+        """
+        while self._groups:
+            yield self._pop(next(iter(self._groups)))
+
+    def _pop(self, domain):
+        group = self._groups.pop(domain)
+        self._pending -= len(group)
+        return group
+
+
+def group_by_domain(envelopes, size, max_pending=None):
+    """
+    Группирует адресатов по домену (см. DomainBatcher).
+
+    Параметры:
+    envelopes (Iterable[Envelope]): Адресаты.
+    size (int): Максимальное количество адресатов в группе.
+    max_pending (int, optional): Максимальное количество накопленных адресатов.
+
+    Возвращает:
+    Iterator[list[Envelope]]: Группы адресатов одного домена.
+    """
+    batcher = DomainBatcher(size, max_pending)
+    for envelope in envelopes:
+        group = batcher.add(envelope)
+        if group is not None:
+            yield group
+    yield from batcher.drain()
+
+
+class BatchMailSender:
+    """
+    Отправка писем рассылки пачками через одно SMTP-соединение.
+
+    Соединение берется из get_connection() и используется для batch_size писем подряд.
+    Новое соединение (и новое TLS-рукопожатие) открывается только после ошибки отправки
+    или после завершения пачки.
+
+    Письмо рассылки кодируется один раз (PreparedMessage) и переиспользуется для всех
+    получателей, поэтому объект можно разделять между потоками одной рассылки.
+
+    Если rcpt_batch больше 1 и в письме нет подстановок, адресаты группируются по домену,
+    и письмо передается группе одной транзакцией: несколько команд RCPT TO и одна DATA.
+    Отказы сервера разбираются по каждому адресу, так что попытка записывается отдельно
+    для каждого получателя.
+    """
+
+    def __init__(self, batch_size=None, connection_factory=get_connection, rcpt_batch=None, connection_slots=None):
+        """
+        Параметры:
+        batch_size (int, optional): Количество писем на одно соединение.
+            По умолчанию берется из настройки MAILING_BATCH_SIZE.
+        connection_factory (callable, optional): Функция, возвращающая почтовый бэкенд.
+        rcpt_batch (int, optional): Максимальное количество получателей одной SMTP-транзакции
+            (MAILING_RCPT_BATCH_SIZE).
+        connection_slots (threading.Semaphore, optional): Ограничение одновременных соединений
+            с сервером: место занимается при открытии соединения и освобождается при закрытии.
+        """
+        self.batch_size = batch_size or settings.MAILING_BATCH_SIZE
+        self.connection_factory = connection_factory
+        self.rcpt_batch = rcpt_batch or settings.MAILING_RCPT_BATCH_SIZE
+        self.connection_slots = connection_slots
+        self._prepared = None
+
+    def prepare_message(self, mailing):
+        """
+        Возвращает письмо рассылки, подготовленное для всех получателей.
+
+        Письмо готовится при первом обращении и хранится до перехода к другой рассылке.
+
+        Параметры:
+        mailing (Mailing): Рассылка.
+
+        Возвращает:
+        PreparedMessage: Подготовленное письмо.
+        """
+        cached = self._prepared
+        if cached is None or cached[0] != mailing.pk:
+            cached = self._prepared = (mailing.pk, PreparedMessage.from_mailing(mailing))
+        return cached[1]
+
+    def build_message(self, mailing, envelope, connection):
+        """
+        Собирает письмо рассылки для одного получателя из подготовленного письма.
+
+        Параметры:
+        mailing (Mailing): Рассылка.
+        envelope (Envelope): Адресат.
+        connection: Открытое соединение почтового бэкенда.
+
+        Возвращает:
+        EmailMessage: Письмо, готовое к отправке.
+        """
+        return PreparedEmailMessage(
+            self.prepare_message(mailing),
+            envelope.email,
+            full_name=envelope.full_name,
+            recipient_id=envelope.recipient_id,
+            connection=connection,
+        )
+
+    def batches(self, mailing, envelopes):
+        """
+        Делит адресатов на группы, которым письмо отправляется одной SMTP-транзакцией.
+
+        Параметры:
+        mailing (Mailing): Рассылка.
+        envelopes (Iterable[Envelope]): Адресаты.
+
+        Возвращает:
+        Iterator[list[Envelope]]: Группы адресатов (по одному, если группировка выключена).
+        """
+        if self.rcpt_batch > 1 and self.prepare_message(mailing).template.is_static:
+            return group_by_domain(envelopes, self.rcpt_batch)
+        return ([envelope] for envelope in envelopes)
+
+    def send(self, mailing, envelopes):
+        """
+        Отправляет письма рассылки переданным адресатам.
+
+        Параметры:
+        mailing (Mailing): Рассылка.
+        envelopes (Iterable[Envelope]): Адресаты.
+
+        Возвращает:
+        Iterator[SendResult]: Результаты отправки по каждому адресату.
+        """
+        self.prepare_message(mailing)
+        connection = None
+        sent_in_batch = 0
+        try:
+            for batch in self.batches(mailing, envelopes):
+                try:
+                    if connection is None:
+                        connection = self._connect()
+                        sent_in_batch = 0
+                    logger.info(f"Отправка письма на {', '.join(envelope.email for envelope in batch)}")
+                    connection.open()
+                    refused = self._deliver(mailing, batch, connection)
+                except Exception as e:
+                    self._close(connection)
+                    connection = None
+                    for envelope in batch:
+                        yield error_result(envelope, e)
+                    continue
+
+                sent_in_batch += 1
+                if sent_in_batch >= self.batch_size:
+                    self._close(connection)
+                    connection = None
+                for envelope in batch:
+                    if envelope.email in refused:
+                        yield error_result(envelope, refused[envelope.email])
+                        continue
+                    response = f"{envelope.email}: Успешно отправлено"
+                    logger.info(response)
+                    yield SendResult(envelope, MailingAttempt.SUCCESS, response)
+        finally:
+            if connection is not None:
+                self._close(connection)
+
+    def _deliver(self, mailing, batch, connection):
+        """
+        Отправляет письмо группе адресатов через открытое соединение.
+
+        Возвращает:
+        dict[str, Exception]: Ошибки по адресам, которые сервер не принял.
+        """
+        if len(batch) == 1:
+            connection.send_messages([self.build_message(mailing, batch[0], connection)])
+            return {}
+        smtp = getattr(connection, "connection", None)
+        if not isinstance(smtp, smtplib.SMTP):
+            # Бэкенд без SMTP-соединения (например, locmem) получает письма по одному
+            connection.send_messages([self.build_message(mailing, envelope, connection) for envelope in batch])
+            return {}
+        prepared = self.prepare_message(mailing)
+        addresses = [sanitize_address(envelope.email, prepared.encoding) for envelope in batch]
+        try:
+            refused = smtp.sendmail(prepared.envelope_from, addresses, prepared.render_shared())
+        except smtplib.SMTPRecipientsRefused as e:
+            # Сервер не принял ни одного адреса группы
+            refused = e.recipients
+        return {
+            envelope.email: smtplib.SMTPRecipientsRefused({address: refused[address]})
+            for envelope, address in zip(batch, addresses)
+            if address in refused
+        }
+
+    def _connect(self):
+        """Создает соединение, дождавшись свободного места в ограничении connection_slots."""
+        if self.connection_slots is not None:
+            self.connection_slots.acquire()
+        try:
+            return self.connection_factory()
+        except Exception:
+            if self.connection_slots is not None:
+                self.connection_slots.release()
+            raise
+
+    def _close(self, connection):
+        """Закрывает соединение, не прерывая отправку из-за ошибок при закрытии, и освобождает место."""
+        if connection is None:
+            return
+        try:
+            connection.close()
+        except Exception as e:
+            logger.warning(f"Ошибка при закрытии SMTP-соединения: {e}")
+        finally:
+            if self.connection_slots is not None:
+                self.connection_slots.release()
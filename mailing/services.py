@@ -1,50 +1,264 @@
+import logging
+from datetime import datetime
+from typing import NamedTuple
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
 from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.functions import Left
+from django.utils import timezone
+
+from .async_engine import AsyncMailEngine
+from .circuit import get_circuit_breaker
+from .counters import get_dashboard_counters
+from .dashboard import get_dashboard_version, get_or_compute
+from .engines import get_engine
+from .models import CustomUser, Mailing, MailingAttempt, RecipientDelivery
+from .recorder import AttemptRecorder
+from .sending import stream_envelopes
+from .suppression import skip_suppressed, suppressed_response
+
+logger = logging.getLogger(__name__)
+
+# Длина ответа сервера в блоке последних попыток главной страницы
+RECENT_RESPONSE_LENGTH = 200
+# Ключ кеша общих данных главной страницы (для менеджеров)
+GLOBAL_INDEX_PAGE_KEY = "index_page_data/global"
+# Время хранения общих данных в интервалах обновления: если фоновое обновление
+# остановилось, данные вычисляются заново при первом промахе, а не хранятся вечно
+GLOBAL_INDEX_PAGE_TTL_INTERVALS = 3
+
+
+class RecentAttempt(NamedTuple):
+    """Попытка рассылки в блоке последних попыток главной страницы."""
+
+    id: int
+    attempted_at: datetime
+    status: str
+    mail_server_response: str
+    mailing_id: int
+    subject: str
+
+
+def get_recent_attempts(owner_id=None, limit=None) -> list:
+    """
+    Возвращает последние попытки рассылки одним запросом с LIMIT.
+
+    Параметры:
+    owner_id (int, optional): Идентификатор владельца рассылок. None - попытки всех пользователей.
+    limit (int, optional): Количество попыток (MAILING_DASHBOARD_RECENT_ATTEMPTS).
+
+    Возвращает:
+    list[RecentAttempt]: Попытки от новых к старым; ответ сервера обрезан до RECENT_RESPONSE_LENGTH символов.
+    """
+    attempts = MailingAttempt.objects.all()
+    if owner_id is not None:
+        attempts = attempts.filter(mailing__owner=owner_id)
+    rows = (
+        attempts.annotate(response=Left("mail_server_response", RECENT_RESPONSE_LENGTH))
+        .order_by("-id")
+        .values_list("id", "attempted_at", "status", "response", "mailing_id", "mailing__message__title")
+    )
+    return [RecentAttempt(*row) for row in rows[: limit or settings.MAILING_DASHBOARD_RECENT_ATTEMPTS]]
+
+
+def compute_index_page_data(owner_id=None) -> dict:
+    """
+    Вычисляет данные главной страницы из строки счетчиков (см. mailing.counters) и последних попыток.
+
+    Параметры:
+    owner_id (int, optional): Идентификатор владельца. None - общие данные всех пользователей.
 
-from .models import CustomUser, Mailing, MailingAttempt, Recipient
+    Возвращает:
+    dict: Количество попыток рассылки, успешных и неудачных попыток, рассылок и получателей
+          и последние попытки рассылки (recent_attempts).
+    """
+    counters = get_dashboard_counters(owner_id)
+    return {
+        "recent_attempts": get_recent_attempts(owner_id),
+        "attempt_count": counters.attempt_count,
+        "attempt_success_count": counters.attempt_success,
+        "attempt_failure_count": counters.attempt_failure,
+        "mailing_count": counters.mailing_count,
+        "mailing_running_count": counters.mailing_running,
+        "recipient_count": counters.recipients,
+    }
+
+
+def refresh_global_index_page_data() -> dict:
+    """
+    Вычисляет общие данные главной страницы и сохраняет их в кеше.
+
+    Вызывается по расписанию задачей refresh_global_dashboard (MAILING_DASHBOARD_GLOBAL_REFRESH_INTERVAL):
+    данные одни для всех менеджеров и обновляются один раз за интервал. Данные хранятся
+    GLOBAL_INDEX_PAGE_TTL_INTERVALS интервалов, поэтому при остановленном celery beat они не устаревают навсегда.
+
+    Возвращает:
+    dict: Общие данные главной страницы с временем вычисления (refreshed_at).
+    """
+    data = _compute_global_index_page_data()
+    cache.set(GLOBAL_INDEX_PAGE_KEY, data, _global_index_page_timeout())
+    return data
 
 
 def get_index_page_cache_data(user: CustomUser) -> dict:
     """
     Возвращает кешированные данные для главной страницы.
 
-    Если данные уже находятся в кеше, они будут возвращены.
-    В противном случае функция извлекает данные из базы данных в зависимости от группы пользователя
-    и сохраняет их в кеш.
+    Менеджер получает общие данные всех пользователей, которые по расписанию обновляет фоновая
+    задача (см. refresh_global_index_page_data). Если данных в кеше нет (после очистки кеша,
+    до первого обновления или при остановленном celery beat), их вычисляет только один процесс,
+    остальные ждут его результата (см. mailing.dashboard.get_or_compute).
+
+    Данные остальных пользователей хранятся в кеше под ключом с версией данных владельца
+    (см. mailing.dashboard). Версия меняется после фиксации каждого изменения счетчиков,
+    поэтому данные хранятся часами и не устаревают. В кеше хранятся только числа и последние
+    попытки (см. get_recent_attempts), поэтому размер данных не зависит от количества попыток.
 
     Параметры:
     user (CustomUser): Пользователь, для которого запрашиваются данные.
 
     Возвращает:
     dict: Словарь с кешированными данными, включая количество попыток рассылки,
-          количество успешных и неудачных попыток, количество рассылок и получателей.
+          количество успешных и неудачных попыток, количество рассылок и получателей
+          и последние попытки рассылки (recent_attempts).
     """
-    context_from_cache = cache.get(f"index_page_data/{user.email}")
-    if context_from_cache:
-        return context_from_cache
-
-    context_update = {}
     if user.groups.filter(name="Менеджер").exists():
-        mailing_attempt = MailingAttempt.objects.all()
-        mailing = Mailing.objects.all()
-        recipient = Recipient.objects.all()
+        return get_or_compute(
+            GLOBAL_INDEX_PAGE_KEY, _compute_global_index_page_data, _global_index_page_timeout()
+        )
+
+    version = get_dashboard_version(user.id)
+    return get_or_compute(f"index_page_data/{user.id}/{version}", lambda: compute_index_page_data(user.id))
+
+
+def _compute_global_index_page_data():
+    return {**compute_index_page_data(), "refreshed_at": timezone.now()}
 
+
+def _global_index_page_timeout():
+    return int(settings.MAILING_DASHBOARD_GLOBAL_REFRESH_INTERVAL * GLOBAL_INDEX_PAGE_TTL_INTERVALS)
+
+
+def prepare_deliveries(mailing: Mailing, restart: bool = True, batch_size: int = 1000) -> int:
+    """
+    Создает состояния доставки рассылки для всех ее получателей.
+
+    Параметры:
+    mailing (Mailing): Рассылка.
+    restart (bool): Вернуть уже обработанных получателей в очередь на отправку
+        и удалить состояния получателей, исключенных из рассылки.
+    batch_size (int): Размер пачки при создании состояний.
+
+    Возвращает:
+    int: Количество получателей, ожидающих отправки.
+    """
+    if restart:
+        mailing.deliveries.exclude(recipient__in=mailing.recipients.all()).delete()
+        mailing.deliveries.exclude(status=RecipientDelivery.PENDING, attempt_count=0).update(
+            status=RecipientDelivery.PENDING, attempt_count=0, last_error=None, next_attempt_at=None
+        )
+
+    missing = (
+        mailing.recipients.exclude(deliveries__mailing=mailing)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    batch = []
+    for recipient_id in missing.iterator(chunk_size=batch_size):
+        batch.append(RecipientDelivery(mailing=mailing, recipient_id=recipient_id))
+        if len(batch) == batch_size:
+            RecipientDelivery.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    RecipientDelivery.objects.bulk_create(batch, ignore_conflicts=True)
+    return mailing.deliveries.filter(status=RecipientDelivery.PENDING).count()
+
+
+def due_deliveries(deliveries, now=None):
+    """
+    Отбирает получателей, которым пора отправлять письмо.
+
+    Получатели с временной ошибкой ждут в очереди до next_attempt_at.
+
+    Параметры:
+    deliveries (QuerySet[RecipientDelivery]): Состояния доставки.
+    now (datetime, optional): Текущее время.
+
+    Возвращает:
+    QuerySet[RecipientDelivery]: Ожидающие отправки получатели, срок отправки которых наступил.
+    """
+    return deliveries.filter(
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now or timezone.now()),
+        status=RecipientDelivery.PENDING,
+    )
+
+
+def send_mailing(mailing: Mailing, engine: str = None, deliveries=None, worker_id: str = None, **options) -> None:
+    """
+    Отправляет рассылку получателям, ожидающим отправки, и записывает попытки рассылки.
+
+    Получатели берутся из состояний доставки (RecipientDelivery) со статусом "Ожидает отправки",
+    поэтому после сбоя повторный запуск отправляет письма только оставшимся получателям.
+    Адреса из списка подавления пропускаются, а адреса с жестким отказом попадают в него.
+    Если SMTP-сервер недоступен, выключатель (mailing.circuit) прерывает отправку
+    и рассылка приостанавливается (см. pause_mailing).
+
+    Параметры:
+    mailing (Mailing): Рассылка.
+    engine (str, optional): Движок отправки: "batch", "threads" или "asyncio".
+        По умолчанию берется из настройки MAILING_ENGINE.
+    deliveries (QuerySet[RecipientDelivery], optional): Состояния доставки, по которым
+        отправляются письма. По умолчанию - все ожидающие отправки получатели рассылки.
+    worker_id (str, optional): Обработчик, захвативший получателей (см. mailing.leasing):
+        захват продлевается при каждой записи попыток.
+    **options: Параметры движка (см. mailing.engines.get_engine).
+    """
+    if deliveries is None:
+        deliveries = mailing.deliveries.all()
+    deliveries = due_deliveries(deliveries)
+    sender = get_engine(engine or settings.MAILING_ENGINE, **options)
+    breaker = get_circuit_breaker(
+        options.get("smtp_host") or settings.EMAIL_HOST, options.get("smtp_port") or settings.EMAIL_PORT
+    )
+    if isinstance(sender, AsyncMailEngine):
+        stopped = async_to_sync(sender.send_mailing)(mailing, deliveries, breaker, worker_id)
     else:
-        mailing_attempt = MailingAttempt.objects.filter(mailing__owner=user.id)
-        mailing = Mailing.objects.filter(owner=user.id)
-        recipient = Recipient.objects.filter(owner=user.id)
-
-    attempt_count = mailing_attempt.count()
-    attempt_success_count = mailing_attempt.filter(status="success").count()
-    attempt_failure_count = mailing_attempt.filter(status="failure").count()
-    mailing_count = mailing.count()
-    mailing_running_count = mailing.filter(status="running").count()
-    recipient_count = recipient.count()
-    context_update["object_list"] = mailing_attempt
-    context_update["attempt_count"] = attempt_count
-    context_update["attempt_success_count"] = attempt_success_count
-    context_update["attempt_failure_count"] = attempt_failure_count
-    context_update["mailing_count"] = mailing_count
-    context_update["mailing_running_count"] = mailing_running_count
-    context_update["recipient_count"] = recipient_count
-    cache.set(f"index_page_data/{user.email}", context_update, 5)
-    return context_update
+        with AttemptRecorder(worker_id=worker_id) as recorder:
+            # Адресатам из списка подавления письма не отправляются, попытка сразу неудачная
+            envelopes = breaker.guard(
+                skip_suppressed(
+                    stream_envelopes(deliveries),
+                    lambda envelope: recorder.add(
+                        mailing, MailingAttempt.FAILURE, suppressed_response(envelope.email), delivery_id=envelope.id
+                    ),
+                )
+            )
+            for result in sender.send(mailing, envelopes):
+                breaker.record(result)
+                recorder.add_result(mailing, result)
+        stopped = envelopes.stopped
+    if stopped:
+        pause_mailing(mailing, deliveries, breaker.retry_at)
+
+
+def pause_mailing(mailing: Mailing, deliveries, until=None) -> None:
+    """
+    Приостанавливает отправку рассылки, прерванную выключателем SMTP-сервера.
+
+    Захват неотправленных получателей пачки снимается. Если сервер все еще недоступен,
+    все ожидающие отправки получатели рассылки откладываются до пробной отправки (until):
+    попытки не записываются и не расходуются, а отправку возобновляет тот же механизм,
+    что и повторы после временных ошибок (планировщик или задача retry_mailing).
+
+    Параметры:
+    mailing (Mailing): Рассылка.
+    deliveries (QuerySet[RecipientDelivery]): Состояния доставки прерванной отправки.
+    until (datetime, optional): Время пробной отправки. None, если сервер снова доступен.
+    """
+    now = timezone.now()
+    deliveries.update(leased_by=None, lease_expires_at=None, updated_at=now)
+    if until is None:
+        return
+    paused = due_deliveries(mailing.deliveries.all(), now).update(next_attempt_at=until, updated_at=now)
+    logger.warning(f"Рассылка {mailing.pk} приостановлена до {until}: отложено получателей - {paused}")
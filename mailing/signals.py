@@ -0,0 +1,90 @@
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from mailing.counters import ATTEMPT_FIELDS, CounterDeltas
+from mailing.models import Mailing, MailingAttempt, Recipient, SuppressedEmail
+from mailing.scheduler import bump_schedule_version
+from mailing.suppression import bump_suppression_version
+
+
+@receiver(post_save, sender=Mailing)
+@receiver(post_delete, sender=Mailing)
+def mailing_schedule_changed(sender, **kwargs):
+    """Обновляет версию расписания рассылок при изменении рассылки."""
+    bump_schedule_version()
+
+
+@receiver(post_delete, sender=SuppressedEmail)
+def suppression_list_changed(sender, **kwargs):
+    """Обновляет версию списка подавления при удалении адреса."""
+    bump_suppression_version()
+
+
+@receiver(pre_save, sender=Mailing)
+@receiver(pre_save, sender=Recipient)
+def remember_counted_state(sender, instance, raw=False, **kwargs):
+    """Запоминает статус и владельца объекта в базе перед сохранением для счетчиков главной страницы."""
+    fields = ("owner_id", "status") if sender is Mailing else ("owner_id",)
+    instance._counted_state = None
+    if instance.pk is not None and not raw:
+        instance._counted_state = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+
+
+@receiver(post_save, sender=Mailing)
+def mailing_counters_changed(sender, instance, created, **kwargs):
+    """Обновляет счетчики рассылок по статусам при создании рассылки или смене статуса и владельца."""
+    deltas = CounterDeltas()
+    previous = None if created else getattr(instance, "_counted_state", None)
+    if previous is not None:
+        deltas.add_mailing_status(previous[0], previous[1], None)
+    elif not created:
+        return
+    deltas.add_mailing_status(instance.owner_id, None, instance.status)
+    deltas.apply()
+
+
+@receiver(pre_delete, sender=Mailing)
+def mailing_counters_deleted(sender, instance, **kwargs):
+    """Вычитает удаляемую рассылку и ее попытки из счетчиков главной страницы."""
+    # Статус и владелец берутся из базы: объект в памяти мог устареть
+    counted = Mailing.objects.filter(pk=instance.pk).values_list("owner_id", "status").first()
+    if counted is None:
+        return
+    owner_id, status = counted
+    deltas = CounterDeltas()
+    deltas.add_mailing_status(owner_id, status, None)
+    attempts = instance.attempts.values_list("status").annotate(total=Count("id")).order_by()
+    for attempt_status, total in attempts:
+        deltas.add(owner_id, ATTEMPT_FIELDS.get(attempt_status), -total)
+    deltas.apply()
+
+
+@receiver(post_save, sender=MailingAttempt)
+def attempt_counters_added(sender, instance, created, **kwargs):
+    """Учитывает попытку, сохраненную через save() (попытки из AttemptRecorder учитываются им самим)."""
+    if created:
+        deltas = CounterDeltas()
+        deltas.add(instance.mailing.owner_id, ATTEMPT_FIELDS.get(instance.status))
+        deltas.apply()
+
+
+@receiver(post_save, sender=Recipient)
+def recipient_counters_changed(sender, instance, created, **kwargs):
+    """Обновляет счетчики получателей при создании получателя или смене владельца."""
+    previous = None if created else getattr(instance, "_counted_state", None)
+    if not created and (previous is None or previous[0] == instance.owner_id):
+        return
+    deltas = CounterDeltas()
+    if previous is not None:
+        deltas.add(previous[0], "recipients", -1)
+    deltas.add(instance.owner_id, "recipients", 1)
+    deltas.apply()
+
+
+@receiver(post_delete, sender=Recipient)
+def recipient_counters_deleted(sender, instance, **kwargs):
+    """Вычитает удаленного получателя из счетчиков главной страницы."""
+    deltas = CounterDeltas()
+    deltas.add(instance.owner_id, "recipients", -1)
+    deltas.apply()
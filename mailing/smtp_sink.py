@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPSink:
+    """
+    Локальный SMTP-сервер-заглушка.
+
+    Принимает письма по протоколу SMTP и никуда их не доставляет. Используется для
+    тестов и замеров скорости движков отправки без обращения к настоящему почтовому серверу.
+
+    Заглушка умеет имитировать сбои настоящего сервера: задержку ответов, временные (451)
+    и постоянные (550) отказы в приеме получателя и разрывы соединения. Длительность каждой
+    SMTP-транзакции (от MAIL FROM до ответа на DATA) сохраняется в transaction_times.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        refused_recipients=(),
+        latency=0,
+        temp_failure_rate=0,
+        perm_failure_rate=0,
+        drop_rate=0,
+        seed=None,
+    ):
+        """
+        Параметры:
+        host (str, optional): Адрес, на котором принимаются соединения.
+        port (int, optional): Порт. При значении 0 выбирается свободный порт.
+        refused_recipients (Iterable[str], optional): Адреса, на которые сервер отвечает
+            550 (нет такого ящика).
+        latency (float, optional): Задержка перед ответом на каждую команду, в секундах.
+        temp_failure_rate (float, optional): Доля получателей с ответом 451 на RCPT TO.
+        perm_failure_rate (float, optional): Доля получателей с ответом 550 на RCPT TO.
+        drop_rate (float, optional): Доля получателей, на которых соединение разрывается.
+        seed (int, optional): Начальное значение генератора случайных сбоев.
+        """
+        self.host = host
+        self.port = port
+        self.refused_recipients = {email.lower() for email in refused_recipients}
+        self.latency = latency
+        self.temp_failure_rate = temp_failure_rate
+        self.perm_failure_rate = perm_failure_rate
+        self.drop_rate = drop_rate
+        self.messages = 0
+        self.recipients = 0
+        self.temp_failures = 0
+        self.perm_failures = 0
+        self.drops = 0
+        self.transaction_times = []
+        self._random = random.Random(seed)
+        self._server = None
+
+    async def start(self):
+        """Запускает прием соединений."""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"SMTP-заглушка запущена на {self.host}:{self.port}")
+
+    async def serve_forever(self):
+        """Запускает сервер и обслуживает соединения до отмены."""
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        """Останавливает прием соединений."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    @contextmanager
+    def run_in_thread(self):
+        """
+        Запускает сервер в отдельном потоке со своим циклом событий.
+
+        Возвращает:
+        SMTPSink: Запущенный сервер (порт доступен в атрибуте port).
+        """
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, name="smtp-sink", daemon=True)
+        thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), loop).result()
+        try:
+            yield self
+        finally:
+            asyncio.run_coroutine_threadsafe(self.stop(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    def _rcpt_reply(self, line):
+        """Возвращает ответ на RCPT TO или None, если соединение нужно разорвать."""
+        address = line.partition(b"<")[2].partition(b">")[0].decode().lower()
+        if address in self.refused_recipients:
+            self.perm_failures += 1
+            return b"550 No such user\r\n"
+        chance = self._random.random()
+        if chance < self.drop_rate:
+            self.drops += 1
+            return None
+        chance -= self.drop_rate
+        if chance < self.temp_failure_rate:
+            self.temp_failures += 1
+            return b"451 Try again later\r\n"
+        chance -= self.temp_failure_rate
+        if chance < self.perm_failure_rate:
+            self.perm_failures += 1
+            return b"550 No such user\r\n"
+        self.recipients += 1
+        return b"250 OK\r\n"
+
+    async def _handle(self, reader, writer):
+        """Обслуживает одно SMTP-соединение."""
+        writer.write(b"220 localhost SMTP sink\r\n")
+        started_at = None
+        try:
+            while line := await reader.readline():
+                command = line[:4].upper()
+                received_at = time.perf_counter()
+                if self.latency and command != b"QUIT":
+                    await asyncio.sleep(self.latency)
+                if command == b"EHLO":
+                    writer.write(b"250-localhost\r\n250-8BITMIME\r\n250 PIPELINING\r\n")
+                elif command == b"RCPT":
+                    reply = self._rcpt_reply(line)
+                    if reply is None:
+                        break
+                    writer.write(reply)
+                elif command == b"DATA":
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    await writer.drain()
+                    while await reader.readline() not in (b".\r\n", b".\n", b""):
+                        pass
+                    self.messages += 1
+                    writer.write(b"250 OK: queued\r\n")
+                    if started_at is not None:
+                        self.transaction_times.append(time.perf_counter() - started_at)
+                        started_at = None
+                elif command == b"QUIT":
+                    writer.write(b"221 Bye\r\n")
+                    await writer.drain()
+                    break
+                elif command == b"MAIL":
+                    started_at = received_at
+                    writer.write(b"250 OK\r\n")
+                elif command in (b"HELO", b"RSET", b"NOOP"):
+                    writer.write(b"250 OK\r\n")
+                else:
+                    writer.write(b"502 Command not implemented\r\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
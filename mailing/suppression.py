@@ -0,0 +1,286 @@
+import hashlib
+import logging
+import math
+import threading
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from mailing.models import SuppressedEmail
+
+logger = logging.getLogger(__name__)
+
+SUPPRESSION_VERSION_KEY = "mailing_suppression/version"
+
+# Запас при инкрементальной загрузке: строки параллельных транзакций фиксируются не по порядку
+LOAD_OVERLAP = timedelta(minutes=5)
+
+
+def normalize_email(email: str) -> str:
+    """
+    Приводит адрес к виду, в котором он хранится в списке подавления.
+
+    Параметры:
+    email (str): Адрес почты.
+
+    Возвращает:
+    str: Адрес без пробелов по краям, в нижнем регистре.
+    """
+    return email.strip().lower()
+
+
+def suppressed_response(email: str) -> str:
+    """
+    Возвращает текст попытки рассылки для адресата из списка подавления.
+
+    Параметры:
+    email (str): Адрес почты.
+
+    Возвращает:
+    str: Текст для поля mail_server_response.
+    """
+    return f"{email}: Не отправлено: адрес в списке подавления"
+
+
+def bump_suppression_version():
+    """Сообщает процессам, что из списка подавления удалены адреса и фильтр нужно построить заново."""
+    try:
+        cache.incr(SUPPRESSION_VERSION_KEY)
+    except ValueError:
+        cache.set(SUPPRESSION_VERSION_KEY, 1, None)
+
+
+class BloomFilter:
+    """
+    Фильтр Блума: компактное вероятностное множество строк.
+
+    Проверка may_contain() не дает ложноотрицательных ответов и дает ложноположительные
+    с вероятностью около error_rate, пока в фильтре не больше capacity элементов.
+    Счетчик count учитывает только элементы, добавление которых изменило фильтр,
+    поэтому повторное добавление того же элемента его не увеличивает.
+    """
+
+    def __init__(self, capacity, error_rate):
+        """
+        Параметры:
+        capacity (int): Ожидаемое количество элементов.
+        error_rate (float): Допустимая доля ложноположительных ответов.
+        """
+        self.capacity = max(capacity, 1)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        bits = self._bits
+        added = False
+        for position in self._positions(value):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def may_contain(self, value):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class SuppressionList:
+    """
+    Список подавления в памяти процесса.
+
+    Адреса проверяются фильтром Блума, и только положительные ответы фильтра подтверждаются
+    точным запросом к таблице SuppressedEmail, поэтому для почти всех получателей проверка
+    не обращается к базе. Фильтр пополняется инкрементально: refresh() читает только строки,
+    добавленные после последней загрузки (с запасом LOAD_OVERLAP). Полностью фильтр строится заново, когда
+    число адресов превышает его емкость или когда адреса удаляются из списка (удалить элемент
+    из фильтра Блума нельзя).
+    """
+
+    def __init__(self, capacity=None, error_rate=None):
+        """
+        Параметры:
+        capacity (int, optional): Начальная емкость фильтра (MAILING_SUPPRESSION_CAPACITY).
+        error_rate (float, optional): Доля ложноположительных ответов (MAILING_SUPPRESSION_ERROR_RATE).
+        """
+        self.capacity = capacity or settings.MAILING_SUPPRESSION_CAPACITY
+        self.error_rate = error_rate or settings.MAILING_SUPPRESSION_ERROR_RATE
+        self._lock = threading.Lock()
+        self._filter = None
+        self._loaded_until = None
+        self._version = None
+
+    def refresh(self):
+        """Загружает в фильтр адреса, добавленные в список подавления с прошлого обновления."""
+        with self._lock:
+            version = cache.get(SUPPRESSION_VERSION_KEY, 0)
+            if self._filter is None or version != self._version:
+                self._rebuild(version)
+                return
+            self._load(self._filter)
+
+    def add(self, emails):
+        """
+        Добавляет адреса в фильтр процесса сразу, не дожидаясь refresh().
+
+        Параметры:
+        emails (Iterable[str]): Адреса почты.
+        """
+        with self._lock:
+            if self._filter is None:
+                return
+            for email in emails:
+                self._filter.add(normalize_email(email))
+
+    def find(self, emails):
+        """
+        Возвращает адреса, которые есть в списке подавления.
+
+        Параметры:
+        emails (Iterable[str]): Адреса почты.
+
+        Возвращает:
+        set[str]: Подавленные адреса в исходном написании.
+        """
+        if self._filter is None:
+            self.refresh()
+        candidates = {}
+        for email in emails:
+            normalized = normalize_email(email)
+            if self._filter.may_contain(normalized):
+                candidates.setdefault(normalized, []).append(email)
+        if not candidates:
+            return set()
+        found = SuppressedEmail.objects.filter(email__in=list(candidates)).values_list("email", flat=True)
+        return {email for normalized in found for email in candidates[normalized]}
+
+    def _rebuild(self, version):
+        total = SuppressedEmail.objects.count()
+        capacity = self.capacity
+        while capacity < total * 2:
+            capacity *= 2
+        bloom = BloomFilter(capacity, self.error_rate)
+        self._loaded_until = None
+        self._load(bloom)
+        self._filter = bloom
+        self._version = version
+        logger.info(f"Фильтр списка подавления построен: адресов - {bloom.count}, емкость - {capacity}")
+
+    def _load(self, bloom):
+        rows = SuppressedEmail.objects.all()
+        if self._loaded_until is not None:
+            rows = rows.filter(created_at__gte=self._loaded_until - LOAD_OVERLAP)
+        rows = rows.order_by("created_at").values_list("email", "created_at")
+        for email, created_at in rows.iterator(chunk_size=settings.MAILING_STREAM_CHUNK_SIZE):
+            bloom.add(email)
+            self._loaded_until = created_at
+        if bloom.count > bloom.capacity:
+            self._rebuild(self._version)
+
+
+_suppression_list = None
+_suppression_list_lock = threading.Lock()
+
+
+def get_suppression_list():
+    """
+    Возвращает список подавления процесса.
+
+    Возвращает:
+    SuppressionList: Общий для всех потоков процесса список подавления.
+    """
+    global _suppression_list
+    with _suppression_list_lock:
+        if _suppression_list is None:
+            _suppression_list = SuppressionList()
+        return _suppression_list
+
+
+def suppress(entries):
+    """
+    Добавляет адреса в список подавления.
+
+    Параметры:
+    entries (Iterable[tuple[str, str]]): Пары (адрес, причина).
+    """
+    rows = {normalize_email(email): reason for email, reason in entries}
+    if not rows:
+        return
+    SuppressedEmail.objects.bulk_create(
+        [SuppressedEmail(email=email, reason=reason) for email, reason in rows.items()],
+        ignore_conflicts=True,
+    )
+    get_suppression_list().add(rows)
+
+
+def skip_suppressed(envelopes, on_suppressed, chunk_size=None):
+    """
+    Пропускает адресатов из списка подавления до отправки.
+
+    Адресаты проверяются пачками: фильтр Блума в памяти и один точный запрос
+    на пачку для положительных ответов фильтра.
+
+    Параметры:
+    envelopes (Iterable[Envelope]): Адресаты.
+    on_suppressed (callable): Вызывается для каждого пропущенного адресата.
+    chunk_size (int, optional): Размер пачки проверки (MAILING_QUEUE_SIZE).
+
+    Возвращает:
+    Iterator[Envelope]: Адресаты, которым можно отправлять письма.
+    """
+    chunk_size = chunk_size or settings.MAILING_QUEUE_SIZE
+    suppression_list = get_suppression_list()
+    suppression_list.refresh()
+    chunk = []
+    for envelope in envelopes:
+        chunk.append(envelope)
+        if len(chunk) >= chunk_size:
+            yield from _split_chunk(suppression_list, chunk, on_suppressed)
+            chunk = []
+    yield from _split_chunk(suppression_list, chunk, on_suppressed)
+
+
+async def askip_suppressed(envelopes, on_suppressed, chunk_size=None):
+    """Асинхронная версия skip_suppressed(): on_suppressed - сопрограммная функция."""
+    chunk_size = chunk_size or settings.MAILING_QUEUE_SIZE
+    suppression_list = get_suppression_list()
+    await sync_to_async(suppression_list.refresh)()
+    chunk = []
+
+    async def split():
+        suppressed = await sync_to_async(suppression_list.find)([envelope.email for envelope in chunk])
+        for envelope in chunk:
+            if envelope.email in suppressed:
+                await on_suppressed(envelope)
+            else:
+                yield envelope
+
+    async for envelope in envelopes:
+        chunk.append(envelope)
+        if len(chunk) >= chunk_size:
+            async for allowed in split():
+                yield allowed
+            chunk = []
+    async for allowed in split():
+        yield allowed
+
+
+def _split_chunk(suppression_list, chunk, on_suppressed):
+    suppressed = suppression_list.find(envelope.email for envelope in chunk)
+    for envelope in chunk:
+        if envelope.email in suppressed:
+            on_suppressed(envelope)
+        else:
+            yield envelope
@@ -0,0 +1,263 @@
+import logging
+
+from celery import chord, shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
+
+from mailing.counters import update_mailing_status
+from mailing.leasing import send_claimed, send_leased
+from mailing.models import Mailing, RecipientDelivery
+from mailing.outbox import add_to_outbox, relay_outbox
+from mailing.progress import reset_mailing_progress
+from mailing.services import prepare_deliveries, refresh_global_index_page_data
+
+logger = logging.getLogger(__name__)
+
+
+def split_deliveries(mailing, chunk_size):
+    """
+    Делит ожидающих отправки получателей рассылки на диапазоны идентификаторов состояний доставки.
+
+    Параметры:
+    mailing (Mailing): Рассылка.
+    chunk_size (int): Количество получателей в одном диапазоне.
+
+    Возвращает:
+    list[tuple[int, int]]: Диапазоны (первый id, последний id) включительно.
+    """
+    chunks = []
+    first_id = last_id = None
+    count = 0
+    delivery_ids = (
+        mailing.deliveries.filter(status=RecipientDelivery.PENDING)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    for delivery_id in delivery_ids.iterator(chunk_size=chunk_size):
+        if first_id is None:
+            first_id = delivery_id
+        last_id = delivery_id
+        count += 1
+        if count == chunk_size:
+            chunks.append((first_id, last_id))
+            first_id = None
+            count = 0
+    if first_id is not None:
+        chunks.append((first_id, last_id))
+    return chunks
+
+
+def reset_progress_from_deliveries(mailing):
+    """
+    Устанавливает счетчики хода отправки рассылки по состояниям доставки.
+
+    Параметры:
+    mailing (Mailing): Рассылка.
+    """
+    counts = mailing.deliveries.aggregate(
+        total=Count("id"),
+        success=Count("id", filter=Q(status=RecipientDelivery.SENT)),
+        failure=Count("id", filter=Q(status=RecipientDelivery.FAILED)),
+    )
+    reset_mailing_progress(mailing.pk, **counts)
+
+
+def enqueue_mailing(mailing: Mailing, statuses=None) -> bool:
+    """
+    Ставит рассылку в очередь на отправку, если она еще не отправляется.
+
+    Статус рассылки меняется на "Запущена" условным UPDATE с блокировкой строки
+    (см. mailing.counters.update_mailing_status), поэтому повторное нажатие
+    или повторный POST-запрос не запускают вторую отправку той же рассылки.
+    Получатели повторно запускаемой рассылки возвращаются в очередь в той же транзакции,
+    а задача start_mailing только продолжает отправку ожидающим получателям.
+    Задача ставится после фиксации транзакции; если брокер недоступен, рассылке
+    возвращается прежний статус, чтобы ее можно было запустить снова.
+
+    Параметры:
+    mailing (Mailing): Рассылка.
+    statuses (list[str], optional): Статусы, из которых рассылку можно запустить.
+        По умолчанию - любой, кроме "Запущена".
+
+    Возвращает:
+    bool: True, если отправка поставлена в очередь, False - если рассылка уже отправляется.
+    """
+    mailings = Mailing.objects.filter(pk=mailing.pk)
+    if statuses is not None:
+        mailings = mailings.filter(status__in=statuses)
+    with transaction.atomic():
+        previous_status = mailings.values_list("status", flat=True).first()
+        started = update_mailing_status(mailings, Mailing.RUNNING)
+        if started:
+            if mailing.deliveries.exists():
+                prepare_deliveries(mailing)
+            reset_mailing_progress(mailing.pk, mailing.recipients.count())
+            transaction.on_commit(lambda: _start_or_revert(mailing.pk, previous_status))
+    return bool(started)
+
+
+def _start_or_revert(mailing_id, previous_status):
+    try:
+        start_mailing.delay(mailing_id)
+    except Exception:
+        logger.exception(f"Рассылка {mailing_id} не поставлена в очередь, статус возвращен")
+        update_mailing_status(Mailing.objects.filter(pk=mailing_id, status=Mailing.RUNNING), previous_status)
+
+
+def enqueue_transactional_email(
+    dedup_key, subject, message, recipient_list, from_email=None, html_message=None
+):
+    """
+    Записывает служебное письмо в исходящую очередь и запускает ее отправку.
+
+    Письмо записывается в текущей транзакции (см. mailing.outbox.add_to_outbox), а задача
+    send_outbox ставится после ее фиксации: если изменение (например, создание
+    пользователя) откатилось, письмо не уходит, а ответ на запрос не ждет SMTP-сервера.
+    Недоступность брокера не прерывает запрос: письмо отправит relay_outbox.
+
+    Параметры:
+    dedup_key (str): Ключ дедупликации письма.
+    subject (str): Тема письма.
+    message (str): Текст письма.
+    recipient_list (list[str]): Адреса получателей.
+    from_email (str, optional): Адрес отправителя (DEFAULT_FROM_EMAIL).
+    html_message (str, optional): HTML-версия письма.
+
+    Возвращает:
+    bool: True, если письмо добавлено, False - если письмо с таким ключом уже есть.
+    """
+    created = add_to_outbox(dedup_key, subject, message, recipient_list, from_email, html_message)
+    if created:
+        transaction.on_commit(_queue_outbox)
+    return created
+
+
+def _queue_outbox():
+    try:
+        send_outbox.delay()
+    except Exception:
+        # Письмо уже в исходящей очереди, его отправит резидентная команда relay_outbox
+        logger.exception("Задача отправки служебных писем не поставлена в очередь")
+
+
+@shared_task
+def send_outbox():
+    """
+    Отправляет ожидающие служебные письма из исходящей очереди.
+
+    Задача направляется в очередь MAILING_TRANSACTIONAL_QUEUE, которую обрабатывает
+    отдельный воркер, поэтому письма не ждут окончания массовых рассылок. Повторы после
+    временных ошибок отправляет резидентная команда relay_outbox.
+    """
+    sent = relay_outbox()
+    if sent:
+        logger.info(f"Отправлено служебных писем: {sent}")
+
+
+@shared_task
+def refresh_global_dashboard():
+    """
+    Обновляет общие данные главной страницы, которые видят все менеджеры.
+
+    Задача запускается celery beat каждые MAILING_DASHBOARD_GLOBAL_REFRESH_INTERVAL секунд.
+    """
+    refresh_global_index_page_data()
+
+
+@shared_task
+def start_mailing(mailing_id, chunk_size=None):
+    """
+    Запускает рассылку: делит получателей на части и отправляет их параллельными задачами.
+
+    Рассылка блокируется так же, как в mailing.leasing.start_mailings, и отправляется,
+    только если она все еще запущена. Состояния доставки создаются, если их еще нет,
+    иначе отправка продолжается только ожидающим получателям, поэтому повторная доставка
+    задачи или sand_mail, запустивший рассылку раньше задачи, не отправляют письма дважды.
+    Когда все части отправлены, задача complete_mailing переводит рассылку в статус "Завершена".
+
+    Параметры:
+    mailing_id (int): Идентификатор рассылки.
+    chunk_size (int, optional): Количество получателей в одной задаче (MAILING_CHUNK_SIZE).
+    """
+    with transaction.atomic():
+        mailing = Mailing.objects.select_for_update(skip_locked=True).filter(pk=mailing_id).first()
+        if mailing is None or mailing.status != Mailing.RUNNING:
+            logger.info(f"Рассылка {mailing_id} не запущена или ее запускает другой обработчик")
+            return
+        if not mailing.deliveries.exists():
+            prepare_deliveries(mailing, restart=False)
+
+    reset_progress_from_deliveries(mailing)
+    chunks = split_deliveries(mailing, chunk_size or settings.MAILING_CHUNK_SIZE)
+    logger.info(f"Рассылка {mailing_id}: получатели разделены на {len(chunks)} частей")
+    if not chunks:
+        complete_mailing.delay(mailing_id)
+        return
+    chord(
+        send_mailing_chunk.si(mailing_id, first_id, last_id) for first_id, last_id in chunks
+    )(complete_mailing.si(mailing_id))
+
+
+@shared_task
+def send_mailing_chunk(mailing_id, first_delivery_id, last_delivery_id):
+    """
+    Отправляет рассылку получателям из диапазона идентификаторов состояний доставки.
+
+    Получатели захватываются так же, как в sand_mail (см. mailing.leasing.send_leased),
+    поэтому повторная доставка задачи или одновременный запуск sand_mail не отправляют
+    письмо дважды.
+
+    Параметры:
+    mailing_id (int): Идентификатор рассылки.
+    first_delivery_id (int): Первый идентификатор состояния доставки в диапазоне.
+    last_delivery_id (int): Последний идентификатор состояния доставки в диапазоне.
+    """
+    mailing = Mailing.objects.select_related("message").get(pk=mailing_id)
+    deliveries = mailing.deliveries.filter(id__gte=first_delivery_id, id__lte=last_delivery_id)
+    send_leased(mailing, deliveries=deliveries)
+
+
+@shared_task
+def complete_mailing(mailing_id):
+    """
+    Переводит рассылку в статус "Завершена" после отправки всех частей.
+
+    Если у получателей остались повторные отправки после временных ошибок, вместо
+    завершения ставится отложенная задача retry_mailing на срок ближайшего повтора.
+
+    Параметры:
+    mailing_id (int): Идентификатор рассылки.
+    """
+    next_retry_at = (
+        RecipientDelivery.objects.filter(
+            mailing_id=mailing_id,
+            mailing__status=Mailing.RUNNING,
+            status=RecipientDelivery.PENDING,
+            next_attempt_at__isnull=False,
+        ).aggregate(next_retry_at=Min("next_attempt_at"))["next_retry_at"]
+    )
+    if next_retry_at is not None:
+        retry_mailing.apply_async((mailing_id,), eta=next_retry_at)
+        logger.info(f"Рассылка {mailing_id}: повторная отправка запланирована на {next_retry_at}")
+        return
+    update_mailing_status(Mailing.objects.filter(pk=mailing_id), Mailing.COMPLETED)
+    logger.info(f"Рассылка {mailing_id} завершена")
+
+
+@shared_task
+def retry_mailing(mailing_id):
+    """
+    Повторяет отправку получателям рассылки, у которых наступил срок повтора.
+
+    Получатели захватываются через claim_deliveries(), поэтому повторная доставка задачи
+    брокером не приводит к двойной отправке.
+
+    Параметры:
+    mailing_id (int): Идентификатор рассылки.
+    """
+    mailing = Mailing.objects.select_related("message").get(pk=mailing_id)
+    if mailing.status != Mailing.RUNNING:
+        return
+    if not send_claimed(mailing):
+        complete_mailing(mailing_id)
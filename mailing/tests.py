@@ -1,13 +1,76 @@
-from django.test import TestCase
+import asyncio
+import smtplib
+import threading
+import time
+from datetime import timedelta
+from email import message_from_bytes
+from io import StringIO
+from unittest import mock
+
+import aiosmtplib
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import Group
+from django.core import mail
+from django.core.mail import BadHeaderError, EmailMessage, get_connection
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models.deletion import Collector
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from users.models import CustomUser
-from .models import Recipient
-from .services import get_index_page_cache_data
+from .async_engine import AsyncMailEngine
+from .circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, get_circuit_breaker
+from .engines import ThreadPoolMailEngine, get_host_slots
+from .leasing import claim_deliveries, send_leased, start_mailings
+from .models import (
+    AttemptRollup,
+    DashboardCounters,
+    Mailing,
+    MailingAttempt,
+    Message,
+    OutboxEmail,
+    Recipient,
+    RecipientDelivery,
+    SuppressedEmail,
+)
+from .admin import MailingAttemptAdmin
+from .counters import delete_attempts, get_dashboard_counters, rebuild_counters
+from .dashboard import get_or_compute
+from .rollups import update_rollups
+from .outbox import add_to_outbox, build_outbox_message, relay_outbox
+from .recorder import AttemptRecorder
+from .rendering import PreparedMessage, get_message_template, make_unsubscribe_token
+from .retry import classify_error, is_hard_bounce, retry_delay
+from .scheduler import MailingScheduler
+from .sending import BatchMailSender, Envelope, group_by_domain, stream_envelopes
+from .services import GLOBAL_INDEX_PAGE_KEY, get_index_page_cache_data, prepare_deliveries, send_mailing
+from .smtp_sink import SMTPSink
+from .suppression import BloomFilter, SuppressionList, suppress
+from .tasks import (
+    refresh_global_dashboard,
+    retry_mailing,
+    send_mailing_chunk,
+    send_outbox,
+    enqueue_mailing,
+    split_deliveries,
+    start_mailing,
+)
 from django.core.cache import cache
+from config.celery import app as celery_app
 
 User = CustomUser
 
 
+def run_mailing(testcase, mailing):
+    """Запускает рассылку так же, как кнопка отправки: через enqueue_mailing и задачу start_mailing."""
+    with testcase.captureOnCommitCallbacks(execute=True):
+        enqueue_mailing(mailing)
+
+
 class IndexViewTests(TestCase):
     def setUp(self):
         """Настройка тестового пользователя для тестов."""
@@ -34,8 +97,8 @@ class IndexViewTests(TestCase):
 
         expected_data = get_index_page_cache_data(self.user)
 
-        # Сравниваем количество элементов в QuerySet
-        self.assertEqual(response.context['object_list'].count(), expected_data['object_list'].count())
+        # Сравниваем последние попытки рассылки
+        self.assertEqual(response.context['recent_attempts'], expected_data['recent_attempts'])
 
         # Сравниваем остальные значения
         for key in ['attempt_count', 'attempt_success_count', 'attempt_failure_count', 'mailing_count',
@@ -85,4 +148,1695 @@ class RecipientCreateViewTests(TestCase):
         form = response.context["form"]
         self.assertTrue(form.errors)
         self.assertIn("full_name", form.errors)
-        self.assertIn("Обязательное поле.", form.errors["full_name"])
\ No newline at end of file
+        self.assertIn("Обязательное поле.", form.errors["full_name"])
+
+
+class BatchMailSenderTests(TestCase):
+    def setUp(self):
+        """Настройка рассылки с несколькими получателями."""
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpass"
+        )
+        self.message = Message.objects.create(
+            title="Тема", message="Текст письма", owner=self.user
+        )
+        self.mailing = Mailing.objects.create(
+            first_send_at=timezone.now(),
+            status=Mailing.CREATED,
+            owner=self.user,
+            message=self.message,
+        )
+        for i in range(5):
+            self.mailing.recipients.add(
+                Recipient.objects.create(
+                    email=f"recipient{i}@example.com", full_name=f"Получатель {i}"
+                )
+            )
+        self.connections = []
+
+    def connection_factory(self):
+        connection = get_connection()
+        self.connections.append(connection)
+        return connection
+
+    def test_connection_reused_within_batch(self):
+        """Проверка, что одно соединение используется для целой пачки писем."""
+        sender = BatchMailSender(batch_size=2, connection_factory=self.connection_factory)
+        envelopes = [Envelope(None, f"recipient{i}@example.com") for i in range(5)]
+        results = list(sender.send(self.mailing, envelopes))
+
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len(self.connections), 3)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertTrue(all(result.status == MailingAttempt.SUCCESS for result in results))
+
+    def test_reconnect_after_error(self):
+        """Проверка, что после ошибки отправки открывается новое соединение."""
+        sender = BatchMailSender(batch_size=10, connection_factory=self.connection_factory)
+        original_send = locmem.EmailBackend.send_messages
+
+        def failing_send(backend, messages):
+            if messages[0].to == ["recipient1@example.com"]:
+                raise smtplib.SMTPServerDisconnected("Соединение разорвано")
+            return original_send(backend, messages)
+
+        envelopes = [Envelope(None, f"recipient{i}@example.com") for i in range(3)]
+        with mock.patch.object(locmem.EmailBackend, "send_messages", failing_send):
+            results = list(sender.send(self.mailing, envelopes))
+
+        self.assertEqual(
+            [result.status for result in results],
+            [MailingAttempt.SUCCESS, MailingAttempt.RETRY, MailingAttempt.SUCCESS],
+        )
+        self.assertEqual(len(self.connections), 2)
+
+    def test_sand_mail_creates_attempt_per_recipient(self):
+        """Проверка, что команда sand_mail создает попытку для каждого получателя."""
+        call_command("sand_mail", batch_size=2)
+
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.COMPLETED)
+        self.assertEqual(self.mailing.attempts.count(), 5)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_message_prepared_once_per_mailing(self):
+        """Проверка, что письмо рассылки кодируется один раз для всех получателей."""
+        sender = BatchMailSender(connection_factory=self.connection_factory)
+        envelopes = [Envelope(None, f"recipient{i}@example.com") for i in range(5)]
+        with mock.patch(
+            "mailing.sending.PreparedMessage.from_mailing", wraps=PreparedMessage.from_mailing
+        ) as from_mailing:
+            list(sender.send(self.mailing, envelopes))
+
+        from_mailing.assert_called_once()
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].subject, "Тема")
+
+
+class PreparedMessageTests(TestCase):
+    def test_render_matches_email_message(self):
+        """Проверка, что подготовленное письмо совпадает с письмом Django, кроме заголовков получателя."""
+        prepared = PreparedMessage("Тема письма", "Текст письма", from_email="from@example.com")
+        rendered = message_from_bytes(prepared.render("recipient@example.com"))
+        expected = EmailMessage(
+            "Тема письма", "Текст письма", "from@example.com", ["recipient@example.com"]
+        ).message()
+
+        for header in ("To", "Subject", "From", "Content-Type", "Content-Transfer-Encoding"):
+            self.assertEqual(rendered[header], expected[header])
+        self.assertEqual(rendered.get_payload(decode=True), expected.get_payload(decode=True))
+        self.assertIsNotNone(rendered["Date"])
+
+    def test_render_sets_headers_per_recipient(self):
+        """Проверка, что адрес получателя и Message-ID у каждого письма свои."""
+        prepared = PreparedMessage("Тема", "Текст", from_email="from@example.com")
+        first = message_from_bytes(prepared.render("first@example.com"))
+        second = message_from_bytes(prepared.render("second@example.com"))
+
+        self.assertEqual(first["To"], "first@example.com")
+        self.assertEqual(second["To"], "second@example.com")
+        self.assertNotEqual(first["Message-ID"], second["Message-ID"])
+
+    def test_render_rejects_header_injection(self):
+        """Проверка, что адрес с переводом строки не попадает в заголовки."""
+        prepared = PreparedMessage("Тема", "Текст", from_email="from@example.com")
+        with self.assertRaises(BadHeaderError):
+            prepared.render("recipient@example.com\nBcc: other@example.com")
+
+    def test_render_personalized_body(self):
+        """Проверка подстановки данных получателя в текст письма."""
+        prepared = PreparedMessage(
+            "Тема", "Здравствуйте, {{ full_name }}!\nВаш адрес: {{email}}. {{ unknown }}",
+            from_email="from@example.com",
+        )
+        rendered = message_from_bytes(prepared.render("recipient@example.com", "Иван Петров"))
+
+        self.assertEqual(
+            rendered.get_payload(decode=True).decode(),
+            "Здравствуйте, Иван Петров!\r\nВаш адрес: recipient@example.com. {{ unknown }}",
+        )
+
+    def test_render_long_personalized_lines_as_email_message(self):
+        """Проверка, что длинные строки с подстановками кодируются так же, как в EmailMessage."""
+        prepared = PreparedMessage("Тема", "{{ full_name }}" + "ы" * 600, from_email="from@example.com")
+        rendered = message_from_bytes(prepared.render("recipient@example.com", "Иван"))
+        expected = EmailMessage("Тема", "Иван" + "ы" * 600, "from@example.com", ["recipient@example.com"]).message()
+
+        self.assertEqual(rendered["Content-Transfer-Encoding"], expected["Content-Transfer-Encoding"])
+        self.assertEqual(rendered.get_payload(decode=True), expected.get_payload(decode=True))
+
+
+class PersonalizationTests(TestCase):
+    def setUp(self):
+        """Настройка рассылки с подстановками в тексте письма."""
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpass"
+        )
+        self.message = Message.objects.create(
+            title="Тема",
+            message="Здравствуйте, {{ full_name }}! Отписаться: {{ unsubscribe_url }}",
+            owner=self.user,
+        )
+        self.mailing = Mailing.objects.create(
+            first_send_at=timezone.now(),
+            status=Mailing.CREATED,
+            owner=self.user,
+            message=self.message,
+        )
+        self.recipient = Recipient.objects.create(email="recipient@example.com", full_name="Иван Петров")
+        self.mailing.recipients.add(self.recipient)
+
+    def test_template_cached_until_message_changes(self):
+        """Проверка, что текст компилируется заново только после изменения сообщения."""
+        template = get_message_template(self.message)
+        self.assertIs(get_message_template(Message.objects.get(pk=self.message.pk)), template)
+
+        self.message.message = "Новый текст для {{ email }}"
+        self.message.save()
+        changed = get_message_template(self.message)
+
+        self.assertIsNot(changed, template)
+        self.assertEqual(changed.render({"email": "a@example.com"}), "Новый текст для a@example.com")
+
+    def test_sand_mail_personalizes_and_unsubscribes(self):
+        """Проверка, что письмо содержит данные получателя и рабочую ссылку отписки."""
+        call_command("sand_mail")
+
+        body = mail.outbox[0].body
+        self.assertIn("Здравствуйте, Иван Петров!", body)
+        url = body.split("Отписаться: ")[1]
+        token = make_unsubscribe_token(self.mailing.pk, self.recipient.pk)
+        self.assertEqual(url, settings.MAILING_SITE_URL + reverse("mailing:unsubscribe", args=[token]))
+
+        # Переход по ссылке (или ее проверка сканером) только показывает подтверждение
+        response = self.client.get(reverse("mailing:unsubscribe", args=[token]))
+        self.assertContains(response, "Отписаться от рассылки?")
+        self.assertTrue(self.mailing.recipients.filter(pk=self.recipient.pk).exists())
+
+        csrf_client = Client(enforce_csrf_checks=True)
+        response = csrf_client.post(reverse("mailing:unsubscribe", args=[token]), {"List-Unsubscribe": "One-Click"})
+        self.assertContains(response, "Вы отписаны от рассылки")
+        self.assertFalse(self.mailing.recipients.filter(pk=self.recipient.pk).exists())
+
+        # Отписка не распространяется на рассылки других пользователей сервиса
+        self.assertFalse(SuppressedEmail.objects.exists())
+        other = User.objects.create_user(email="other@example.com", password="testpass")
+        other_mailing = Mailing.objects.create(
+            status=Mailing.CREATED,
+            owner=other,
+            message=Message.objects.create(title="Другая", message="Текст", owner=other),
+        )
+        other_mailing.recipients.add(self.recipient)
+        prepare_deliveries(other_mailing)
+        send_mailing(other_mailing, "batch")
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[1].to, [self.recipient.email])
+
+    def test_unsubscribe_rejects_forged_token(self):
+        """Проверка, что поддельный токен отписки отклоняется."""
+        token = make_unsubscribe_token(self.mailing.pk, self.recipient.pk)[:-1] + "x"
+        response = self.client.post(reverse("mailing:unsubscribe", args=[token]))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(self.mailing.recipients.filter(pk=self.recipient.pk).exists())
+
+
+class AttemptRecorderTests(TestCase):
+    def setUp(self):
+        """Настройка рассылки для записи попыток."""
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpass"
+        )
+        self.mailing = Mailing.objects.create(status=Mailing.CREATED, owner=self.user)
+
+    def test_flush_when_buffer_is_full(self):
+        """Проверка, что попытки записываются пачкой при заполнении буфера."""
+        recorder = AttemptRecorder(max_rows=3, max_interval=3600)
+        recorder.add(self.mailing, MailingAttempt.SUCCESS, "ok")
+        recorder.add(self.mailing, MailingAttempt.SUCCESS, "ok")
+        self.assertEqual(MailingAttempt.objects.count(), 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            recorder.add(self.mailing, MailingAttempt.FAILURE, "error")
+        inserts = [query for query in queries if query["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(MailingAttempt.objects.count(), 3)
+
+    def test_flush_by_interval(self):
+        """Проверка, что попытки записываются по истечении интервала."""
+        recorder = AttemptRecorder(max_rows=100, max_interval=0.01)
+        recorder._last_flush -= 1
+        recorder.add(self.mailing, MailingAttempt.SUCCESS, "ok")
+        self.assertEqual(MailingAttempt.objects.count(), 1)
+
+    def test_flush_on_error(self):
+        """Проверка, что буфер записывается при выходе из контекста из-за исключения."""
+        with self.assertRaises(RuntimeError):
+            with AttemptRecorder(max_rows=100, max_interval=3600) as recorder:
+                recorder.add(self.mailing, MailingAttempt.SUCCESS, "ok")
+                raise RuntimeError("Сбой отправки")
+        self.assertEqual(MailingAttempt.objects.count(), 1)
+
+    def test_failed_write_keeps_attempts(self):
+        """Проверка, что попытки не теряются, если запись в базу не удалась."""
+        recorder = AttemptRecorder(max_rows=100, max_interval=3600)
+        recorder.add(self.mailing, MailingAttempt.SUCCESS, "ok")
+        recorder.add(self.mailing, MailingAttempt.FAILURE, "error")
+        with mock.patch("mailing.recorder.add_attempt_counters", side_effect=RuntimeError("Сбой базы")):
+            with self.assertRaises(RuntimeError):
+                recorder.flush()
+        self.assertEqual(MailingAttempt.objects.count(), 0)
+
+        recorder.add(self.mailing, MailingAttempt.SUCCESS, "ok")
+        self.assertEqual(recorder.flush(), 3)
+        self.assertEqual(MailingAttempt.objects.count(), 3)
+
+    def test_mailing_detail_post_records_attempts(self):
+        """Проверка, что ручная отправка записывает попытку по каждому получателю."""
+        self.mailing.message = Message.objects.create(
+            title="Тема", message="Текст письма", owner=self.user
+        )
+        self.mailing.save()
+        for i in range(3):
+            self.mailing.recipients.add(
+                Recipient.objects.create(email=f"r{i}@example.com", full_name="Получатель")
+            )
+        self.client.login(email="testuser@example.com", password="testpass")
+        url = reverse("mailing:mailing_detail", args=[self.mailing.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url)
+
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertEqual(self.mailing.attempts.filter(status=MailingAttempt.SUCCESS).count(), 3)
+
+
+class ThreadPoolMailEngineTests(TestCase):
+    def setUp(self):
+        """Настройка рассылки для параллельной отправки."""
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpass"
+        )
+        self.mailing = Mailing.objects.create(
+            first_send_at=timezone.now(),
+            status=Mailing.CREATED,
+            owner=self.user,
+            message=Message.objects.create(title="Тема", message="Текст", owner=self.user),
+        )
+        self.emails = [f"recipient{i}@example.com" for i in range(20)]
+        self.envelopes = [Envelope(None, email) for email in self.emails]
+
+    def test_all_recipients_sent(self):
+        """Проверка, что пул потоков отправляет письмо каждому получателю."""
+        engine = ThreadPoolMailEngine(workers=4, per_host=4, queue_size=2, host="test-all")
+        results = list(engine.send(self.mailing, iter(self.envelopes)))
+
+        self.assertEqual(sorted(result.envelope.email for result in results), sorted(self.emails))
+        self.assertEqual(len(mail.outbox), 20)
+
+    def test_per_host_limit(self):
+        """Проверка, что к одному SMTP-серверу открыто не больше per_host соединений одновременно."""
+        active = []
+        peak = []
+        lock = threading.Lock()
+        original_send = locmem.EmailBackend.send_messages
+
+        def slow_send(backend, messages):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.005)
+            with lock:
+                active.pop()
+            return original_send(backend, messages)
+
+        engine = ThreadPoolMailEngine(workers=4, per_host=1, queue_size=5, host="test-limit")
+        with mock.patch.object(locmem.EmailBackend, "send_messages", slow_send):
+            results = list(engine.send(self.mailing, iter(self.envelopes)))
+
+        self.assertEqual(len(results), 20)
+        self.assertEqual(max(peak), 1)
+
+    def test_host_slots_follow_limit_and_connections(self):
+        """Проверка, что ограничение per_host зависит от лимита и освобождается при закрытии соединений."""
+        self.assertIsNot(get_host_slots("test-slots", 1), get_host_slots("test-slots", 2))
+        engine = ThreadPoolMailEngine(workers=4, per_host=2, queue_size=5, batch_size=3, host="test-slots")
+        self.assertEqual(len(list(engine.send(self.mailing, iter(self.envelopes)))), 20)
+
+        slots = get_host_slots("test-slots", 2)
+        self.assertTrue(slots.acquire(blocking=False) and slots.acquire(blocking=False))
+        slots.release()
+        slots.release()
+
+    def test_connection_factory_failure_is_recorded(self):
+        """Проверка, что ошибка создания соединения дает результат по каждому адресату, а не теряет письма."""
+        factory = mock.Mock(side_effect=[OSError("Нет соединения"), get_connection()])
+        sender = BatchMailSender(connection_factory=factory, rcpt_batch=1)
+        results = list(sender.send(self.mailing, iter(self.envelopes[:2])))
+
+        self.assertEqual([result.status for result in results], [MailingAttempt.RETRY, MailingAttempt.SUCCESS])
+        self.assertTrue(results[0].outage)
+
+    def test_sand_mail_threads_engine(self):
+        """Проверка, что sand_mail с движком threads создает попытку для каждого получателя."""
+        for email in self.emails[:5]:
+            self.mailing.recipients.add(Recipient.objects.create(email=email, full_name="Получатель"))
+        call_command("sand_mail", engine="threads", workers=2)
+
+        self.assertEqual(self.mailing.attempts.count(), 5)
+
+
+class AsyncMailEngineTests(TestCase):
+    def setUp(self):
+        """Настройка рассылки и локальной SMTP-заглушки."""
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpass"
+        )
+        self.mailing = Mailing.objects.create(
+            first_send_at=timezone.now(),
+            status=Mailing.CREATED,
+            owner=self.user,
+            message=Message.objects.create(title="Тема", message="Текст письма", owner=self.user),
+        )
+        for i in range(10):
+            self.mailing.recipients.add(
+                Recipient.objects.create(email=f"recipient{i}@example.com", full_name="Получатель")
+            )
+        prepare_deliveries(self.mailing)
+
+    def test_asyncio_engine_sends_to_sink(self):
+        """Проверка, что движок asyncio отправляет письма через SMTP и записывает попытки."""
+        with SMTPSink().run_in_thread() as sink:
+            send_mailing(self.mailing, "asyncio", concurrency=3, smtp_host=sink.host, smtp_port=sink.port)
+
+        self.assertEqual(sink.messages, 10)
+        self.assertEqual(self.mailing.attempts.filter(status=MailingAttempt.SUCCESS).count(), 10)
+
+    def test_asyncio_engine_records_connection_errors(self):
+        """Проверка, что недоступный SMTP-сервер дает временную ошибку и повтор по каждому получателю."""
+        with SMTPSink().run_in_thread() as sink:
+            port = sink.port
+        send_mailing(self.mailing, "asyncio", concurrency=2, smtp_host="127.0.0.1", smtp_port=port)
+
+        self.assertEqual(self.mailing.attempts.filter(status=MailingAttempt.RETRY).count(), 10)
+        self.assertEqual(
+            self.mailing.deliveries.filter(status=RecipientDelivery.PENDING, next_attempt_at__isnull=False).count(),
+            10,
+        )
+
+    def test_asyncio_engine_sanitizes_group_addresses(self):
+        """Проверка, что движок asyncio кодирует адреса IDN и сопоставляет отказы адресатам, как движок batch."""
+        envelopes = [Envelope(1, "user@münchen.example"), Envelope(2, "Missing@Example.com")]
+        engine = AsyncMailEngine(rcpt_batch=2)
+        prepared = engine.builder.prepare_message(self.mailing)
+
+        class FakeSMTP:
+            async def sendmail(self, sender, recipients, message):
+                self.recipients = recipients
+                return {"user@xn--mnchen-3ya.example": aiosmtplib.SMTPResponse(550, "No such user")}, ""
+
+        smtp = FakeSMTP()
+        refused = asyncio.run(engine._deliver(smtp, prepared, envelopes))
+
+        self.assertEqual(smtp.recipients, ["user@xn--mnchen-3ya.example", "Missing@Example.com"])
+        self.assertEqual(list(refused), ["user@münchen.example"])
+        self.assertEqual(refused["user@münchen.example"].code, 550)
+        with self.assertRaises(ValueError):
+            asyncio.run(engine._deliver(smtp, prepared, [Envelope(3, "a@example.com\nBcc: b@example.com")]))
+
+    def test_threads_engine_sends_to_sink(self):
+        """Проверка, что движок threads можно направить на локальную SMTP-заглушку."""
+        with SMTPSink().run_in_thread() as sink:
+            send_mailing(self.mailing, "threads", workers=3, smtp_host=sink.host, smtp_port=sink.port)
+
+        self.assertEqual(sink.messages, 10)
+        self.assertEqual(self.mailing.attempts.filter(status=MailingAttempt.SUCCESS).count(), 10)
+
+
+class MailingTasksTests(TestCase):
+    def setUp(self):
+        """Настройка рассылки, поставленной в очередь на отправку задачами Celery."""
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpass"
+        )
+        self.mailing = Mailing.objects.create(
+            first_send_at=timezone.now(),
+            status=Mailing.RUNNING,
+            owner=self.user,
+            message=Message.objects.create(title="Тема", message="Текст письма", owner=self.user),
+        )
+        for i in range(7):
+            self.mailing.recipients.add(
+                Recipient.objects.create(email=f"recipient{i}@example.com", full_name="Получатель")
+            )
+
+    def test_split_deliveries(self):
+        """Проверка, что ожидающие отправки получатели делятся на диапазоны заданного размера."""
+        prepare_deliveries(self.mailing)
+        ids = list(self.mailing.deliveries.order_by("id").values_list("id", flat=True))
+        chunks = split_deliveries(self.mailing, 3)
+
+        self.assertEqual(chunks, [(ids[0], ids[2]), (ids[3], ids[5]), (ids[6], ids[6])])
+
+    def test_start_mailing_sends_all_chunks_and_completes(self):
+        """Проверка, что рассылка завершается после отправки всех частей."""
+        start_mailing.delay(self.mailing.pk, chunk_size=3)
+
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.COMPLETED)
+        self.assertEqual(self.mailing.attempts.count(), 7)
+        self.assertEqual(len(mail.outbox), 7)
+
+    def test_redelivered_start_does_not_resend(self):
+        """Проверка, что повторная доставка задачи запуска не отправляет письма второй раз."""
+        start_mailing.delay(self.mailing.pk, chunk_size=3)
+        start_mailing.delay(self.mailing.pk, chunk_size=3)
+        self.assertEqual(len(mail.outbox), 7)
+
+        # Задача, доставленная во время отправки, продолжает ее только оставшимся получателям
+        self.mailing.deliveries.filter(id__in=self.mailing.deliveries.order_by("id")[:2].values("id")).update(
+            status=RecipientDelivery.PENDING
+        )
+        Mailing.objects.filter(pk=self.mailing.pk).update(status=Mailing.RUNNING)
+        start_mailing.delay(self.mailing.pk, chunk_size=3)
+        self.assertEqual(len(mail.outbox), 9)
+        self.assertEqual(self.mailing.deliveries.filter(status=RecipientDelivery.SENT).count(), 7)
+
+    def test_mailing_not_completed_when_chunk_fails(self):
+        """Проверка, что рассылка не завершается, если часть не отправлена."""
+        with mock.patch("mailing.leasing.send_mailing", side_effect=RuntimeError("Сбой")):
+            with self.assertRaises(RuntimeError):
+                start_mailing.delay(self.mailing.pk, chunk_size=3)
+
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.RUNNING)
+
+
+class ManualSendTests(TestCase):
+    def setUp(self):
+        """Настройка рассылки для ручной отправки."""
+        cache.clear()
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpass"
+        )
+        self.mailing = Mailing.objects.create(
+            status=Mailing.CREATED,
+            owner=self.user,
+            message=Message.objects.create(title="Тема", message="Текст письма", owner=self.user),
+        )
+        for i in range(4):
+            self.mailing.recipients.add(
+                Recipient.objects.create(email=f"recipient{i}@example.com", full_name="Получатель")
+            )
+        self.client.login(email="testuser@example.com", password="testpass")
+        self.url = reverse("mailing:mailing_detail", args=[self.mailing.pk])
+
+    def test_post_enqueues_send_once(self):
+        """Проверка, что повторный POST не запускает вторую отправку рассылки."""
+        with mock.patch("mailing.tasks.start_mailing.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(self.url)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(self.url)
+
+        delay.assert_called_once_with(self.mailing.pk)
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.RUNNING)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_broker_failure_reverts_status(self):
+        """Проверка, что при недоступном брокере рассылка не остается запущенной и ее можно запустить снова."""
+        with mock.patch("mailing.tasks.start_mailing.delay", side_effect=ConnectionError("Брокер недоступен")):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(self.url)
+
+        self.assertRedirects(response, self.url)
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.CREATED)
+        with mock.patch("mailing.tasks.start_mailing.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(self.url)
+        delay.assert_called_once_with(self.mailing.pk)
+
+    def test_queued_send_does_not_resend_after_sand_mail(self):
+        """Проверка, что задача запуска после sand_mail или доставленная дважды не отправляет письма снова."""
+        Mailing.objects.filter(pk=self.mailing.pk).update(first_send_at=timezone.now())
+        with mock.patch("mailing.tasks.start_mailing.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(self.url)
+        call_command("sand_mail")
+        self.assertEqual(len(mail.outbox), 4)
+
+        start_mailing(*delay.call_args.args)
+        start_mailing(*delay.call_args.args)
+        self.assertEqual(len(mail.outbox), 4)
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.COMPLETED)
+        self.assertEqual(self.mailing.attempts.count(), 4)
+
+    def test_progress_script_is_loaded_in_body(self):
+        """Проверка, что скрипт хода отправки подключается в теле страницы, а не в заголовке."""
+        content = self.client.get(self.url).content.decode()
+        title = content[content.index("<title>"):content.index("</title>")]
+        self.assertNotIn("<script", title)
+        self.assertEqual(content.count('<script src="/static/js/mailing_progress.js"></script>'), 1)
+
+    def test_progress_shown_after_send(self):
+        """Проверка, что ход отправки доступен на странице рассылки и в JSON."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url)
+
+        response = self.client.get(reverse("mailing:mailing_progress", args=[self.mailing.pk]))
+        self.assertEqual(
+            response.json(),
+            {"status": Mailing.COMPLETED, "total": 4, "success": 4, "failure": 0, "done": 4},
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["progress"]["done"], 4)
+
+    def test_progress_forbidden_for_other_users(self):
+        """Проверка, что ход чужой рассылки недоступен."""
+        User.objects.create_user(email="other@example.com", password="testpass")
+        self.client.login(email="other@example.com", password="testpass")
+        response = self.client.get(reverse("mailing:mailing_progress", args=[self.mailing.pk]))
+        self.assertEqual(response.status_code, 403)
+
+
+class RecipientDeliveryTests(TestCase):
+    def setUp(self):
+        """Настройка рассылки с состояниями доставки."""
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpass"
+        )
+        self.mailing = Mailing.objects.create(
+            first_send_at=timezone.now(),
+            status=Mailing.CREATED,
+            owner=self.user,
+            message=Message.objects.create(title="Тема", message="Текст письма", owner=self.user),
+        )
+        for i in range(5):
+            self.mailing.recipients.add(
+                Recipient.objects.create(email=f"recipient{i}@example.com", full_name="Получатель")
+            )
+
+    def test_prepare_deliveries_is_idempotent(self):
+        """Проверка, что для каждого получателя создается одно состояние доставки."""
+        self.assertEqual(prepare_deliveries(self.mailing), 5)
+        self.assertEqual(prepare_deliveries(self.mailing, restart=False), 5)
+        self.assertEqual(self.mailing.deliveries.count(), 5)
+
+    def test_send_updates_delivery_state(self):
+        """Проверка, что отправка обновляет статус, счетчик попыток и последнюю ошибку."""
+        prepare_deliveries(self.mailing)
+        original_send = locmem.EmailBackend.send_messages
+
+        def failing_send(backend, messages):
+            if messages[0].to == ["recipient3@example.com"]:
+                raise smtplib.SMTPRecipientsRefused({"recipient3@example.com": (550, b"No such user")})
+            return original_send(backend, messages)
+
+        with mock.patch.object(locmem.EmailBackend, "send_messages", failing_send):
+            send_mailing(self.mailing, "batch")
+
+        failed = self.mailing.deliveries.get(status=RecipientDelivery.FAILED)
+        self.assertEqual(failed.recipient.email, "recipient3@example.com")
+        self.assertEqual(failed.attempt_count, 1)
+        self.assertIn("No such user", failed.last_error)
+        self.assertEqual(self.mailing.deliveries.filter(status=RecipientDelivery.SENT).count(), 4)
+
+    def test_sand_mail_resumes_interrupted_mailing(self):
+        """Проверка, что прерванная рассылка продолжается только для оставшихся получателей."""
+        prepare_deliveries(self.mailing)
+        sent = self.mailing.deliveries.order_by("id")[:2]
+        RecipientDelivery.objects.filter(pk__in=[delivery.pk for delivery in sent]).update(
+            status=RecipientDelivery.SENT
+        )
+        Mailing.objects.filter(pk=self.mailing.pk).update(status=Mailing.RUNNING)
+
+        call_command("sand_mail")
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(self.mailing.deliveries.filter(status=RecipientDelivery.SENT).count(), 5)
+
+    def test_restart_resends_to_everyone(self):
+        """Проверка, что новый запуск рассылки возвращает всех получателей в очередь."""
+        prepare_deliveries(self.mailing)
+        self.mailing.deliveries.update(status=RecipientDelivery.SENT, attempt_count=1)
+
+        self.assertEqual(prepare_deliveries(self.mailing), 5)
+        self.assertFalse(self.mailing.deliveries.exclude(attempt_count=0).exists())
+
+    def test_stream_envelopes_selects_only_needed_columns(self):
+        """Проверка, что адресаты читаются без лишних полей получателя."""
+        prepare_deliveries(self.mailing)
+        Recipient.objects.update(comment="Длинный комментарий")
+
+        with CaptureQueriesContext(connection) as queries:
+            envelopes = list(stream_envelopes(self.mailing.deliveries.all(), chunk_size=2))
+
+        self.assertEqual([envelope.email for envelope in envelopes], [f"recipient{i}@example.com" for i in range(5)])
+        self.assertEqual(envelopes[0].full_name, "Получатель")
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("comment", queries[0]["sql"])
+
+
+class LeasingTests(TestCase):
+    def setUp(self):
+        """Настройка запущенной рассылки с ожидающими отправки получателями."""
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpass"
+        )
+        self.mailing = Mailing.objects.create(
+            first_send_at=timezone.now(),
+            status=Mailing.CREATED,
+            owner=self.user,
+            message=Message.objects.create(title="Тема", message="Текст письма", owner=self.user),
+        )
+        for i in range(6):
+            self.mailing.recipients.add(
+                Recipient.objects.create(email=f"recipient{i}@example.com", full_name="Получатель")
+            )
+
+    def test_start_mailings_prepares_deliveries(self):
+        """Проверка, что запуск рассылки создает состояния доставки и меняет статус."""
+        started = start_mailings(Mailing.objects.all())
+
+        self.assertEqual(started, [self.mailing.pk])
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.RUNNING)
+        self.assertEqual(self.mailing.deliveries.count(), 6)
+        self.assertEqual(start_mailings(Mailing.objects.all()), [])
+
+    def test_workers_claim_disjoint_batches(self):
+        """Проверка, что разные обработчики захватывают разных получателей."""
+        start_mailings(Mailing.objects.all())
+        first = claim_deliveries(self.mailing.pk, "worker-1", batch_size=4)
+        second = claim_deliveries(self.mailing.pk, "worker-2", batch_size=4)
+
+        self.assertEqual(len(first), 4)
+        self.assertEqual(len(second), 2)
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(claim_deliveries(self.mailing.pk, "worker-3"), [])
+
+    def test_expired_lease_is_reclaimed(self):
+        """Проверка, что получателей с истекшим захватом забирает другой обработчик."""
+        start_mailings(Mailing.objects.all())
+        claimed = claim_deliveries(self.mailing.pk, "worker-1")
+        RecipientDelivery.objects.filter(pk__in=claimed).update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.assertEqual(sorted(claim_deliveries(self.mailing.pk, "worker-2")), sorted(claimed))
+
+    def test_stopped_mailing_is_not_claimed(self):
+        """Проверка, что получатели остановленной рассылки не захватываются."""
+        start_mailings(Mailing.objects.all())
+        Mailing.objects.filter(pk=self.mailing.pk).update(status=Mailing.COMPLETED)
+
+        self.assertEqual(claim_deliveries(self.mailing.pk, "worker-1"), [])
+
+    def test_celery_chunk_skips_deliveries_leased_by_another_worker(self):
+        """Проверка, что задача Celery не отправляет получателей, захваченных sand_mail."""
+        start_mailings(Mailing.objects.all())
+        claimed = claim_deliveries(self.mailing.pk, "cron-worker", batch_size=2)
+        first_id, last_id = split_deliveries(self.mailing, 6)[0]
+
+        send_mailing_chunk(self.mailing.pk, first_id, last_id)
+
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(
+            set(self.mailing.deliveries.filter(status=RecipientDelivery.PENDING).values_list("id", flat=True)),
+            set(claimed),
+        )
+
+    def test_lease_is_renewed_on_flush_and_checked_before_send(self):
+        """Проверка, что запись попыток продлевает захват, а отправляются только свои захваченные получатели."""
+        start_mailings(Mailing.objects.all())
+        claimed = claim_deliveries(self.mailing.pk, "worker-1")
+        soon = timezone.now() + timedelta(seconds=1)
+        RecipientDelivery.objects.filter(pk__in=claimed).update(lease_expires_at=soon)
+        with AttemptRecorder(max_rows=1, worker_id="worker-1") as recorder:
+            recorder.add(self.mailing, MailingAttempt.SUCCESS, "Успешно", delivery_id=claimed[0])
+        pending = RecipientDelivery.objects.filter(pk__in=claimed[1:])
+        self.assertTrue(all(delivery.lease_expires_at > soon for delivery in pending))
+
+        # Захват истек и перешел к другому обработчику: первый обработчик его получателей не отправляет
+        pending.update(leased_by="worker-2")
+        with mock.patch("mailing.leasing.claim_deliveries", side_effect=[claimed[1:], []]):
+            send_leased(self.mailing, "batch", worker_id="worker-1")
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_sand_mail_completes_after_all_batches(self):
+        """Проверка, что sand_mail отправляет все пачки и завершает рассылку."""
+        with self.settings(MAILING_CLAIM_SIZE=4):
+            call_command("sand_mail")
+
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.COMPLETED)
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertFalse(self.mailing.deliveries.exclude(leased_by=None).exists())
+
+
+class MailingSchedulerTests(TestCase):
+    def setUp(self):
+        """Настройка планировщика с записью запущенных рассылок."""
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpass"
+        )
+        self.message = Message.objects.create(title="Тема", message="Текст письма", owner=self.user)
+        self.dispatched = []
+        self.scheduler = MailingScheduler(self.dispatched.append, poll_interval=1, horizon=3600)
+
+    def create_mailing(self, first_send_at, finish_send_at, status=Mailing.CREATED):
+        return Mailing.objects.create(
+            first_send_at=first_send_at,
+            finish_send_at=finish_send_at,
+            status=status,
+            owner=self.user,
+            message=self.message,
+        )
+
+    def test_due_mailing_dispatched_once(self):
+        """Проверка, что рассылка запускается в срок и только один раз."""
+        now = timezone.now()
+        due = self.create_mailing(now - timedelta(seconds=1), now + timedelta(days=1))
+        later = self.create_mailing(now + timedelta(minutes=10), now + timedelta(days=1))
+
+        self.scheduler.refresh(now)
+        self.scheduler.run_pending(now)
+        self.assertEqual(self.dispatched, [due.pk])
+
+        self.scheduler.refresh(now)
+        self.scheduler.run_pending(now + timedelta(minutes=10))
+        self.assertEqual(self.dispatched, [due.pk, later.pk])
+        self.assertEqual(self.scheduler.next_wait(now + timedelta(minutes=10)), 1)
+
+    def test_expired_mailing_finished_without_dispatch(self):
+        """Проверка, что рассылка с истекшим сроком завершается и не запускается."""
+        now = timezone.now()
+        expired = self.create_mailing(now - timedelta(days=2), now - timedelta(days=1))
+
+        self.scheduler.refresh(now)
+        self.scheduler.run_pending(now)
+
+        expired.refresh_from_db()
+        self.assertEqual(expired.status, Mailing.COMPLETED)
+        self.assertEqual(self.dispatched, [])
+
+    def test_slow_mailing_does_not_delay_others(self):
+        """Проверка, что рассылки отправляются в пуле потоков и долгая отправка не задерживает другие."""
+        now = timezone.now()
+        mailings = [self.create_mailing(now - timedelta(seconds=1), now + timedelta(days=1)) for _ in range(2)]
+        both_sending = threading.Barrier(3)
+
+        def dispatch(mailing_id):
+            self.dispatched.append(mailing_id)
+            both_sending.wait(5)
+
+        scheduler = MailingScheduler(dispatch, poll_interval=1, horizon=3600, workers=2)
+        scheduler.refresh(now)
+        self.assertEqual(scheduler.run_pending(now), 2)
+        both_sending.wait(5)
+        scheduler.close()
+        self.assertEqual(sorted(self.dispatched), [mailing.pk for mailing in mailings])
+
+    def test_finished_mailings_leave_dispatched_set(self):
+        """Проверка, что завершенные рассылки удаляются из множества запущенных при обновлении расписания."""
+        now = timezone.now()
+        mailing = self.create_mailing(now - timedelta(seconds=1), now + timedelta(days=1))
+        self.scheduler.refresh(now)
+        self.scheduler.run_pending(now)
+        self.assertEqual(self.scheduler.dispatched, {mailing.pk})
+
+        self.scheduler.refresh(now)
+        self.assertEqual(self.scheduler.dispatched, {mailing.pk})
+        Mailing.objects.filter(pk=mailing.pk).update(status=Mailing.COMPLETED)
+        self.scheduler.refresh(now)
+        self.assertEqual(self.scheduler.dispatched, set())
+
+    def test_mailing_change_triggers_refresh(self):
+        """Проверка, что изменение рассылки заставляет планировщик перечитать расписание."""
+        self.scheduler.refresh()
+        self.assertFalse(self.scheduler.needs_refresh())
+
+        self.create_mailing(timezone.now(), timezone.now() + timedelta(days=1))
+
+        self.assertTrue(self.scheduler.needs_refresh())
+
+    def test_run_scheduler_sends_due_mailing(self):
+        """Проверка, что команда run_scheduler отправляет рассылку в срок и завершает ее."""
+        now = timezone.now()
+        mailing = self.create_mailing(now - timedelta(seconds=1), now + timedelta(days=1))
+        mailing.recipients.add(Recipient.objects.create(email="recipient@example.com", full_name="Получатель"))
+
+        def stop_after_first_pass(scheduler, stop=None):
+            scheduler.refresh()
+            scheduler.run_pending()
+
+        with mock.patch.object(MailingScheduler, "run_forever", stop_after_first_pass):
+            call_command("run_scheduler", dispatch_workers=0, stdout=StringIO())
+
+        mailing.refresh_from_db()
+        self.assertEqual(mailing.status, Mailing.COMPLETED)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_celery_dispatch_queues_running_mailing_once(self):
+        """Проверка, что перезапуск планировщика и sand_mail --celery не ставят запущенную рассылку повторно."""
+        now = timezone.now()
+        mailing = self.create_mailing(now - timedelta(seconds=1), now + timedelta(days=1))
+
+        def one_pass(scheduler, stop=None):
+            scheduler.refresh()
+            scheduler.run_pending()
+
+        with mock.patch("mailing.tasks.start_mailing.delay") as delay:
+            with mock.patch.object(MailingScheduler, "run_forever", one_pass):
+                for _ in range(2):
+                    with self.captureOnCommitCallbacks(execute=True):
+                        call_command("run_scheduler", celery=True, stdout=StringIO())
+            for _ in range(2):
+                with self.captureOnCommitCallbacks(execute=True):
+                    call_command("sand_mail", celery=True, stdout=StringIO())
+
+        delay.assert_called_once_with(mailing.pk)
+        mailing.refresh_from_db()
+        self.assertEqual(mailing.status, Mailing.RUNNING)
+
+
+class RetryTests(TestCase):
+    def setUp(self):
+        """Настройка рассылки с одним получателем, которому сервер отвечает временной ошибкой."""
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpass"
+        )
+        self.mailing = Mailing.objects.create(
+            first_send_at=timezone.now(),
+            status=Mailing.CREATED,
+            owner=self.user,
+            message=Message.objects.create(title="Тема", message="Текст письма", owner=self.user),
+        )
+        for i in range(2):
+            self.mailing.recipients.add(
+                Recipient.objects.create(email=f"recipient{i}@example.com", full_name="Получатель")
+            )
+        original_send = locmem.EmailBackend.send_messages
+
+        def greylisting_send(backend, messages):
+            if messages[0].to == ["recipient1@example.com"]:
+                raise smtplib.SMTPRecipientsRefused({"recipient1@example.com": (451, b"Try again later")})
+            return original_send(backend, messages)
+
+        self.greylisting_send = greylisting_send
+
+    def test_classify_error(self):
+        """Проверка разделения ошибок SMTP на временные и постоянные."""
+        self.assertEqual(classify_error(smtplib.SMTPResponseException(421, b"Busy")), MailingAttempt.RETRY)
+        self.assertEqual(classify_error(aiosmtplib.SMTPResponseException(451, "Later")), MailingAttempt.RETRY)
+        self.assertEqual(classify_error(smtplib.SMTPServerDisconnected("Closed")), MailingAttempt.RETRY)
+        self.assertEqual(classify_error(ConnectionRefusedError()), MailingAttempt.RETRY)
+        self.assertEqual(
+            classify_error(smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"No such user")})),
+            MailingAttempt.FAILURE,
+        )
+        self.assertEqual(classify_error(ValueError("Invalid address")), MailingAttempt.FAILURE)
+
+    def test_retry_delay_grows_with_jitter(self):
+        """Проверка экспоненциального роста задержки с ограничением сверху."""
+        with self.settings(MAILING_RETRY_BASE_DELAY=60, MAILING_RETRY_MAX_DELAY=600):
+            self.assertTrue(30 <= retry_delay(1) <= 60)
+            self.assertTrue(120 <= retry_delay(3) <= 240)
+            self.assertTrue(300 <= retry_delay(10) <= 600)
+
+    def test_transient_failure_is_retried_later(self):
+        """Проверка, что временная ошибка откладывает получателя, а повтор записывается отдельной попыткой."""
+        with mock.patch.object(locmem.EmailBackend, "send_messages", self.greylisting_send):
+            call_command("sand_mail")
+
+        self.mailing.refresh_from_db()
+        delivery = self.mailing.deliveries.get(recipient__email="recipient1@example.com")
+        self.assertEqual(self.mailing.status, Mailing.RUNNING)
+        self.assertEqual(delivery.status, RecipientDelivery.PENDING)
+        self.assertEqual(delivery.attempt_count, 1)
+        self.assertGreater(delivery.next_attempt_at, timezone.now())
+
+        call_command("sand_mail")
+        self.assertEqual(len(mail.outbox), 1)
+
+        RecipientDelivery.objects.filter(pk=delivery.pk).update(next_attempt_at=timezone.now())
+        call_command("sand_mail")
+
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.COMPLETED)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            list(self.mailing.attempts.order_by("id").values_list("status", flat=True)),
+            [MailingAttempt.SUCCESS, MailingAttempt.RETRY, MailingAttempt.SUCCESS],
+        )
+
+    def test_attempts_are_capped(self):
+        """Проверка, что после MAILING_MAX_ATTEMPTS попыток ошибка становится постоянной."""
+        prepare_deliveries(self.mailing)
+        self.mailing.deliveries.filter(recipient__email="recipient1@example.com").update(attempt_count=2)
+
+        with self.settings(MAILING_MAX_ATTEMPTS=3):
+            with mock.patch.object(locmem.EmailBackend, "send_messages", self.greylisting_send):
+                send_mailing(self.mailing, "batch")
+
+        delivery = self.mailing.deliveries.get(recipient__email="recipient1@example.com")
+        self.assertEqual(delivery.status, RecipientDelivery.FAILED)
+        self.assertIsNone(delivery.next_attempt_at)
+        self.assertEqual(self.mailing.attempts.filter(status=MailingAttempt.FAILURE).count(), 1)
+
+    def test_celery_schedules_retry_instead_of_completing(self):
+        """Проверка, что Celery откладывает завершение рассылки до повторной отправки."""
+        with mock.patch.object(locmem.EmailBackend, "send_messages", self.greylisting_send):
+            with mock.patch.object(retry_mailing, "apply_async") as apply_async:
+                run_mailing(self, self.mailing)
+
+        delivery = self.mailing.deliveries.get(recipient__email="recipient1@example.com")
+        apply_async.assert_called_once_with((self.mailing.pk,), eta=delivery.next_attempt_at)
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.RUNNING)
+
+        RecipientDelivery.objects.filter(pk=delivery.pk).update(next_attempt_at=timezone.now())
+        retry_mailing(self.mailing.pk)
+
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.COMPLETED)
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class SuppressionTests(TestCase):
+    def setUp(self):
+        """Настройка рассылки, в которой сервер отвечает жестким отказом одному получателю."""
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpass"
+        )
+        self.mailing = Mailing.objects.create(
+            first_send_at=timezone.now(),
+            status=Mailing.CREATED,
+            owner=self.user,
+            message=Message.objects.create(title="Тема", message="Текст письма", owner=self.user),
+        )
+        for email in ("good@example.com", "Missing@Example.com"):
+            self.mailing.recipients.add(Recipient.objects.create(email=email, full_name="Получатель"))
+        original_send = locmem.EmailBackend.send_messages
+        self.sent_to = []
+
+        def bouncing_send(backend, messages):
+            self.sent_to.extend(messages[0].to)
+            if messages[0].to == ["Missing@Example.com"]:
+                raise smtplib.SMTPRecipientsRefused({"Missing@Example.com": (550, b"No such user")})
+            return original_send(backend, messages)
+
+        self.bouncing_send = bouncing_send
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        """Проверка, что фильтр Блума находит все добавленные адреса."""
+        bloom = BloomFilter(1000, 0.01)
+        emails = [f"user{i}@example.com" for i in range(1000)]
+        for email in emails:
+            bloom.add(email)
+
+        self.assertTrue(all(bloom.may_contain(email) for email in emails))
+        false_positives = sum(bloom.may_contain(f"other{i}@example.com") for i in range(1000))
+        self.assertLess(false_positives, 50)
+
+    def test_refresh_loads_new_rows_and_confirms_in_database(self):
+        """Проверка инкрементальной загрузки фильтра и точной проверки по базе."""
+        suppression_list = SuppressionList(capacity=100, error_rate=0.01)
+        suppress([("old@example.com", "Отказ")])
+        suppression_list.refresh()
+        SuppressedEmail.objects.create(email="new@example.com")
+        self.assertEqual(suppression_list.find(["new@example.com"]), set())
+
+        suppression_list.refresh()
+        self.assertEqual(
+            suppression_list.find(["OLD@example.com", "new@example.com", "good@example.com"]),
+            {"OLD@example.com", "new@example.com"},
+        )
+
+        SuppressedEmail.objects.filter(email="old@example.com").delete()
+        suppression_list.refresh()
+        self.assertEqual(suppression_list.find(["old@example.com", "new@example.com"]), {"new@example.com"})
+
+    def test_reloaded_rows_do_not_trigger_rebuild(self):
+        """Проверка, что строки из запаса LOAD_OVERLAP и адреса из suppress() не учитываются в фильтре дважды."""
+        suppression_list = SuppressionList(capacity=10, error_rate=0.01)
+        suppression_list.refresh()
+        with mock.patch("mailing.suppression.get_suppression_list", return_value=suppression_list):
+            suppress([(f"bounce{i}@example.com", "Отказ") for i in range(8)])
+        self.assertEqual(suppression_list._filter.count, 8)
+
+        with mock.patch.object(SuppressionList, "_rebuild", wraps=suppression_list._rebuild) as rebuild:
+            for _ in range(3):
+                suppression_list.refresh()
+        rebuild.assert_not_called()
+        self.assertEqual(suppression_list._filter.count, 8)
+
+    def test_hard_bounce_is_suppressed_and_skipped(self):
+        """Проверка, что адрес с жестким отказом попадает в список подавления и больше не получает писем."""
+        prepare_deliveries(self.mailing)
+        with mock.patch.object(locmem.EmailBackend, "send_messages", self.bouncing_send):
+            send_mailing(self.mailing, "batch")
+
+        self.assertTrue(SuppressedEmail.objects.filter(email="missing@example.com").exists())
+        self.assertEqual(self.sent_to, ["good@example.com", "Missing@Example.com"])
+
+        prepare_deliveries(self.mailing, restart=True)
+        self.sent_to.clear()
+        with mock.patch.object(locmem.EmailBackend, "send_messages", self.bouncing_send):
+            send_mailing(self.mailing, "batch")
+
+        self.assertEqual(self.sent_to, ["good@example.com"])
+        delivery = self.mailing.deliveries.get(recipient__email="Missing@Example.com")
+        self.assertEqual(delivery.status, RecipientDelivery.FAILED)
+        self.assertIn("списке подавления", delivery.last_error)
+
+    def test_content_rejection_is_not_a_hard_bounce(self):
+        """Проверка, что отказ из-за содержимого письма не подавляет адрес."""
+        self.assertTrue(is_hard_bounce(smtplib.SMTPRecipientsRefused({"a@example.com": (554, b"Rejected")})))
+        self.assertTrue(is_hard_bounce(aiosmtplib.SMTPRecipientRefused(550, "No such user", "a@example.com")))
+        self.assertFalse(is_hard_bounce(smtplib.SMTPDataError(554, b"Message rejected as spam")))
+        self.assertFalse(is_hard_bounce(smtplib.SMTPResponseException(451, b"Try again later")))
+        self.assertFalse(is_hard_bounce(smtplib.SMTPServerDisconnected("Closed")))
+
+    def test_sender_and_data_rejections_are_not_hard_bounces(self):
+        """Проверка, что отказ 550 отправителю или содержимому письма не подавляет адреса получателей."""
+        self.assertFalse(is_hard_bounce(smtplib.SMTPSenderRefused(550, b"Sender rejected", "from@example.com")))
+        self.assertFalse(is_hard_bounce(smtplib.SMTPDataError(550, b"Policy rejection")))
+        self.assertFalse(is_hard_bounce(aiosmtplib.SMTPSenderRefused(550, "Sender rejected", "from@example.com")))
+        self.assertFalse(is_hard_bounce(aiosmtplib.SMTPDataError(550, "Policy rejection")))
+
+        for error in (
+            smtplib.SMTPSenderRefused(550, b"Sender rejected", "from@example.com"),
+            smtplib.SMTPDataError(550, b"Policy rejection"),
+        ):
+            prepare_deliveries(self.mailing, restart=True)
+            with mock.patch.object(locmem.EmailBackend, "send_messages", side_effect=error):
+                send_mailing(self.mailing, "batch")
+            self.assertFalse(SuppressedEmail.objects.exists())
+            self.assertEqual(
+                set(self.mailing.deliveries.values_list("status", flat=True)), {RecipientDelivery.FAILED}
+            )
+
+
+class DomainBatchingTests(TestCase):
+    def setUp(self):
+        """Настройка рассылки получателям двух доменов, один адрес сервер не принимает."""
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpass"
+        )
+        self.message = Message.objects.create(title="Тема", message="Текст письма", owner=self.user)
+        self.mailing = Mailing.objects.create(
+            first_send_at=timezone.now(),
+            status=Mailing.CREATED,
+            owner=self.user,
+            message=self.message,
+        )
+        emails = [f"a{i}@one.example" for i in range(6)] + [f"b{i}@two.example" for i in range(4)]
+        for email in emails:
+            self.mailing.recipients.add(Recipient.objects.create(email=email, full_name="Получатель"))
+        prepare_deliveries(self.mailing)
+
+    def test_group_by_domain(self):
+        """Проверка группировки адресатов по домену с ограничением размера группы и буфера."""
+        envelopes = [Envelope(i, email) for i, email in enumerate(["a@x.ru", "b@y.ru", "c@X.ru", "d@x.ru"])]
+
+        groups = [[envelope.email for envelope in group] for group in group_by_domain(envelopes, 2)]
+        self.assertEqual(groups, [["a@x.ru", "c@X.ru"], ["b@y.ru"], ["d@x.ru"]])
+
+        groups = [[envelope.email for envelope in group] for group in group_by_domain(envelopes, 10, max_pending=1)]
+        self.assertEqual(groups, [["a@x.ru"], ["b@y.ru"], ["c@X.ru", "d@x.ru"]])
+
+    def assert_grouped_delivery(self, engine, **options):
+        with SMTPSink(refused_recipients=["a2@one.example"]).run_in_thread() as sink:
+            send_mailing(self.mailing, engine, smtp_host=sink.host, smtp_port=sink.port, rcpt_batch=4, **options)
+
+        self.assertEqual(sink.messages, 3)
+        self.assertEqual(sink.recipients, 9)
+        self.assertEqual(self.mailing.attempts.filter(status=MailingAttempt.SUCCESS).count(), 9)
+        delivery = self.mailing.deliveries.get(status=RecipientDelivery.FAILED)
+        self.assertEqual(delivery.recipient.email, "a2@one.example")
+        self.assertTrue(SuppressedEmail.objects.filter(email="a2@one.example").exists())
+
+    def test_batch_engine_sends_one_transaction_per_domain_group(self):
+        """Проверка, что движок batch отправляет группе одну транзакцию и разбирает отказы по адресам."""
+        self.assert_grouped_delivery("batch")
+
+    def test_asyncio_engine_sends_one_transaction_per_domain_group(self):
+        """Проверка группировки получателей в движке asyncio."""
+        self.assert_grouped_delivery("asyncio", concurrency=2)
+
+    def test_personalized_message_is_not_grouped(self):
+        """Проверка, что письмо с подстановками отправляется каждому получателю отдельно."""
+        self.message.message = "Здравствуйте, {{ full_name }}!"
+        self.message.save()
+        self.mailing.refresh_from_db()
+        with SMTPSink().run_in_thread() as sink:
+            send_mailing(self.mailing, "batch", smtp_host=sink.host, smtp_port=sink.port, rcpt_batch=4)
+
+        self.assertEqual(sink.messages, 10)
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        """Настройка рассылки для отправки на SMTP-заглушку со сбоями."""
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpass"
+        )
+        self.mailing = Mailing.objects.create(
+            first_send_at=timezone.now(),
+            status=Mailing.CREATED,
+            owner=self.user,
+            message=Message.objects.create(title="Тема", message="Текст письма", owner=self.user),
+        )
+        for i in range(4):
+            self.mailing.recipients.add(
+                Recipient.objects.create(email=f"recipient{i}@example.com", full_name="Получатель")
+            )
+        prepare_deliveries(self.mailing)
+
+    def test_sink_injects_temporary_failures_and_drops(self):
+        """Проверка, что отказы 4xx и разрывы соединения заглушки дают временные ошибки."""
+        with SMTPSink(temp_failure_rate=0.5, drop_rate=0.5, seed=1).run_in_thread() as sink:
+            send_mailing(self.mailing, "batch", smtp_host=sink.host, smtp_port=sink.port)
+
+        self.assertEqual(sink.messages, 0)
+        self.assertEqual(sink.temp_failures + sink.drops, 4)
+        self.assertGreater(sink.drops, 0)
+        self.assertEqual(self.mailing.attempts.filter(status=MailingAttempt.RETRY).count(), 4)
+
+    def test_sink_latency_is_measured(self):
+        """Проверка, что заглушка задерживает ответы и замеряет длительность транзакций."""
+        with SMTPSink(latency=0.01).run_in_thread() as sink:
+            send_mailing(self.mailing, "batch", smtp_host=sink.host, smtp_port=sink.port)
+
+        self.assertEqual(len(sink.transaction_times), 4)
+        self.assertTrue(all(duration >= 0.03 for duration in sink.transaction_times))
+
+    def test_bench_command_reports_metrics_and_cleans_up(self):
+        """Проверка, что команда замера отправляет письма, выводит метрики и удаляет данные замера."""
+        out = StringIO()
+        call_command("bench_mailing", recipients=30, domains=3, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn("Отправлено писем: 30", output)
+        self.assertIn("писем в секунду", output)
+        self.assertIn("p99", output)
+        self.assertIn("Запросов записи в базу", output)
+        self.assertIn("Пиковый RSS", output)
+        self.assertEqual(Recipient.objects.filter(email__endswith=".bench.example").count(), 0)
+
+
+class DatasetGeneratorTests(TestCase):
+    def test_generate_data_command(self):
+        """Проверка, что команда генерации создает связанный набор данных заданного размера."""
+        out = StringIO()
+        call_command(
+            "generate_data",
+            users=5,
+            recipients=200,
+            mailings=6,
+            max_fanout=150,
+            attempts=500,
+            batch_size=64,
+            seed=1,
+            stdout=out,
+        )
+
+        self.assertEqual(User.objects.filter(email__endswith="@owners.load.test").count(), 5)
+        self.assertEqual(Recipient.objects.filter(email__contains=".load.test").count(), 200)
+        mailings = Mailing.objects.filter(owner__email__endswith="@owners.load.test")
+        self.assertEqual(mailings.count(), 6)
+        self.assertEqual(max(mailing.recipients.count() for mailing in mailings), 150)
+        attempts = MailingAttempt.objects.filter(mailing__in=mailings)
+        self.assertAlmostEqual(attempts.count(), 500, delta=10)
+        self.assertTrue(attempts.filter(status=MailingAttempt.SUCCESS).exists())
+        self.assertIn("Набор данных создан", out.getvalue())
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        """Настройка рассылки и SMTP-сервера, который можно сделать недоступным."""
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpass"
+        )
+        self.mailing = Mailing.objects.create(
+            first_send_at=timezone.now(),
+            status=Mailing.RUNNING,
+            owner=self.user,
+            message=Message.objects.create(title="Тема", message="Текст письма", owner=self.user),
+        )
+        for i in range(10):
+            self.mailing.recipients.add(
+                Recipient.objects.create(email=f"recipient{i}@example.com", full_name="Получатель")
+            )
+        prepare_deliveries(self.mailing)
+        self.server_down = True
+        original_send = locmem.EmailBackend.send_messages
+
+        def unstable_send(backend, messages):
+            if self.server_down:
+                raise ConnectionRefusedError("Connection refused")
+            return original_send(backend, messages)
+
+        self.unstable_send = unstable_send
+        self.breaker = CircuitBreaker("test", failure_threshold=3, error_rate=0.5, window=10, reset_timeout=60)
+
+    def test_breaker_trips_and_probes(self):
+        """Проверка размыкания после сбоев подряд и одной пробной отправки в полуоткрытом состоянии."""
+        for _ in range(3):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertGreater(self.breaker.retry_at, timezone.now() + timedelta(seconds=55))
+
+        later = time.monotonic() + 61
+        with mock.patch("mailing.circuit.time.monotonic", return_value=later):
+            self.assertEqual(self.breaker.state, HALF_OPEN)
+            self.assertTrue(self.breaker.allow())
+            self.assertFalse(self.breaker.allow())
+            self.breaker.record_failure()
+            self.assertEqual(self.breaker.state, OPEN)
+
+        with mock.patch("mailing.circuit.time.monotonic", return_value=later + 61):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record_success()
+            self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_breaker_trips_on_error_rate(self):
+        """Проверка размыкания по доле сбоев в окне без длинной серии сбоев подряд."""
+        for _ in range(5):
+            self.breaker.record_failure()
+            self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_open_breaker_pauses_mailing_until_probe(self):
+        """Проверка, что недоступный сервер приостанавливает рассылку без неудачных попыток."""
+        get_circuit = mock.patch("mailing.services.get_circuit_breaker", return_value=self.breaker)
+        with get_circuit, mock.patch.object(locmem.EmailBackend, "send_messages", self.unstable_send):
+            send_mailing(self.mailing, "batch")
+
+        self.assertEqual(self.mailing.attempts.filter(status=MailingAttempt.RETRY).count(), 3)
+        self.assertFalse(self.mailing.attempts.filter(status=MailingAttempt.FAILURE).exists())
+        paused = self.mailing.deliveries.filter(attempt_count=0)
+        self.assertEqual(paused.count(), 7)
+        self.assertTrue(all(delivery.next_attempt_at > timezone.now() for delivery in paused))
+        self.assertFalse(paused.filter(status=RecipientDelivery.FAILED).exists())
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.RUNNING)
+
+        self.server_down = False
+        self.mailing.deliveries.update(next_attempt_at=timezone.now())
+        with mock.patch("mailing.circuit.time.monotonic", return_value=time.monotonic() + 61):
+            with get_circuit, mock.patch.object(locmem.EmailBackend, "send_messages", self.unstable_send):
+                send_mailing(self.mailing, "batch")
+
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.mailing.deliveries.filter(status=RecipientDelivery.SENT).count(), 10)
+
+    def test_breakers_are_shared_per_server(self):
+        """Проверка, что выключатель общий для одного SMTP-сервера."""
+        self.assertIs(get_circuit_breaker("smtp.example.com", 25), get_circuit_breaker("smtp.example.com", 25))
+        self.assertIsNot(get_circuit_breaker("smtp.example.com", 25), get_circuit_breaker("smtp.example.com", 465))
+
+
+class TransactionalLaneTests(TestCase):
+    def register(self, email="new@example.com"):
+        return self.client.post(
+            reverse("users:register"),
+            {"email": email, "password1": "Sl0zhnyi-parol", "password2": "Sl0zhnyi-parol"},
+        )
+
+    def test_signup_email_is_written_to_outbox(self):
+        """Проверка, что письмо подтверждения записывается в очередь и отправляется после фиксации транзакции."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.register()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        user = CustomUser.objects.get(email="new@example.com")
+        outbox_email = OutboxEmail.objects.get()
+        self.assertEqual(outbox_email.recipients, ["new@example.com"])
+        self.assertEqual(outbox_email.dedup_key, f"email-confirm:{user.pk}:{user.token}")
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(user.token, mail.outbox[0].body)
+        outbox_email.refresh_from_db()
+        self.assertEqual(outbox_email.status, OutboxEmail.SENT)
+
+    def test_rolled_back_signup_sends_nothing(self):
+        """Проверка, что при откате транзакции регистрации письмо не отправляется."""
+        with mock.patch("users.views.redirect", side_effect=RuntimeError):
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(RuntimeError), transaction.atomic():
+                    self.register()
+        self.assertFalse(OutboxEmail.objects.exists())
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_broker_failure_does_not_break_signup(self):
+        """Проверка, что при недоступном брокере регистрация завершается, а письмо остается в очереди."""
+        with mock.patch("mailing.tasks.send_outbox.delay", side_effect=ConnectionError("Брокер недоступен")):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.register()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.PENDING)
+
+        call_command("relay_outbox", "--once", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_password_reset_email_is_deduplicated(self):
+        """Проверка, что повторная отправка формы сброса пароля с той же ссылкой не создает второго письма."""
+        User.objects.create_user(email="reset@example.com", password="testpass")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("users:password_reset"), {"email": "reset@example.com"})
+            self.client.post(reverse("users:password_reset"), {"email": "reset@example.com"})
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["reset@example.com"])
+        self.assertIn("/reset/", mail.outbox[0].body)
+
+    def test_transactional_lane_is_separate_from_bulk(self):
+        """Проверка, что служебные письма и рассылки попадают в разные очереди."""
+        def queue(task):
+            return celery_app.amqp.router.route({}, task.name)["queue"].name
+
+        self.assertEqual(queue(send_outbox), settings.MAILING_TRANSACTIONAL_QUEUE)
+        self.assertEqual(queue(start_mailing), settings.MAILING_BULK_QUEUE)
+        self.assertEqual(queue(retry_mailing), settings.MAILING_BULK_QUEUE)
+
+    def test_transactional_email_uses_own_connection(self):
+        """Проверка, что служебные письма отправляются через соединение служебного аккаунта."""
+        add_to_outbox("test:1", "Тема", "Текст", ["a@example.com"])
+        with self.settings(TRANSACTIONAL_EMAIL_HOST="smtp.transactional.example"):
+            with mock.patch("mailing.transactional.get_connection", wraps=get_connection) as connection:
+                self.assertEqual(relay_outbox(), 1)
+        self.assertEqual(connection.call_args.kwargs["host"], "smtp.transactional.example")
+
+
+class OutboxRelayTests(TestCase):
+    def setUp(self):
+        for i in range(4):
+            add_to_outbox(f"test:{i}", f"Тема {i}", "Текст", [f"user{i}@example.com"])
+
+    def test_relay_sends_in_order_with_stable_message_id(self):
+        """Проверка, что письма отправляются пачками в порядке записи с Message-ID из ключа дедупликации."""
+        self.assertEqual(relay_outbox(batch_size=3), 4)
+        self.assertEqual([email.subject for email in mail.outbox], [f"Тема {i}" for i in range(4)])
+        self.assertFalse(OutboxEmail.objects.exclude(status=OutboxEmail.SENT).exists())
+        first = OutboxEmail.objects.get(dedup_key="test:0")
+        message_id = build_outbox_message(first).extra_headers["Message-ID"]
+        self.assertEqual(mail.outbox[0].extra_headers["Message-ID"], message_id)
+        self.assertEqual(relay_outbox(), 0)
+
+    def test_relay_retries_temporary_errors_and_stops_on_outage(self):
+        """Проверка повторов после временной ошибки (после более поздних писем) и остановки без сервера."""
+        original_send = locmem.EmailBackend.send_messages
+
+        def send_messages(backend, messages):
+            subject = messages[0].subject
+            if subject == "Тема 0":
+                raise smtplib.SMTPRecipientsRefused({"user0@example.com": (550, b"No such user")})
+            if subject == "Тема 1":
+                raise smtplib.SMTPResponseException(451, b"Try again later")
+            if subject == "Тема 2":
+                raise ConnectionRefusedError("Connection refused")
+            return original_send(backend, messages)
+
+        with mock.patch.object(locmem.EmailBackend, "send_messages", send_messages):
+            self.assertEqual(relay_outbox(), 0)
+
+        statuses = dict(OutboxEmail.objects.values_list("dedup_key", "status"))
+        self.assertEqual(statuses["test:0"], OutboxEmail.FAILED)
+        self.assertEqual(statuses["test:1"], OutboxEmail.PENDING)
+        self.assertEqual(statuses["test:2"], OutboxEmail.PENDING)
+        self.assertEqual(statuses["test:3"], OutboxEmail.PENDING)
+        delayed = OutboxEmail.objects.get(dedup_key="test:1")
+        self.assertGreater(delayed.next_attempt_at, timezone.now())
+        self.assertEqual(delayed.attempt_count, 1)
+        untouched = OutboxEmail.objects.get(dedup_key="test:3")
+        self.assertEqual((untouched.attempt_count, untouched.leased_by), (0, None))
+
+        # Отложенные письма не задерживают более поздние
+        self.assertEqual(relay_outbox(), 1)
+        self.assertEqual([email.subject for email in mail.outbox], ["Тема 3"])
+        OutboxEmail.objects.update(next_attempt_at=None)
+        self.assertEqual(relay_outbox(), 2)
+        self.assertEqual([email.subject for email in mail.outbox], ["Тема 3", "Тема 1", "Тема 2"])
+
+    def test_relay_outbox_command(self):
+        """Проверка однократного запуска команды отправки служебных писем."""
+        out = StringIO()
+        call_command("relay_outbox", "--once", stdout=out)
+        self.assertIn("Отправлено служебных писем: 4", out.getvalue())
+
+
+class DashboardCountersTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="owner@example.com", password="testpass")
+        self.other = User.objects.create_user(email="other@example.com", password="testpass")
+        message = Message.objects.create(title="Тема", message="Текст", owner=self.user)
+        self.recipients = [
+            Recipient.objects.create(email=f"r{i}@example.com", full_name=f"R{i}", owner=self.user) for i in range(3)
+        ]
+        Recipient.objects.create(email="nobody@example.com", full_name="Без владельца")
+        self.mailing = Mailing.objects.create(status=Mailing.CREATED, owner=self.user, message=message)
+        self.mailing.recipients.set(self.recipients)
+        Mailing.objects.create(status=Mailing.COMPLETED, owner=self.other, message=message)
+        cache.clear()
+
+    def assertCountersMatchData(self):
+        """Сравнивает счетчики с пересчетом по данным."""
+        fields = [field.name for field in DashboardCounters._meta.fields if field.name not in ("id", "owner")]
+        actual = {
+            owner: [getattr(get_dashboard_counters(owner), field) for field in fields]
+            for owner in (None, self.user.pk, self.other.pk)
+        }
+        rebuild_counters()
+        expected = {
+            owner: [getattr(get_dashboard_counters(owner), field) for field in fields]
+            for owner in (None, self.user.pk, self.other.pk)
+        }
+        self.assertEqual(actual, expected)
+
+    def test_counters_follow_changes(self):
+        """Проверка, что счетчики обновляются при создании, смене статуса и удалении объектов."""
+        counters = get_dashboard_counters(self.user.pk)
+        self.assertEqual((counters.recipients, counters.mailing_created), (3, 1))
+        self.assertEqual(get_dashboard_counters().recipients, 4)
+
+        run_mailing(self, self.mailing)
+        counters = get_dashboard_counters(self.user.pk)
+        self.assertEqual((counters.attempt_success, counters.mailing_completed, counters.mailing_count), (3, 1, 1))
+        self.assertCountersMatchData()
+
+        self.recipients[0].owner = self.other
+        self.recipients[0].save()
+        self.recipients[1].delete()
+        self.mailing.status = Mailing.RUNNING
+        self.mailing.save()
+        self.assertCountersMatchData()
+
+        self.mailing.delete()
+        counters = get_dashboard_counters(self.user.pk)
+        self.assertEqual((counters.attempt_count, counters.mailing_count, counters.recipients), (0, 0, 1))
+        self.assertCountersMatchData()
+
+    def test_deleted_attempts_are_subtracted(self):
+        """Проверка, что delete_attempts и админка уменьшают счетчики, а попытки удаляются без загрузки объектов."""
+        run_mailing(self, self.mailing)
+        attempt_admin = MailingAttemptAdmin(MailingAttempt, admin.site)
+        attempt_admin.delete_model(None, self.mailing.attempts.first())
+        self.assertEqual(get_dashboard_counters(self.user.pk).attempt_success, 2)
+        self.assertCountersMatchData()
+
+        attempt_admin.delete_queryset(None, self.mailing.attempts.all())
+        self.assertEqual(get_dashboard_counters().attempt_count, 0)
+        self.assertCountersMatchData()
+
+        run_mailing(self, self.mailing)
+        self.assertEqual(delete_attempts(MailingAttempt.objects.filter(mailing=self.mailing)), 3)
+        self.assertCountersMatchData()
+
+        self.assertTrue(Collector(using="default", origin=self.mailing).can_fast_delete(self.mailing.attempts.all()))
+        run_mailing(self, self.mailing)
+        self.mailing.delete()
+        self.assertEqual(get_dashboard_counters().attempt_count, 0)
+        self.assertCountersMatchData()
+
+    def test_index_data_reads_counters_row(self):
+        """Проверка, что данные главной страницы читаются из строки счетчиков без подсчета строк."""
+        run_mailing(self, self.mailing)
+        with CaptureQueriesContext(connection) as queries:
+            data = get_index_page_cache_data(self.user)
+        self.assertFalse([query for query in queries.captured_queries if "COUNT(" in query["sql"]])
+        self.assertEqual(data["attempt_count"], 3)
+        self.assertEqual(data["mailing_count"], 1)
+        self.assertEqual(data["recipient_count"], 3)
+
+        manager = User.objects.create_user(email="manager@example.com", password="testpass")
+        manager.groups.add(Group.objects.get_or_create(name="Менеджер")[0])
+        refresh_global_dashboard()
+        data = get_index_page_cache_data(manager)
+        self.assertEqual((data["mailing_count"], data["recipient_count"]), (2, 4))
+
+    def test_index_data_is_invalidated_by_changes(self):
+        """Проверка, что кэш главной страницы сбрасывается изменением данных владельца, а не по времени."""
+        self.assertEqual(get_index_page_cache_data(self.user)["recipient_count"], 3)
+        get_index_page_cache_data(self.other)
+        with self.assertNumQueries(1):
+            get_index_page_cache_data(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipient.objects.create(email="new@example.com", full_name="Новый", owner=self.user)
+        self.assertEqual(get_index_page_cache_data(self.user)["recipient_count"], 4)
+        # Данные других владельцев остаются в кэше
+        with self.assertNumQueries(1):
+            self.assertEqual(get_index_page_cache_data(self.other)["mailing_count"], 1)
+
+    def test_managers_share_global_data_refreshed_in_background(self):
+        """Проверка, что менеджеры читают общие данные из кэша, а вычисляют их фоновая задача или один промах."""
+        managers = [User.objects.create_user(email=f"manager{i}@example.com", password="testpass") for i in range(3)]
+        for manager in managers:
+            manager.groups.add(Group.objects.get_or_create(name="Менеджер")[0])
+        # Данных в кэше нет: их вычисляет первый запрос, а не возвращаются нули
+        data = get_index_page_cache_data(managers[0])
+        self.assertEqual(data["recipient_count"], 4)
+        self.assertIsNotNone(data["refreshed_at"])
+        timeout = settings.MAILING_DASHBOARD_GLOBAL_REFRESH_INTERVAL * 3
+        self.assertTrue(0 < cache.ttl(GLOBAL_INDEX_PAGE_KEY) <= timeout)
+
+        run_mailing(self, self.mailing)
+        refresh_global_dashboard()
+        Recipient.objects.create(email="new@example.com", full_name="Новый", owner=self.user)
+        for manager in managers:
+            # Запрос проверяет только группу пользователя
+            with self.assertNumQueries(1):
+                data = get_index_page_cache_data(manager)
+            self.assertEqual((data["attempt_count"], data["recipient_count"]), (3, 4))
+            self.assertEqual(len(data["recent_attempts"]), 3)
+
+        refresh_global_dashboard()
+        self.assertEqual(get_index_page_cache_data(managers[0])["recipient_count"], 5)
+        self.assertTrue(0 < cache.ttl(GLOBAL_INDEX_PAGE_KEY) <= timeout)
+        self.assertEqual(
+            settings.CELERY_BEAT_SCHEDULE["refresh-global-dashboard"]["task"], refresh_global_dashboard.name
+        )
+
+        self.client.login(email="manager0@example.com", password="testpass")
+        self.assertContains(self.client.get(reverse("mailing:index")), "Статистика всех пользователей обновлена")
+
+    def test_concurrent_misses_compute_once(self):
+        """Проверка, что одновременные промахи по одному ключу вычисляют значение один раз."""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return "value"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(get_or_compute("single_flight_test", compute, 60)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["value"] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_index_data_keeps_only_recent_attempts(self):
+        """Проверка, что в кэше главной страницы хранятся числа и последние попытки, а не QuerySet."""
+        MailingAttempt.objects.bulk_create(
+            MailingAttempt(
+                attempted_at=timezone.now(),
+                status=MailingAttempt.FAILURE,
+                mail_server_response="x" * 1000,
+                mailing=self.mailing,
+            )
+            for _ in range(30)
+        )
+        with self.settings(MAILING_DASHBOARD_RECENT_ATTEMPTS=5):
+            data = get_index_page_cache_data(self.user)
+        self.assertNotIn("object_list", data)
+        recent = data["recent_attempts"]
+        latest_ids = list(MailingAttempt.objects.order_by("-id").values_list("id", flat=True)[:5])
+        self.assertEqual([attempt.id for attempt in recent], latest_ids)
+        self.assertTrue(all(type(value) in (int, list) for value in data.values()))
+        self.assertEqual((recent[0].subject, len(recent[0].mail_server_response)), ("Тема", 200))
+
+        self.client.login(email="owner@example.com", password="testpass")
+        response = self.client.get(reverse("mailing:index"))
+        self.assertContains(response, f"Рассылка №{self.mailing.pk}: Тема", count=5)
+
+
+class AttemptRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="owner@example.com", password="testpass")
+        self.other = User.objects.create_user(email="other@example.com", password="testpass")
+        self.mailing = Mailing.objects.create(status=Mailing.RUNNING, owner=self.user)
+        self.other_mailing = Mailing.objects.create(status=Mailing.RUNNING, owner=self.other)
+        self.day = timezone.localtime().replace(hour=10, minute=0, second=0, microsecond=0) - timedelta(days=1)
+        self.now = timezone.now()
+
+    def add_attempts(self, mailing, statuses, hour=0):
+        MailingAttempt.objects.bulk_create(
+            MailingAttempt(attempted_at=self.day + timedelta(hours=hour, minutes=i), status=status, mailing=mailing)
+            for i, status in enumerate(statuses)
+        )
+
+    def update(self, chunk_size=None):
+        """Обновляет сводки через 61 секунду после прошлого обновления."""
+        self.now += timedelta(seconds=61)
+        return update_rollups(chunk_size=chunk_size, now=self.now)
+
+    def settle(self, chunk_size=None):
+        """Выполняет замер и учет попыток после задержки."""
+        self.update(chunk_size)
+        return self.update(chunk_size)
+
+    def test_rollups_are_updated_incrementally(self):
+        """Проверка, что сводки учитывают только новые попытки и только после задержки."""
+        self.add_attempts(self.mailing, [MailingAttempt.SUCCESS] * 3 + [MailingAttempt.FAILURE])
+        self.add_attempts(self.other_mailing, [MailingAttempt.RETRY], hour=2)
+        self.assertEqual(update_rollups(now=self.now), 0)
+        self.assertEqual(update_rollups(now=self.now + timedelta(seconds=30)), 0)
+        self.assertEqual(self.update(), 5)
+        self.assertEqual(self.settle(), 0)
+
+        self.add_attempts(self.mailing, [MailingAttempt.SUCCESS, MailingAttempt.RETRY], hour=1)
+        self.assertEqual(self.settle(chunk_size=1), 2)
+
+        day = AttemptRollup.objects.get(period=AttemptRollup.DAY, mailing=self.mailing)
+        self.assertEqual((day.success, day.failure, day.retry, day.owner_id), (4, 1, 1, self.user.pk))
+        hours = AttemptRollup.objects.filter(period=AttemptRollup.HOUR, mailing=self.mailing)
+        self.assertEqual(
+            [(rollup.bucket, rollup.success) for rollup in hours],
+            [(self.day, 3), (self.day + timedelta(hours=1), 1)],
+        )
+
+    def test_stats_endpoint(self):
+        """Проверка, что статистика читается из сводок с учетом прав пользователя."""
+        self.add_attempts(self.mailing, [MailingAttempt.SUCCESS, MailingAttempt.FAILURE])
+        self.add_attempts(self.other_mailing, [MailingAttempt.SUCCESS])
+        self.settle()
+        self.client.login(email="owner@example.com", password="testpass")
+
+        response = self.client.get(reverse("mailing:attempt_stats"), {"period": "hour", "days": 7})
+        self.assertEqual(
+            response.json(),
+            {"period": "hour", "buckets": [{"bucket": self.day.isoformat(), "success": 1, "failure": 1, "retry": 0}]},
+        )
+        response = self.client.get(reverse("mailing:attempt_stats"), {"mailing": self.other_mailing.pk})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get(reverse("mailing:attempt_stats"), {"period": "week"}).status_code, 400)
+
+        self.user.groups.add(Group.objects.get_or_create(name="Менеджер")[0])
+        response = self.client.get(reverse("mailing:attempt_stats"))
+        self.assertEqual([row["success"] for row in response.json()["buckets"]], [2])
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.mail import get_connection
+
+
+def get_transactional_connection():
+    """
+    Возвращает соединение с SMTP-сервером служебных писем.
+
+    Служебные письма (подтверждение почты, сброс пароля) отправляются через собственный
+    аккаунт TRANSACTIONAL_EMAIL_*, а не через соединения массовых рассылок, и с коротким
+    таймаутом, чтобы недоступный сервер не держал воркер служебной очереди.
+
+    Возвращает:
+    BaseEmailBackend: Соединение почтового бэкенда.
+    """
+    return get_connection(
+        host=settings.TRANSACTIONAL_EMAIL_HOST,
+        port=settings.TRANSACTIONAL_EMAIL_PORT,
+        username=settings.TRANSACTIONAL_EMAIL_HOST_USER,
+        password=settings.TRANSACTIONAL_EMAIL_HOST_PASSWORD,
+        use_tls=settings.TRANSACTIONAL_EMAIL_USE_TLS,
+        use_ssl=settings.TRANSACTIONAL_EMAIL_USE_SSL,
+        timeout=settings.TRANSACTIONAL_EMAIL_TIMEOUT,
+    )
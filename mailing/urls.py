@@ -58,6 +58,17 @@ urlpatterns = [
     ),
     path("mailing/<int:pk>", views.MailingDetailView.as_view(), name="mailing_detail"),
     path("mailing/<int:pk>/stop", views.MailingStopView.as_view(), name="mailing_stop"),
+    path(
+        "mailing/<int:pk>/progress",
+        views.MailingProgressView.as_view(),
+        name="mailing_progress",
+    ),
+    path(
+        "unsubscribe/<str:token>",
+        views.UnsubscribeView.as_view(),
+        name="unsubscribe",
+    ),
+    path("stats/attempts", views.AttemptStatsView.as_view(), name="attempt_stats"),
     path(
         "mailingattempt_list",
         cache_page(5)(views.MailingAttemptListView.as_view()),
@@ -1,15 +1,23 @@
+from datetime import timedelta
+
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.signing import BadSignature
+from django.db import transaction
 from django.urls import reverse_lazy
-from django.http import HttpResponseForbidden, HttpResponse
-from django.core.mail import send_mail
-from datetime import datetime
+from django.http import HttpResponseForbidden, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.decorators import method_decorator
 from django.utils import timezone
-from django.shortcuts import get_object_or_404, redirect
+from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import DetailView, ListView, TemplateView, View
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from mailing.forms import MessageForm, RecipientForm, MailingForm
-from mailing.models import Mailing, MailingAttempt, Message, Recipient
+from mailing.models import AttemptRollup, Mailing, MailingAttempt, Message, Recipient, RecipientDelivery
+from mailing.progress import get_mailing_progress
+from mailing.rendering import read_unsubscribe_token
+from mailing.rollups import get_attempt_stats
 from mailing.services import get_index_page_cache_data
+from mailing.tasks import enqueue_mailing
 
 
 class IndexView(LoginRequiredMixin, TemplateView):
@@ -376,45 +384,96 @@ class MailingDetailView(LoginRequiredMixin, DetailView):
             return super().dispatch(request, *args, **kwargs)
         return HttpResponseForbidden("Вы не можете просматривать эту рассылку.")
 
+    def get_context_data(self, **kwargs):
+        """
+        Получает контекст для шаблона деталей рассылки.
+
+        Параметры:
+        **kwargs: Дополнительные параметры, переданные в метод.
+
+        Возвращает:
+        dict: Обновленный контекст, содержащий ход отправки рассылки.
+        """
+        context = super().get_context_data(**kwargs)
+        context["progress"] = get_mailing_progress(self.object.pk)
+        return context
+
     def post(self, request, *args, **kwargs):
         """
         Обрабатывает запрос на отправку сообщений рассылки.
 
+        Отправка ставится в очередь Celery, ответ возвращается сразу.
+        Если рассылка уже отправляется, повторная отправка не запускается.
+
         Параметры:
         request (HttpRequest): Запрос от клиента.
         *args: Дополнительные аргументы.
         **kwargs: Дополнительные параметры, переданные в метод.
 
         Возвращает:
-        HttpResponse: Ответ с перенаправлением на страницу списка рассылок.
+        HttpResponse: Ответ с перенаправлением на страницу деталей рассылки.
         """
         self.object = self.get_object()
-        subject = self.object.message
-        message = self.object.message.message
-        # self.object.status = "running"
-        # self.object.save()
-        from_email = "drovosekov1910@mail.ru"
-        recipient_list = [recipient.email for recipient in self.object.recipients.all()]
-
-        for recipient in recipient_list:
-            try:
-                send_mail(subject, message, from_email, [recipient])
-                response = f"{recipient}: Успешно отправлено"
-                MailingAttempt.objects.create(
-                    attempted_at=timezone.now(),
-                    status="success",
-                    mail_server_response=response,
-                    mailing=self.object,
-                )
-            except Exception as e:
-                response = f"{recipient}: Ошибка: {e}"
-                MailingAttempt.objects.create(
-                    attempted_at=datetime.now(),
-                    status="failure",
-                    mail_server_response=response,
-                    mailing=self.object,
-                )
-        return redirect("mailing:mailing_list")
+        enqueue_mailing(self.object)
+        return redirect("mailing:mailing_detail", pk=self.object.pk)
+
+
+class MailingProgressView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        """
+        Возвращает ход отправки рассылки в формате JSON.
+
+        Параметры:
+        request (HttpRequest): Запрос от клиента.
+        pk (int): Идентификатор рассылки.
+
+        Возвращает:
+        JsonResponse: Статус рассылки и счетчики отправленных писем или сообщение об ошибке.
+        """
+        mailing = get_object_or_404(Mailing, pk=pk)
+        if mailing.owner != request.user:
+            return HttpResponseForbidden("Вы не можете просматривать эту рассылку.")
+        return JsonResponse({"status": mailing.status, **get_mailing_progress(pk)})
+
+
+class AttemptStatsView(LoginRequiredMixin, View):
+    # Максимальная глубина статистики, в сутках
+    MAX_DAYS = 366
+
+    def get(self, request):
+        """
+        Возвращает количество попыток рассылки по часам или суткам в формате JSON для графиков.
+
+        Данные читаются из сводок попыток (см. mailing.rollups), а не из таблицы попыток.
+        Менеджер получает статистику всех рассылок, остальные пользователи - своих.
+
+        Параметры:
+        request (HttpRequest): Запрос от клиента. Параметры запроса: period ("day" или "hour"),
+            days (глубина статистики в сутках, по умолчанию 30), mailing (идентификатор рассылки).
+
+        Возвращает:
+        JsonResponse: Период и список периодов с количеством попыток по статусам или сообщение об ошибке.
+        """
+        period = request.GET.get("period", AttemptRollup.DAY)
+        if period not in (AttemptRollup.DAY, AttemptRollup.HOUR):
+            return JsonResponse({"error": "Недопустимый период"}, status=400)
+        try:
+            days = min(max(int(request.GET.get("days", 30)), 1), self.MAX_DAYS)
+            mailing_id = int(request.GET["mailing"]) if request.GET.get("mailing") else None
+        except ValueError:
+            return JsonResponse({"error": "Недопустимые параметры"}, status=400)
+        owner_id = None if request.user.groups.filter(name="Менеджер").exists() else request.user.id
+        if mailing_id is not None and owner_id is not None:
+            mailing = get_object_or_404(Mailing, pk=mailing_id)
+            if mailing.owner_id != owner_id:
+                return HttpResponseForbidden("Вы не можете просматривать эту рассылку.")
+        stats = get_attempt_stats(period, timezone.now() - timedelta(days=days), owner_id, mailing_id)
+        return JsonResponse(
+            {
+                "period": period,
+                "buckets": [{**row, "bucket": timezone.localtime(row["bucket"]).isoformat()} for row in stats],
+            }
+        )
 
 
 class MailingAttemptListView(LoginRequiredMixin, ListView):
@@ -475,3 +534,62 @@ class MailingStopView(LoginRequiredMixin, View):
                 )
 
         return HttpResponseForbidden("У вас нет прав для отключения рассылки")
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class UnsubscribeView(View):
+    """
+    Отписка получателя от рассылки по токену из письма.
+
+    GET только показывает подтверждение: ссылки из писем открывают сканеры и предзагрузка
+    почтовых клиентов. Отписка выполняется POST-запросом, в том числе одним нажатием
+    из почтового клиента (RFC 8058), поэтому запрос защищен подписью токена, а не CSRF.
+    Отписка действует только на рассылку из токена: рассылки других пользователей
+    сервиса продолжают приходить на этот адрес.
+    """
+
+    template_name = "mailing/unsubscribe.html"
+
+    def get(self, request, token):
+        """
+        Показывает подтверждение отписки.
+
+        Параметры:
+        request (HttpRequest): Запрос от клиента.
+        token (str): Токен отписки ({{ unsubscribe_token }} в тексте письма).
+
+        Возвращает:
+        HttpResponse: Страница подтверждения или ошибка 404 при неверном токене.
+        """
+        return self._respond(request, token, unsubscribe=False)
+
+    def post(self, request, token):
+        """
+        Отписывает получателя от рассылки.
+
+        Параметры:
+        request (HttpRequest): Запрос от клиента.
+        token (str): Токен отписки ({{ unsubscribe_token }} в тексте письма).
+
+        Возвращает:
+        HttpResponse: Сообщение об отписке или ошибка 404 при неверном токене.
+        """
+        return self._respond(request, token, unsubscribe=True)
+
+    def _respond(self, request, token, unsubscribe):
+        try:
+            mailing_id, recipient_id = read_unsubscribe_token(token)
+        except (BadSignature, ValueError):
+            return HttpResponse("Неверная ссылка для отписки", status=404)
+
+        mailing = get_object_or_404(Mailing, pk=mailing_id)
+        recipient = get_object_or_404(Recipient, pk=recipient_id)
+        if unsubscribe:
+            with transaction.atomic():
+                mailing.recipients.remove(recipient)
+                RecipientDelivery.objects.filter(
+                    mailing=mailing, recipient=recipient, status=RecipientDelivery.PENDING
+                ).delete()
+        return render(
+            request, self.template_name, {"email": recipient.email, "unsubscribed": unsubscribe}
+        )
@@ -0,0 +1,26 @@
+// Обновляем ход отправки рассылки, пока она запущена
+const progressElement = document.getElementById('mailing-progress');
+
+function renderProgress(data) {
+    document.getElementById('mailing-status').textContent = data.status;
+    document.getElementById('mailing-progress-done').textContent = data.done;
+    document.getElementById('mailing-progress-total').textContent = data.total;
+    document.getElementById('mailing-progress-failure').textContent = data.failure;
+    const percent = data.total ? Math.round(data.done * 100 / data.total) : 0;
+    document.getElementById('mailing-progress-bar').style.width = percent + '%';
+}
+
+function pollProgress() {
+    fetch(progressElement.dataset.url)
+        .then(response => response.json())
+        .then(data => {
+            renderProgress(data);
+            if (data.status === 'running') {
+                setTimeout(pollProgress, 3000);
+            }
+        });
+}
+
+if (progressElement.dataset.status === 'running') {
+    setTimeout(pollProgress, 3000);
+}
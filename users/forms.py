@@ -1,4 +1,6 @@
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm
+from django.template import loader
+from mailing.tasks import enqueue_transactional_email
 from .models import CustomUser
 from django import forms
 
@@ -39,3 +41,45 @@ class CustomUserEditForm(forms.ModelForm):
         self.fields["email"].label = "Электронная почта"
         self.fields["first_name"].label = "Имя"
         self.fields["last_name"].label = "Фамилия"
+
+
+class TransactionalPasswordResetForm(PasswordResetForm):
+    """Форма сброса пароля, отправляющая письмо через исходящую очередь служебных писем"""
+
+    def send_mail(
+        self,
+        subject_template_name,
+        email_template_name,
+        context,
+        from_email,
+        to_email,
+        html_email_template_name=None,
+    ):
+        """
+        Записывает письмо со ссылкой для сброса пароля в исходящую очередь.
+
+        Письмо формируется в запросе (контекст содержит объект пользователя),
+        а отправляет его воркер служебной очереди. Повторная отправка формы с той же
+        ссылкой не создает второго письма.
+
+        Параметры:
+        subject_template_name (str): Шаблон темы письма.
+        email_template_name (str): Шаблон текста письма.
+        context (dict): Контекст шаблонов.
+        from_email (str | None): Адрес отправителя.
+        to_email (str): Адрес получателя.
+        html_email_template_name (str, optional): Шаблон HTML-версии письма.
+        """
+        subject = "".join(loader.render_to_string(subject_template_name, context).splitlines())
+        body = loader.render_to_string(email_template_name, context)
+        html_message = None
+        if html_email_template_name is not None:
+            html_message = loader.render_to_string(html_email_template_name, context)
+        enqueue_transactional_email(
+            f"password-reset:{context['uid']}:{context['token']}",
+            subject,
+            body,
+            [to_email],
+            from_email,
+            html_message,
+        )
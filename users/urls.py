@@ -1,6 +1,7 @@
 from django.contrib.auth import views as auth_views
 from django.urls import path, reverse_lazy
 from . import views
+from .forms import TransactionalPasswordResetForm
 
 app_name = "users"
 
@@ -19,6 +20,7 @@ urlpatterns = [
         "password_reset/",
         auth_views.PasswordResetView.as_view(
             template_name="password_reset/password_reset_form.html",
+            form_class=TransactionalPasswordResetForm,
             email_template_name="password_reset/password_reset_email.html",
             success_url=reverse_lazy("users:password_reset_done"),
         ),
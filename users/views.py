@@ -2,13 +2,13 @@ import secrets
 
 from django.contrib.auth.decorators import permission_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.mail import send_mail
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse, reverse_lazy
 from django.utils.decorators import method_decorator
 from django.views.generic import ListView, View, DetailView
 from django.views.generic.edit import CreateView, UpdateView
-from config.settings import DEFAULT_FROM_EMAIL
+from mailing.tasks import enqueue_transactional_email
 from .forms import CustomUserCreationForm, CustomUserEditForm
 from .models import CustomUser
 from django.http import HttpResponseForbidden
@@ -60,20 +60,24 @@ class RegisterView(CreateView):
         Возвращает:
         HttpResponse: Ответ с перенаправлением на страницу успеха.
         """
-        user = form.save()
-        user.is_active = False
-        token = secrets.token_hex(16)
-        user.token = token
-        user.save()
-        host = self.request.get_host()
-        url = f"http://{host}/user/email-confirm/{token}/"
-        send_mail(
-            subject="Подтверждение почты",
-            message=f"Приветствуем вас на нашем сайте! Перейдите по ссылке для подтверждения эл. почты {url}",
-            from_email=DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-        )
-        return super().form_valid(form)
+        # Пользователь и письмо подтверждения записываются в одной транзакции,
+        # письмо отправляет воркер служебной очереди после ее фиксации
+        with transaction.atomic():
+            user = form.save(commit=False)
+            user.is_active = False
+            token = secrets.token_hex(16)
+            user.token = token
+            user.save()
+            host = self.request.get_host()
+            url = f"http://{host}/user/email-confirm/{token}/"
+            enqueue_transactional_email(
+                dedup_key=f"email-confirm:{user.pk}:{token}",
+                subject="Подтверждение почты",
+                message=f"Приветствуем вас на нашем сайте! Перейдите по ссылке для подтверждения эл. почты {url}",
+                recipient_list=[user.email],
+            )
+        self.object = user
+        return redirect(self.get_success_url())
 
 
 @method_decorator(permission_required("users.can_block_user"), name="dispatch")